@@ -0,0 +1,103 @@
+"""
+Бенчмарк пакетного назначения на "всплеске" заказов (выход с концерта, волна в аэропорту).
+
+Сравнивает:
+- жадный режим: заказы подбираются по одному в порядке поступления;
+- пакетный режим: заказы окна назначаются вместе (min-cost matching по манхэттенскому расстоянию).
+
+Выводит среднюю дистанцию подачи, число назначенных заказов и время решения пакета.
+
+Запуск из корня проекта:
+    python -m scripts.bench_batch_assignment --drivers 200 --orders 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from scripts.bench_utils import add_redis_argument, make_redis_client, quiet_logging
+from src.core.config import settings
+from src.services.matching_service import DriverMatchingService
+
+
+async def setup_burst(redis_client, num_drivers: int, num_orders: int, spread: int, seed: int) -> dict[int, tuple[int, int]]:
+    """Размещает водителей вокруг точки всплеска и публикует заказы рядом с ней."""
+    await redis_client.flushdb()
+    rng = random.Random(seed)
+    cx, cy = settings.CITY_GRID_N // 2, settings.CITY_GRID_M // 2
+
+    def around(radius: int) -> tuple[int, int]:
+        x = min(max(cx + rng.randint(-radius, radius), 0), settings.CITY_GRID_N - 1)
+        y = min(max(cy + rng.randint(-radius, radius), 0), settings.CITY_GRID_M - 1)
+        return x, y
+
+    locations = {}
+    pipe = redis_client.pipeline()
+    for driver_id in range(1, num_drivers + 1):
+        x, y = around(spread * 3)
+        locations[driver_id] = (x, y)
+        pipe.hset(f"cell:{x}:{y}", str(driver_id), "online")
+    for i in range(num_orders):
+        x, y = around(spread)
+        payload = {"ride_id": str(i), "start_x": x, "start_y": y, "end_x": 0, "end_y": 0, "price": 100}
+        pipe.xadd(DriverMatchingService.STREAM_KEY, {"event": "OrderCreated", "data": json.dumps(payload)})
+    await pipe.execute()
+    return locations
+
+
+async def run_mode(redis_url, batch: bool, args) -> None:
+    redis_client = make_redis_client(redis_url)
+    locations = await setup_burst(redis_client, args.drivers, args.orders, args.spread, args.seed)
+
+    service = DriverMatchingService(redis=redis_client, stream_keys=[DriverMatchingService.STREAM_KEY])
+    service.batch_max_orders = args.orders
+    await service._ensure_consumer_group()
+    messages = await service._read_orders(args.orders, 100)
+
+    started = time.perf_counter()
+    solve_ms = 0.0
+    if batch:
+        stats = await service._process_order_batch(messages)
+        solve_ms = stats["solve_ms"]
+    else:
+        for stream_key, message_id, raw_data in messages:
+            order = await service._parse_order_message(stream_key, message_id, raw_data)
+            await service._find_and_lock_nearest_driver(order["start_x"], order["start_y"], order["ride_id"])
+    elapsed = time.perf_counter() - started
+
+    # Фактическая дистанция подачи по поставленным блокировкам
+    distances = []
+    for _, _, raw_data in messages:
+        order = json.loads(raw_data["data"])
+        for driver_id, (x, y) in locations.items():
+            if await redis_client.get(f"driver_lock:{driver_id}") == order["ride_id"]:
+                distances.append(abs(x - order["start_x"]) + abs(y - order["start_y"]))
+                break
+
+    avg = sum(distances) / len(distances) if distances else 0.0
+    label = "пакетный" if batch else "жадный"
+    print(
+        f"{label:>9}: назначено {len(distances)}/{args.orders}, "
+        f"средняя подача = {avg:.2f}, время обработки = {elapsed * 1000:.1f} мс"
+        + (f", решение пакета = {solve_ms:.2f} мс" if batch else "")
+    )
+    await redis_client.aclose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=50)
+    parser.add_argument("--spread", type=int, default=5, help="Радиус всплеска заказов в клетках")
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    for batch in (False, True):
+        await run_mode(args.redis_url, batch, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
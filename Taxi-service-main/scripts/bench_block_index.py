@@ -0,0 +1,86 @@
+"""
+Бенчмарк поиска ближайшего водителя на большой сетке: обход L1-ромбов по ячейкам
+(с битовыми картами и без) против иерархического индекса блоков.
+
+Для каждого режима выводит число round trip'ов и команд Redis, время на один поиск и
+долю поисков, где водитель найден. Для индекса блоков — также число полей в хэшах
+cell_blocks:* (память растет с числом водителей, а не с площадью сетки).
+
+Запуск из корня проекта:
+    python -m scripts.bench_block_index --grid 5000 --drivers 2000 --radius 100 --queries 100
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from scripts.bench_utils import RedisCommandCounter, add_redis_argument, make_redis_client, quiet_logging
+from src.services.block_index import BlockCountIndex
+from src.services.driver_locator import CellHashLocator
+
+MODES = ("diamond", "diamond+bitmap", "blocks")
+
+
+def make_locator(redis_client, mode: str, args) -> CellHashLocator:
+    block_index = None
+    if mode == "blocks":
+        block_index = BlockCountIndex(redis_client, args.grid, args.grid, args.block_size, args.levels)
+    return CellHashLocator(
+        redis_client, args.grid, args.grid, use_bitmap=mode == "diamond+bitmap", block_index=block_index
+    )
+
+
+async def run_mode(redis_url, mode: str, args) -> None:
+    redis_client = make_redis_client(redis_url)
+    await redis_client.flushdb()
+    locator = make_locator(redis_client, mode, args)
+
+    rng = random.Random(args.seed)
+    pipe = redis_client.pipeline(transaction=False)
+    for driver_id in range(1, args.drivers + 1):
+        await locator.upsert(pipe, driver_id, rng.randrange(args.grid), rng.randrange(args.grid), None)
+    await pipe.execute()
+
+    counter = RedisCommandCounter(redis_client)
+    found = 0
+    started = time.perf_counter()
+    for _ in range(args.queries):
+        if await locator.nearest(rng.randrange(args.grid), rng.randrange(args.grid), 1, args.radius):
+            found += 1
+    elapsed = time.perf_counter() - started
+
+    line = (
+        f"{mode:>14}: найдено {found}/{args.queries}, "
+        f"round trips/поиск = {counter.round_trips / args.queries:.1f}, "
+        f"команд/поиск = {counter.commands / args.queries:.1f}, "
+        f"время/поиск = {elapsed / args.queries * 1000:.2f} мс"
+    )
+    if locator.block_index is not None:
+        fields = 0
+        for level in range(len(locator.block_index.sizes)):
+            fields += await redis_client.hlen(locator.block_index.block_key(level))
+        line += f", полей в cell_blocks:* = {fields}"
+    print(line)
+    await redis_client.aclose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grid", type=int, default=5000, help="Сторона сетки (клеток)")
+    parser.add_argument("--drivers", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--radius", type=int, default=100, help="Максимальный манхэттенский радиус поиска")
+    parser.add_argument("--block-size", type=int, default=8)
+    parser.add_argument("--levels", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    print(f"Сетка {args.grid}x{args.grid}, водителей: {args.drivers}, радиус: {args.radius}")
+    for mode in MODES:
+        await run_mode(args.redis_url, mode, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Бенчмарк маршрутизации событий: пропускная способность подбора, когда событий
+жизненного цикла (DriverAssigned, RideCompleted) намного больше, чем заказов.
+
+Режимы:
+- shared: все события в стриме заказов (как до EVENT_ROUTES) — подбор читает
+  и подтверждает каждое событие жизненного цикла;
+- routed: события жизненного цикла в `ride_lifecycle_events` по route_event.
+
+Подбор вычитывает стрим заказов поштучным циклом (_read_orders + _process_order_message).
+
+Запуск из корня проекта:
+    python -m scripts.bench_event_routing --orders 500 --lifecycle-per-order 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from scripts.bench_matching import setup_drivers
+from scripts.bench_utils import RedisCommandCounter, add_redis_argument, make_redis_client, quiet_logging
+from src.core.config import settings
+from src.services.matching_service import DriverMatchingService
+from src.services.event_schema import encode_event
+from src.services.redis_publisher import STREAM_ORDERS, route_event
+
+
+def make_events(num_orders: int, lifecycle_per_order: int, seed: int) -> list[tuple[str, dict]]:
+    """Заказы вперемешку с событиями жизненного цикла поездок."""
+    rng = random.Random(seed)
+    events = []
+    for ride_id in range(num_orders):
+        events.append(("OrderCreated", {
+            "ride_id": str(ride_id),
+            "start_x": rng.randint(0, settings.CITY_GRID_N - 1),
+            "start_y": rng.randint(0, settings.CITY_GRID_M - 1),
+            "end_x": 0, "end_y": 0, "price": 100.0,
+        }))
+        for i in range(lifecycle_per_order):
+            event_name = "DriverAssigned" if i % 2 == 0 else "RideCompleted"
+            events.append((event_name, {"ride_id": str(rng.randrange(num_orders)), "driver_user_id": "7"}))
+    return events
+
+
+async def run_mode(redis_url, mode: str, events: list, num_drivers: int, seed: int) -> None:
+    redis_client = make_redis_client(redis_url)
+    await setup_drivers(redis_client, num_drivers, seed)
+
+    pipe = redis_client.pipeline(transaction=False)
+    for event_name, payload in events:
+        stream = STREAM_ORDERS if mode == "shared" else route_event(event_name, payload)
+        pipe.xadd(stream, encode_event(event_name, payload))
+    await pipe.execute()
+
+    service = DriverMatchingService(redis=redis_client)
+    await service._ensure_consumer_group()
+    counter = RedisCommandCounter(redis_client)
+
+    read = 0
+    started = time.perf_counter()
+    while True:
+        messages = await service._read_orders(service.concurrency, 1)
+        if not messages:
+            break
+        read += len(messages)
+        for stream_key, message_id, raw_data in messages:
+            await service._process_order_message(stream_key, message_id, raw_data)
+    elapsed = time.perf_counter() - started
+
+    orders = sum(1 for event_name, _ in events if event_name == "OrderCreated")
+    print(
+        f"{mode:>7}: прочитано записей {read}, round trips/заказ = {counter.round_trips / orders:.1f}, "
+        f"{orders / elapsed:.0f} заказов/сек"
+    )
+    await redis_client.flushdb()
+    await redis_client.aclose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--lifecycle-per-order", type=int, default=20)
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    events = make_events(args.orders, args.lifecycle_per_order, args.seed)
+    print(f"Заказов: {args.orders}, событий жизненного цикла на заказ: {args.lifecycle_per_order}")
+    for mode in ("shared", "routed"):
+        await run_mode(args.redis_url, mode, events, args.drivers, args.seed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
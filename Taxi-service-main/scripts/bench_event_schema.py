@@ -0,0 +1,91 @@
+"""
+Бенчмарк формата событий: JSON в поле `data` (версия 1) против плоских полей
+записи стрима (версия 2, см. event_schema).
+
+Для события OrderCreated в том виде, в каком его публикует сервис поездок, выводит
+байты полей записи на событие, время кодирования и время разбора полей, нужных подбору.
+С --redis-url дополнительно пишет --events записей каждого формата в стрим и выводит
+MEMORY USAGE на запись (fakeredis MEMORY не поддерживает).
+
+Запуск из корня проекта:
+    python -m scripts.bench_event_schema --events 100000 [--redis-url redis://127.0.0.1:6379/15]
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+
+from scripts.bench_utils import add_redis_argument, make_redis_client, quiet_logging
+from src.services.event_schema import decode_order_created, encode_event
+
+
+def make_orders(num_events: int, seed: int) -> list[dict]:
+    """Нагрузки OrderCreated в формате rides_service.create_ride."""
+    rng = random.Random(seed)
+    created_at = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "ride_id": str(ride_id),
+            "passenger_user_id": str(rng.randint(1, 100_000)),
+            "start_x": rng.randint(0, 99),
+            "start_y": rng.randint(0, 99),
+            "end_x": rng.randint(0, 99),
+            "end_y": rng.randint(0, 99),
+            "price": round(rng.uniform(50, 500), 2),
+            "eta_seconds": round(rng.uniform(60, 1800), 1),
+            "status": "searching",
+            "created_at": created_at,
+        }
+        for ride_id in range(num_events)
+    ]
+
+
+def field_bytes(fields: dict) -> int:
+    return sum(len(name.encode()) + len(value.encode()) for name, value in fields.items())
+
+
+async def stream_memory_per_entry(redis_url: str, entries: list[dict]) -> float:
+    redis_client = make_redis_client(redis_url)
+    await redis_client.delete("bench_event_schema")
+    pipe = redis_client.pipeline(transaction=False)
+    for fields in entries:
+        pipe.xadd("bench_event_schema", fields)
+    await pipe.execute()
+    used = await redis_client.memory_usage("bench_event_schema", samples=0)
+    await redis_client.delete("bench_event_schema")
+    await redis_client.aclose()
+    return used / len(entries)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    orders = make_orders(args.events, args.seed)
+    print(f"Событий OrderCreated: {args.events}")
+    for version in (1, 2):
+        started = time.perf_counter()
+        entries = [encode_event("OrderCreated", order, version=version) for order in orders]
+        encode_us = (time.perf_counter() - started) / args.events * 1e6
+
+        started = time.perf_counter()
+        for fields in entries:
+            decode_order_created(fields)
+        decode_us = (time.perf_counter() - started) / args.events * 1e6
+
+        line = (
+            f"v{version}: {sum(map(field_bytes, entries)) / args.events:.0f} байт полей/событие, "
+            f"кодирование {encode_us:.2f} мкс, разбор для подбора {decode_us:.2f} мкс"
+        )
+        if args.redis_url:
+            line += f", MEMORY USAGE {await stream_memory_per_entry(args.redis_url, entries):.0f} байт/запись"
+        print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""
+Бенчмарк серверного CPU на один heartbeat: HTTP PUT /drivers/me/presence против
+кадра "presence" по уже открытому WebSocket /notifications/ws.
+
+HTTP-путь прогоняется через ASGI-приложение целиком: маршрутизация, разбор заголовков,
+декодирование JWT, проверка пользователя и DriverProfileService. Запрос к БД заменен
+сессией-заглушкой, поэтому цифра для HTTP — нижняя граница (в продакшене к ней
+добавляется round trip в PostgreSQL и TLS-рукопожатие/шифрование).
+WebSocket-путь — то, что эндпоинт делает на каждый кадр: DriverFrameHandler.handle
+и сериализация ответа. Аутентификация выполнена один раз при подключении.
+
+CPU измеряется через time.process_time (включает работу fakeredis в том же процессе,
+одинаковую для обоих путей).
+
+Запуск из корня проекта:
+    python -m scripts.bench_heartbeat_paths --heartbeats 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import jwt
+from fastapi import FastAPI
+
+from scripts.bench_utils import add_redis_argument, make_redis_client, quiet_logging
+from src.api.v1 import drivers
+from src.core.config import settings
+from src.core.db import get_async_session
+from src.core.redis import get_redis_client
+from src.services.driver_frames import DriverFrameHandler
+
+DRIVER_ID = 1
+
+
+class _FakeResult:
+    def scalar_one_or_none(self):
+        return object()
+
+
+class _FakeSession:
+    """Сессия-заглушка: пользователь из токена всегда существует."""
+
+    async def execute(self, *args, **kwargs):
+        return _FakeResult()
+
+
+def make_app(redis_client) -> FastAPI:
+    app = FastAPI()
+    app.include_router(drivers.router, prefix="/api/v1")
+
+    async def fake_session():
+        yield _FakeSession()
+
+    app.dependency_overrides[get_async_session] = fake_session
+    app.dependency_overrides[get_redis_client] = lambda: redis_client
+    return app
+
+
+def make_token() -> str:
+    # Тот же payload, что выдает user_service.create_access_token
+    expire = datetime.now(timezone.utc) + timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
+    return jwt.encode({"sub": str(DRIVER_ID), "exp": expire}, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+
+
+def presence_body(i: int) -> dict:
+    # Водитель едет по диагонали: часть heartbeat'ов меняет ячейку, часть — нет
+    step = (i // 3) % settings.CITY_GRID_N
+    return {"status": "online", "location": {"x": step, "y": step}}
+
+
+async def bench_http(redis_client, heartbeats: int) -> float:
+    transport = httpx.ASGITransport(app=make_app(redis_client))
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.process_time()
+        for i in range(heartbeats):
+            response = await client.put("/api/v1/drivers/me/presence", json=presence_body(i), headers=headers)
+            assert response.status_code == 204, response.text
+        return time.process_time() - started
+
+
+async def bench_websocket(redis_client, heartbeats: int) -> float:
+    handler = DriverFrameHandler(DRIVER_ID, redis_client)
+    started = time.process_time()
+    for i in range(heartbeats):
+        frame = json.dumps({"type": "presence", **presence_body(i)})
+        ack = await handler.handle(frame)
+        json.dumps(ack)
+        assert ack["type"] == "presence_ack", ack
+    return time.process_time() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heartbeats", type=int, default=2000)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    results = {}
+    for name, bench in (("HTTP PUT", bench_http), ("WebSocket", bench_websocket)):
+        redis_client = make_redis_client(args.redis_url)
+        await redis_client.flushdb()
+        results[name] = await bench(redis_client, args.heartbeats)
+        await redis_client.aclose()
+
+    for name, cpu in results.items():
+        print(f"{name:>10}: CPU/heartbeat = {cpu / args.heartbeats * 1e6:.0f} мкс")
+    print(f"Экономия CPU по WebSocket: x{results['HTTP PUT'] / results['WebSocket']:.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
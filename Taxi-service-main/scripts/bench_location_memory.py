@@ -0,0 +1,97 @@
+"""
+Бенчмарк памяти Redis под локации водителей: отдельный ключ `driver_location:{id}` ("x:y")
+на водителя против хэшей `driver_locations:{bucket}` с упакованными значениями.
+
+Для каждого формата записывает локации --drivers водителей и выводит прирост used_memory
+(INFO memory) и байт на водителя, а также время чтения позиций всех водителей
+(MGET по старым ключам против DriverLocationStore.get_many).
+
+Память может измерить только реальный Redis (fakeredis не поддерживает INFO memory):
+    python -m scripts.bench_location_memory --drivers 100000 --redis-url redis://127.0.0.1:6379/15
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from scripts.bench_utils import add_redis_argument, make_redis_client, quiet_logging
+from src.core.config import settings
+from src.services.driver_locations import DriverLocationStore
+
+PIPELINE_CHUNK = 10_000
+
+
+async def used_memory(redis_client):
+    try:
+        return (await redis_client.info("memory"))["used_memory"]
+    except Exception:
+        return None
+
+
+async def write_locations(redis_client, layout: str, locations: dict[int, tuple[int, int]]) -> None:
+    store = DriverLocationStore(redis_client)
+    items = list(locations.items())
+    for start in range(0, len(items), PIPELINE_CHUNK):
+        pipe = redis_client.pipeline(transaction=False)
+        for driver_id, (x, y) in items[start:start + PIPELINE_CHUNK]:
+            if layout == "keys":
+                pipe.set(f"{store.LEGACY_KEY_PREFIX}{driver_id}", f"{x}:{y}")
+            else:
+                pipe.hset(store.bucket_key(driver_id), driver_id, store.pack(x, y))
+        await pipe.execute()
+
+
+async def read_locations(redis_client, layout: str, driver_ids: list[int]) -> int:
+    store = DriverLocationStore(redis_client)
+    if layout == "hashes":
+        return len(await store.get_many(driver_ids))
+    found = 0
+    for start in range(0, len(driver_ids), PIPELINE_CHUNK):
+        chunk = driver_ids[start:start + PIPELINE_CHUNK]
+        values = await redis_client.mget([f"{store.LEGACY_KEY_PREFIX}{d}" for d in chunk])
+        found += sum(value is not None for value in values)
+    return found
+
+
+async def run_layout(redis_url, layout: str, locations) -> None:
+    redis_client = make_redis_client(redis_url)
+    await redis_client.flushdb()
+    before = await used_memory(redis_client)
+    await write_locations(redis_client, layout, locations)
+    after = await used_memory(redis_client)
+    keys = await redis_client.dbsize()
+
+    started = time.perf_counter()
+    found = await read_locations(redis_client, layout, list(locations))
+    elapsed = time.perf_counter() - started
+
+    line = f"{layout:>6}: ключей = {keys}, чтение всех позиций = {elapsed * 1000:.0f} мс ({found} найдено)"
+    if before is not None and after is not None:
+        line += f", память = {(after - before) / 2**20:.1f} МБ ({(after - before) / len(locations):.1f} байт/водитель)"
+    else:
+        line += ", память: нужен реальный Redis (--redis-url)"
+    print(line)
+    await redis_client.flushdb()
+    await redis_client.aclose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    rng = random.Random(args.seed)
+    locations = {
+        driver_id: (rng.randrange(settings.CITY_GRID_N), rng.randrange(settings.CITY_GRID_M))
+        for driver_id in range(1, args.drivers + 1)
+    }
+    print(f"Водителей: {args.drivers}, хэшей локаций: {settings.DRIVER_LOCATION_BUCKETS}")
+    for layout in ("keys", "hashes"):
+        await run_layout(args.redis_url, layout, locations)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""
+Бенчмарк реализаций DriverLocator: хэши ячеек (с битовыми картами и без) против Redis GEO.
+
+Для каждой плотности водителей и каждого индекса выводит:
+- стоимость обновления присутствия (команд и время на одно перемещение водителя);
+- поиск k ближайших: round trips, команды и время на запрос;
+- подсчет водителей в прямоугольнике. Для "geo" он выполняется через GEOSEARCH BYBOX, которого
+  нет в fakeredis: сравнение с ним требует реального Redis (--redis-url), иначе для "geo"
+  выводится причина, по которой замер не выполнен.
+
+Запуск из корня проекта:
+    python -m scripts.bench_locators --densities 50 500 5000 --queries 200
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from redis.exceptions import ResponseError
+
+from scripts.bench_utils import RedisCommandCounter, add_redis_argument, make_redis_client, quiet_logging
+from src.core.config import settings
+from src.schemas.driver import DriverLocationSchema, DriverPresenceSchema, DriverStatus
+from src.services.driver_locator import CellHashLocator, RedisGeoLocator
+from src.services.driver_profile_service import DriverProfileService
+
+BACKENDS = ("cells", "cells+bitmap", "geo")
+
+
+def make_locator(redis_client, backend: str):
+    grid_n, grid_m = settings.CITY_GRID_N, settings.CITY_GRID_M
+    if backend == "geo":
+        return RedisGeoLocator(redis_client, grid_n, grid_m)
+    return CellHashLocator(redis_client, grid_n, grid_m, use_bitmap=backend == "cells+bitmap")
+
+
+def random_cell(rng: random.Random) -> tuple[int, int]:
+    return rng.randint(0, settings.CITY_GRID_N - 1), rng.randint(0, settings.CITY_GRID_M - 1)
+
+
+async def run_backend(redis_url, backend: str, num_drivers: int, args) -> None:
+    redis_client = make_redis_client(redis_url)
+    await redis_client.flushdb()
+    locator = make_locator(redis_client, backend)
+    profiles = DriverProfileService(redis=redis_client, locator=locator)
+    rng = random.Random(args.seed)
+
+    for driver_id in range(1, num_drivers + 1):
+        x, y = random_cell(rng)
+        presence = DriverPresenceSchema(status=DriverStatus.ONLINE, location=DriverLocationSchema(x=x, y=y))
+        await profiles.update_presence(driver_id, presence)
+
+    counter = RedisCommandCounter(redis_client)
+    started = time.perf_counter()
+    for _ in range(args.moves):
+        x, y = random_cell(rng)
+        presence = DriverPresenceSchema(status=DriverStatus.ONLINE, location=DriverLocationSchema(x=x, y=y))
+        await profiles.update_presence(rng.randint(1, num_drivers), presence)
+    update_commands = counter.commands / args.moves
+    update_ms = (time.perf_counter() - started) / args.moves * 1000
+
+    counter.reset()
+    started = time.perf_counter()
+    for _ in range(args.queries):
+        x, y = random_cell(rng)
+        await locator.nearest(x, y, args.k, args.radius)
+    nearest_ms = (time.perf_counter() - started) / args.queries * 1000
+    nearest_round_trips = counter.round_trips / args.queries
+    nearest_commands = counter.commands / args.queries
+
+    counter.reset()
+    started = time.perf_counter()
+    try:
+        for _ in range(args.queries):
+            x, y = random_cell(rng)
+            await locator.count_in_box(x, y, x + args.box - 1, y + args.box - 1)
+        box = (
+            f"{counter.commands / args.queries:.1f} команд, "
+            f"{(time.perf_counter() - started) / args.queries * 1000:.2f} мс"
+        )
+    except ResponseError as e:
+        # GEOSEARCH BYBOX есть только в Redis >= 6.2; fakeredis его не поддерживает. Другие ошибки не скрываются
+        if backend != "geo":
+            raise
+        box = f"не измерено: сервер не выполнил GEOSEARCH BYBOX ({e}), нужен Redis >= 6.2 через --redis-url"
+
+    print(
+        f"{num_drivers:>6} {backend:>13}: обновление = {update_commands:.1f} команд / {update_ms:.2f} мс, "
+        f"nearest(k={args.k}) = {nearest_round_trips:.1f} round trips / {nearest_commands:.1f} команд / "
+        f"{nearest_ms:.2f} мс, прямоугольник {args.box}x{args.box} = {box}"
+    )
+    await redis_client.aclose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--densities", type=int, nargs="+", default=[50, 500, 5000], help="Число водителей на сетке")
+    parser.add_argument("--moves", type=int, default=500, help="Сколько перемещений водителей измерять")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5, help="Сколько ближайших водителей запрашивать")
+    parser.add_argument("--radius", type=int, default=40, help="Максимальный манхэттенский радиус поиска")
+    parser.add_argument("--box", type=int, default=10, help="Сторона прямоугольника для count_in_box (клеток)")
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    print(f"Сетка {settings.CITY_GRID_N}x{settings.CITY_GRID_M}")
+    if not args.redis_url:
+        print("Внимание: fakeredis не поддерживает GEOSEARCH BYBOX, прямоугольник для geo не будет измерен (нужен --redis-url).")
+    for num_drivers in args.densities:
+        for backend in BACKENDS:
+            await run_backend(args.redis_url, backend, num_drivers, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+Бенчмарк поиска водителя: число обращений к Redis на один подбор.
+
+Сравнивает режимы DriverMatchingService:
+- python: спиральный поиск с запросами на каждое кольцо и кандидата;
+- script: поиск и блокировка одним Lua-скриптом (EVALSHA).
+
+Запуск из корня проекта:
+    python -m scripts.bench_matching --drivers 50 --matches 200
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from scripts.bench_utils import RedisCommandCounter, add_redis_argument, make_redis_client, quiet_logging
+from src.core.config import settings
+from src.services.driver_locations import DriverLocationStore
+from src.services.matching_service import DriverMatchingService
+
+
+async def setup_drivers(redis_client, num_drivers: int, seed: int) -> None:
+    """Размещает водителей на сетке случайным образом."""
+    await redis_client.flushdb()
+    rng = random.Random(seed)
+    locations = DriverLocationStore(redis_client)
+    pipe = redis_client.pipeline()
+    for driver_id in range(1, num_drivers + 1):
+        x = rng.randint(0, settings.CITY_GRID_N - 1)
+        y = rng.randint(0, settings.CITY_GRID_M - 1)
+        pipe.hset(f"cell:{x}:{y}", str(driver_id), "online")
+        pipe.hset(locations.bucket_key(driver_id), driver_id, locations.pack(x, y))
+    await pipe.execute()
+
+
+async def run_mode(redis_url, mode: str, num_drivers: int, num_matches: int, seed: int) -> None:
+    redis_client = make_redis_client(redis_url)
+    await setup_drivers(redis_client, num_drivers, seed)
+
+    service = DriverMatchingService(redis=redis_client)
+    service.search_mode = mode
+    counter = RedisCommandCounter(redis_client)
+
+    rng = random.Random(seed + 1)
+    found = 0
+    started = time.perf_counter()
+    for i in range(num_matches):
+        x = rng.randint(0, settings.CITY_GRID_N - 1)
+        y = rng.randint(0, settings.CITY_GRID_M - 1)
+        driver_id = await service._find_and_lock_nearest_driver(x, y, f"bench-{i}")
+        if driver_id is not None:
+            found += 1
+            # Снимаем блокировку, чтобы водитель участвовал в следующих подборах
+            await redis_client.delete(f"driver_lock:{driver_id}")
+            counter.round_trips -= 1
+            counter.commands -= 1
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{mode:>7}: найдено {found}/{num_matches}, "
+        f"round trips/подбор = {counter.round_trips / num_matches:.1f}, "
+        f"команд/подбор = {counter.commands / num_matches:.1f}, "
+        f"время/подбор = {elapsed / num_matches * 1000:.2f} мс"
+    )
+    await redis_client.aclose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=50)
+    parser.add_argument("--matches", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    print(f"Сетка {settings.CITY_GRID_N}x{settings.CITY_GRID_M}, водителей: {args.drivers}")
+    for mode in ("python", "script"):
+        await run_mode(args.redis_url, mode, args.drivers, args.matches, args.seed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+"""
+Бенчмарк GET /drivers/nearby: чтение индекса на каждый запрос против общих снимков тайлов.
+
+--passengers запросов к случайным точкам района --area x --area клеток (все смотрят
+на один район города), не больше --concurrency одновременно (как в пуле соединений API). Для каждого режима выводит round trip'ы Redis
+на запрос и время обработки всех запросов.
+
+Запуск из корня проекта:
+    python -m scripts.bench_nearby_drivers --drivers 2000 --passengers 10000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from scripts.bench_matching import setup_drivers
+from scripts.bench_utils import RedisCommandCounter, add_redis_argument, make_redis_client, quiet_logging
+from src.services.driver_locator import create_driver_locator
+from src.services.nearby_drivers import NearbyDriversCache
+
+
+async def direct_nearby(locator, x: int, y: int, radius: int) -> list[tuple[int, int]]:
+    drivers = await locator.drivers_in_box(x - radius, y - radius, x + radius, y + radius)
+    return sorted((cx, cy) for _, cx, cy in drivers if abs(cx - x) + abs(cy - y) <= radius)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=2000)
+    parser.add_argument("--passengers", type=int, default=10000)
+    parser.add_argument("--area", type=int, default=20, help="Сторона района, на который смотрят пассажиры")
+    parser.add_argument("--radius", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=100, help="Одновременных запросов")
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    redis_client = make_redis_client(args.redis_url)
+    await setup_drivers(redis_client, args.drivers, args.seed)
+    rng = random.Random(args.seed)
+    points = [(rng.randrange(40, 40 + args.area), rng.randrange(40, 40 + args.area)) for _ in range(args.passengers)]
+
+    locator = create_driver_locator(redis_client)
+    cache = NearbyDriversCache(redis_client, locator)
+    modes = {
+        "direct": lambda x, y: direct_nearby(locator, x, y, args.radius),
+        "snapshot": lambda x, y: cache.nearby(x, y, args.radius),
+    }
+    print(f"Водителей: {args.drivers}, запросов: {args.passengers}, район {args.area}x{args.area}, радиус {args.radius}")
+    for mode, nearby in modes.items():
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def request(x: int, y: int):
+            async with semaphore:
+                return await nearby(x, y)
+
+        counter = RedisCommandCounter(redis_client)
+        started = time.perf_counter()
+        await asyncio.gather(*(request(x, y) for x, y in points))
+        elapsed = time.perf_counter() - started
+        print(
+            f"{mode:>8}: round trips/запрос = {counter.round_trips / args.passengers:.4f}, "
+            f"команд/запрос = {counter.commands / args.passengers:.2f}, всего {elapsed * 1000:.0f} мс"
+        )
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
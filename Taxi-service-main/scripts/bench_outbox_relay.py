@@ -0,0 +1,69 @@
+"""
+Бенчмарк публикации событий поездок: XADD на каждое событие (как прежний publish_event
+на пути запроса) против пачек OutboxRelay.publish_batch (через StreamPublisher:
+один pipeline на каждые PUBLISHER_MAX_BATCH событий).
+
+Чтение и отметка строк outbox в PostgreSQL в замер не входят: сравнивается только
+работа с Redis. Выводит round trip'ы на событие и пропускную способность.
+
+Запуск из корня проекта:
+    python -m scripts.bench_outbox_relay --events 20000 --batch-size 500
+"""
+import argparse
+import asyncio
+import time
+
+from scripts.bench_utils import RedisCommandCounter, add_redis_argument, make_redis_client, quiet_logging
+from src.services.outbox import OutboxRelay, enqueue_driver_assigned
+
+
+class _RecordingSession:
+    def __init__(self):
+        self.added = []
+
+    def add(self, obj):
+        self.added.append(obj)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    db = _RecordingSession()
+    for ride_id in range(args.events):
+        enqueue_driver_assigned(db, {"ride_id": str(ride_id), "driver_user_id": "7", "status": "driver_assigned"})
+    events = db.added
+
+    redis_client = make_redis_client(args.redis_url)
+    await redis_client.flushdb()
+    relay = OutboxRelay(redis_client)
+
+    counter = RedisCommandCounter(redis_client)
+    started = time.perf_counter()
+    for outbox_event in events:
+        await redis_client.xadd(outbox_event.stream, {"event": outbox_event.event, "data": outbox_event.payload})
+    inline = (time.perf_counter() - started, counter.round_trips)
+
+    counter.reset()
+    started = time.perf_counter()
+    for start in range(0, len(events), args.batch_size):
+        await relay.publish_batch(events[start:start + args.batch_size])
+    batched = (time.perf_counter() - started, counter.round_trips)
+
+    print(f"Событий: {args.events}, пачка: {args.batch_size}")
+    for name, (elapsed, round_trips) in (("inline", inline), ("outbox", batched)):
+        print(
+            f"{name:>7}: round trips/событие = {round_trips / args.events:.4f}, "
+            f"{args.events / elapsed:.0f} событий/сек"
+        )
+    await relay.publisher.close()
+    await redis_client.flushdb()
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
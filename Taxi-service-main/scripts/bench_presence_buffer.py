@@ -0,0 +1,98 @@
+"""
+Бенчмарк буфера heartbeat'ов: прямая запись каждого heartbeat'а против PresenceBuffer.
+
+Водители на линии присылают heartbeat'ы, сдвигаясь на соседнюю клетку раз в
+--cell-every heartbeat'ов; буфер сбрасывается раз в --flush-every heartbeat'ов
+(имитация PRESENCE_BUFFER_FLUSH_MS при заданном темпе). Для каждого режима выводит
+round trip'ы и команды Redis на heartbeat, а для буфера — коэффициент объединения
+и среднюю длительность сброса.
+
+Запуск из корня проекта:
+    python -m scripts.bench_presence_buffer --drivers 1000 --heartbeats 20000 --flush-every 2000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from scripts.bench_utils import RedisCommandCounter, add_redis_argument, make_redis_client, quiet_logging
+from src.core.config import settings
+from src.schemas.driver import DriverLocationSchema, DriverPresenceSchema, DriverStatus
+from src.services.driver_profile_service import DriverProfileService
+from src.services.presence_buffer import PresenceBuffer
+
+
+def make_heartbeats(args) -> list[tuple[int, DriverPresenceSchema]]:
+    rng = random.Random(args.seed)
+    positions = {
+        driver_id: [rng.randrange(settings.CITY_GRID_N), rng.randrange(settings.CITY_GRID_M)]
+        for driver_id in range(1, args.drivers + 1)
+    }
+    heartbeats = []
+    for i in range(args.heartbeats):
+        driver_id = rng.randint(1, args.drivers)
+        position = positions[driver_id]
+        if i % args.cell_every == 0:
+            position[0] = min(settings.CITY_GRID_N - 1, position[0] + 1)
+        location = DriverLocationSchema(x=position[0], y=position[1])
+        heartbeats.append((driver_id, DriverPresenceSchema(status=DriverStatus.ONLINE, location=location)))
+    return heartbeats
+
+
+async def run_mode(redis_url, mode: str, heartbeats, args) -> None:
+    redis_client = make_redis_client(redis_url)
+    await redis_client.flushdb()
+    service = DriverProfileService(redis_client)
+    presence_buffer = PresenceBuffer(redis_client, max_updates=args.heartbeats + 1)
+
+    # Выход водителей на линию в обоих режимах пишется сразу и в замер не входит
+    for driver_id in range(1, args.drivers + 1):
+        await presence_buffer.submit(driver_id, heartbeats[0][1])
+
+    counter = RedisCommandCounter(redis_client)
+    started = time.perf_counter()
+    for i, (driver_id, presence) in enumerate(heartbeats, start=1):
+        if mode == "direct":
+            await service.update_presence(driver_id, presence)
+        else:
+            await presence_buffer.submit(driver_id, presence)
+            if i % args.flush_every == 0:
+                await presence_buffer.flush()
+    if mode == "buffer":
+        await presence_buffer.flush()
+    elapsed = time.perf_counter() - started
+
+    line = (
+        f"{mode:>7}: round trips/heartbeat = {counter.round_trips / len(heartbeats):.3f}, "
+        f"команд/heartbeat = {counter.commands / len(heartbeats):.3f}, "
+        f"время/heartbeat = {elapsed / len(heartbeats) * 1e6:.0f} мкс"
+    )
+    if mode == "buffer":
+        flushes = presence_buffer.flush_duration.count()
+        line += (
+            f", объединение = x{presence_buffer.coalescing_ratio.value():.1f}, "
+            f"сброс = {presence_buffer.flush_duration.sum() / flushes * 1000:.1f} мс"
+        )
+    print(line)
+    await redis_client.aclose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--heartbeats", type=int, default=20000)
+    parser.add_argument("--flush-every", type=int, default=2000, help="Сбрасывать буфер каждые N heartbeat'ов")
+    parser.add_argument("--cell-every", type=int, default=5, help="Каждый N-й heartbeat меняет клетку")
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    heartbeats = make_heartbeats(args)
+    print(f"Водителей: {args.drivers}, heartbeat'ов: {args.heartbeats}, сброс каждые {args.flush_every}")
+    for mode in ("direct", "buffer"):
+        await run_mode(args.redis_url, mode, heartbeats, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Бенчмарк публикации событий при одновременном создании поездок: новый клиент Redis
+и XADD на каждое событие (прежний publish_event) против общего StreamPublisher,
+который собирает события одновременных запросов в пачки pipeline XADD.
+
+Выводит round trip'ы на событие, число пачек и пропускную способность.
+
+Запуск из корня проекта:
+    python -m scripts.bench_publisher --rides 1000 --rounds 10
+"""
+import argparse
+import asyncio
+import time
+
+import redis.asyncio as aioredis
+
+from scripts.bench_utils import RedisCommandCounter, add_redis_argument, quiet_logging
+from src.services.event_schema import encode_event
+from src.services.redis_publisher import STREAM_ORDERS, StreamPublisher
+
+
+def _client_factory(redis_url: str | None):
+    """Фабрика клиентов одного и того же Redis (для fakeredis — общий FakeServer)."""
+    if redis_url:
+        return lambda: aioredis.Redis.from_url(redis_url, decode_responses=True)
+
+    from fakeredis import FakeServer
+    from fakeredis.aioredis import FakeRedis
+    server = FakeServer()
+    return lambda: FakeRedis(server=server, decode_responses=True)
+
+
+def _order(ride_id: int) -> dict:
+    return {"ride_id": str(ride_id), "start_x": 3, "start_y": 4, "end_x": 9, "end_y": 9, "price": 80.0}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rides", type=int, default=1000, help="Одновременно создаваемых поездок в раунде")
+    parser.add_argument("--rounds", type=int, default=10)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    new_client = _client_factory(args.redis_url)
+    redis_client = new_client()
+    await redis_client.flushdb()
+    total = args.rides * args.rounds
+
+    async def publish_per_client(ride_id: int):
+        client = new_client()
+        try:
+            await client.xadd(STREAM_ORDERS, encode_event("OrderCreated", _order(ride_id)))
+        finally:
+            await client.aclose()
+
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        await asyncio.gather(*(publish_per_client(ride_id) for ride_id in range(args.rides)))
+    per_client = (time.perf_counter() - started, float(total), total)
+
+    await redis_client.delete(STREAM_ORDERS)
+    publisher = StreamPublisher(redis_client)
+    counter = RedisCommandCounter(redis_client)
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        await asyncio.gather(*(publisher.publish("OrderCreated", _order(ride_id)) for ride_id in range(args.rides)))
+    await publisher.close()
+    batched = (time.perf_counter() - started, float(counter.round_trips), publisher.flushes)
+
+    print(f"Поездок: {args.rides} одновременно x {args.rounds} раундов, пачка до {publisher.max_batch}")
+    for name, (elapsed, round_trips, flushes) in (("per-client", per_client), ("publisher", batched)):
+        print(
+            f"{name:>10}: round trips/событие = {round_trips / total:.4f}, пачек = {flushes}, "
+            f"{total / elapsed:.0f} событий/сек"
+        )
+    await redis_client.flushdb()
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
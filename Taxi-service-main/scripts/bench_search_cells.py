@@ -0,0 +1,87 @@
+"""
+Бенчмарк обхода сетки при поиске водителя: квадратные кольца против L1-ромбов,
+а также L1-ромбы с битовыми картами занятости (HKEYS только для занятых ячеек).
+
+Для каждого режима DriverMatchingService выводит среднее число просмотренных
+колец и запрошенных ячеек на один поиск (по метрикам сервиса), долю поисков,
+в которых найден не ближайший по манхэттенскому расстоянию водитель, и среднее время.
+
+Запуск из корня проекта:
+    python -m scripts.bench_search_cells --drivers 50 --matches 500
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from scripts.bench_matching import setup_drivers
+from scripts.bench_utils import add_redis_argument, make_redis_client, quiet_logging
+from src.core.config import settings
+from src.services.driver_locations import DriverLocationStore
+from src.services.matching_service import DriverMatchingService
+from src.services.occupancy_bitmap import sync_occupancy_bitmap
+
+
+async def load_locations(redis_client, num_drivers: int) -> dict[int, tuple[int, int]]:
+    """Читает координаты водителей, размещенных setup_drivers."""
+    return await DriverLocationStore(redis_client).get_many(range(1, num_drivers + 1))
+
+
+async def run_mode(redis_url, mode: str, bitmap: bool, args) -> None:
+    redis_client = make_redis_client(redis_url)
+    await setup_drivers(redis_client, args.drivers, args.seed)
+    await sync_occupancy_bitmap(redis_client)
+    locations = await load_locations(redis_client, args.drivers)
+
+    service = DriverMatchingService(redis=redis_client)
+    service.search_mode = mode
+    service.occupancy_bitmap_enabled = bitmap
+    service.MAX_SEARCH_RADIUS = args.radius
+
+    rng = random.Random(args.seed + 1)
+    found = not_nearest = 0
+    started = time.perf_counter()
+    for i in range(args.matches):
+        x = rng.randint(0, settings.CITY_GRID_N - 1)
+        y = rng.randint(0, settings.CITY_GRID_M - 1)
+        driver_id = await service._find_and_lock_nearest_driver(x, y, f"bench-{i}")
+        if driver_id is None:
+            continue
+        found += 1
+        await redis_client.delete(f"driver_lock:{driver_id}")
+
+        dx, dy = locations[driver_id]
+        best = min(abs(lx - x) + abs(ly - y) for lx, ly in locations.values())
+        if abs(dx - x) + abs(dy - y) > best:
+            not_nearest += 1
+    elapsed = time.perf_counter() - started
+
+    metrics = service.metrics
+    label = f"{mode}+bitmap" if bitmap else mode
+    print(
+        f"{label:>14}: найдено {found}/{args.matches}, "
+        f"колец/поиск = {metrics.rings_scanned.sum() / args.matches:.1f}, "
+        f"ячеек/поиск = {metrics.cells_queried.sum() / args.matches:.1f}, "
+        f"не ближайший = {not_nearest / max(found, 1):.1%}, "
+        f"время/поиск = {elapsed / args.matches * 1000:.2f} мс"
+    )
+    await redis_client.aclose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=50)
+    parser.add_argument("--matches", type=int, default=500)
+    parser.add_argument("--radius", type=int, default=40, help="MAX_SEARCH_RADIUS для всех режимов")
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    quiet_logging()
+
+    print(f"Сетка {settings.CITY_GRID_N}x{settings.CITY_GRID_M}, водителей: {args.drivers}, радиус: {args.radius}")
+    for mode, bitmap in (("python", False), ("script", False), ("diamond", False), ("diamond", True)):
+        await run_mode(args.redis_url, mode, bitmap, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
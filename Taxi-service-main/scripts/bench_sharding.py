@@ -0,0 +1,148 @@
+"""
+Бенчмарк пропускной способности подбора в зависимости от числа шардов.
+
+Публикует пачку заказов, распределенных по всей сетке, в стримы регионов,
+затем запускает N процессов DriverMatchingService (по одному на шард)
+и измеряет время, за которое все заказы будут обработаны и подтверждены.
+
+Требуется реальный Redis: процессы не могут разделять in-memory fakeredis.
+Бенчмарк очищает указанную базу (FLUSHDB).
+
+Запуск из корня проекта:
+    python -m scripts.bench_sharding --redis-url redis://127.0.0.1:6379/15 --shards 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import time
+
+import redis.asyncio as aioredis
+
+from scripts.bench_utils import add_redis_argument, quiet_logging
+from src.core.config import settings
+from src.services import order_regions
+from src.services.matching_service import DriverMatchingService
+
+
+async def setup(redis_url: str, num_orders: int, seed: int) -> list[str]:
+    """Ставит по водителю в каждую клетку и публикует заказы. Возвращает ключи всех стримов регионов."""
+    client = aioredis.Redis.from_url(redis_url, decode_responses=True)
+    await client.flushdb()
+    rng = random.Random(seed)
+
+    pipe = client.pipeline(transaction=False)
+    driver_id = 0
+    for x in range(settings.CITY_GRID_N):
+        for y in range(settings.CITY_GRID_M):
+            driver_id += 1
+            pipe.hset(f"cell:{x}:{y}", str(driver_id), "online")
+    for i in range(num_orders):
+        x = rng.randint(0, settings.CITY_GRID_N - 1)
+        y = rng.randint(0, settings.CITY_GRID_M - 1)
+        payload = {"ride_id": str(i), "start_x": x, "start_y": y, "end_x": 0, "end_y": 0, "price": 100}
+        pipe.xadd(order_regions.order_stream_key(x, y), {"event": "OrderCreated", "data": json.dumps(payload)})
+    await pipe.execute()
+    await client.aclose()
+    return [order_regions.region_stream_key(r) for r in order_regions.all_regions()]
+
+
+def shard_worker(redis_url: str, region_size: int, shard_index: int, shard_count: int) -> None:
+    """Процесс одного шарда: обслуживает свои регионы до завершения родителем."""
+    quiet_logging()
+    settings.ORDER_REGION_SIZE = region_size
+    regions = order_regions.owned_regions("", shard_index, shard_count)
+
+    async def run():
+        client = aioredis.Redis.from_url(redis_url, decode_responses=True)
+        service = DriverMatchingService(
+            redis=client,
+            stream_keys=[order_regions.region_stream_key(r) for r in regions],
+        )
+        # Шарды работают на одном узле: эндпоинт метрик в замере не нужен и занял бы один порт на всех
+        service.metrics_port = 0
+        await service.run()
+
+    asyncio.run(run())
+
+
+async def wait_until_processed(redis_url: str, stream_keys: list[str], processes: list) -> None:
+    """
+    Ждет, пока во всех стримах группа дочитает записи и не останется pending.
+
+    Raises:
+        RuntimeError: Процесс шарда завершился раньше (замер не закончился бы никогда).
+    """
+    client = aioredis.Redis.from_url(redis_url, decode_responses=True)
+    while True:
+        dead = [process.name for process in processes if not process.is_alive()]
+        if dead:
+            await client.aclose()
+            raise RuntimeError(f"Процессы шардов завершились до конца замера: {', '.join(dead)}")
+        done = True
+        for stream_key in stream_keys:
+            if not await client.exists(stream_key):
+                continue
+            last_id = (await client.xinfo_stream(stream_key))["last-generated-id"]
+            groups = await client.xinfo_groups(stream_key)
+            group = next((g for g in groups if g["name"] == DriverMatchingService.CONSUMER_GROUP), None)
+            if group is None or group["last-delivered-id"] != last_id or group["pending"]:
+                done = False
+                break
+        if done:
+            break
+        await asyncio.sleep(0.05)
+    await client.aclose()
+
+
+def run_shards(redis_url: str, shard_count: int, args) -> float:
+    stream_keys = asyncio.run(setup(redis_url, args.orders, args.seed))
+
+    processes = [
+        multiprocessing.Process(target=shard_worker, args=(redis_url, args.region_size, i, shard_count))
+        for i in range(shard_count)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    try:
+        asyncio.run(wait_until_processed(redis_url, stream_keys, processes))
+    finally:
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--region-size", type=int, default=25)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seed", type=int, default=1)
+    add_redis_argument(parser)
+    args = parser.parse_args()
+    if not args.redis_url:
+        parser.error("нужен --redis-url: шарды работают в отдельных процессах")
+    quiet_logging()
+
+    settings.ORDER_REGION_SIZE = args.region_size
+    regions_x, regions_y = order_regions.region_grid_size()
+    print(f"Сетка {settings.CITY_GRID_N}x{settings.CITY_GRID_M}, регионов: {regions_x}x{regions_y}, заказов: {args.orders}")
+
+    baseline = None
+    for shard_count in args.shards:
+        elapsed = run_shards(args.redis_url, shard_count, args)
+        throughput = args.orders / elapsed
+        baseline = baseline or throughput
+        print(
+            f"шардов: {shard_count:>2}, время = {elapsed:.2f} с, "
+            f"заказов/с = {throughput:.0f}, ускорение = x{throughput / baseline:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
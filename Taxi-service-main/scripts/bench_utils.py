@@ -0,0 +1,34 @@
+"""
+Общие утилиты для бенчмарков.
+Запуск бенчмарков из корня проекта: python -m scripts.<имя_скрипта>
+"""
+import argparse
+import logging
+
+import redis.asyncio as aioredis
+
+# Счетчик команд общий с тестами (tests/redis_helpers.py)
+from tests.redis_helpers import RedisCommandCounter  # noqa: F401
+
+
+def add_redis_argument(parser: argparse.ArgumentParser) -> None:
+    """Добавляет общий аргумент --redis-url (по умолчанию — in-memory fakeredis)."""
+    parser.add_argument(
+        "--redis-url",
+        default=None,
+        help="URL реального Redis (например, redis://127.0.0.1:6379/15). По умолчанию используется fakeredis.",
+    )
+
+
+def make_redis_client(redis_url: str | None):
+    """Создает клиент реального Redis или in-memory FakeRedis."""
+    if redis_url:
+        return aioredis.Redis.from_url(redis_url, decode_responses=True)
+
+    from fakeredis.aioredis import FakeRedis
+    return FakeRedis(decode_responses=True)
+
+
+def quiet_logging() -> None:
+    """Отключает INFO/WARNING-логи сервисов, чтобы они не мешали выводу бенчмарка."""
+    logging.disable(logging.WARNING)
@@ -91,7 +91,10 @@ async def run_matching_test(redis_client):
     tasks = []
     for i in range(MATCHING_REQUESTS):
         ride_id = f"load_test_ride_{i}"
+        # Формат event_schema версии 2: плоские поля записи
         payload = {
+            "v": "2",
+            "event": "OrderCreated",
             "ride_id": ride_id,
             "start_x": str(random.randint(0, GRID_N - 1)),
             "start_y": str(random.randint(0, GRID_M - 1)),
@@ -0,0 +1,37 @@
+"""
+Миграция локаций водителей: ключи `driver_location:{id}` ("x:y") переносятся в хэши
+`driver_locations:{bucket}` (см. DriverLocationStore).
+
+Можно запускать на работающем сервисе: до переноса скрипты присутствия читают старые ключи,
+а перенос каждого ключа атомарен и не затирает более новую локацию.
+
+Запуск из корня проекта:
+    python -m scripts.migrate_driver_locations [--redis-url redis://host:6379/0]
+"""
+import argparse
+import asyncio
+
+import redis.asyncio as aioredis
+
+from src.core.config import settings
+from src.services.driver_locations import DriverLocationStore
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--redis-url",
+        default=f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}",
+        help="URL Redis (по умолчанию — из настроек сервиса)",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000, help="Сколько ключей переносить за один вызов скрипта")
+    args = parser.parse_args()
+
+    redis_client = aioredis.Redis.from_url(args.redis_url, decode_responses=True)
+    migrated = await DriverLocationStore(redis_client).migrate_legacy_keys(args.batch_size)
+    print(f"Перенесено локаций: {migrated}")
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
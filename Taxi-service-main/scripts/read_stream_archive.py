@@ -0,0 +1,27 @@
+"""
+Чтение архива стримов событий (см. StreamArchiver) из PostgreSQL: выводит записи
+стрима в диапазоне ID по одной JSON-строке, в том же порядке, что и XRANGE.
+
+Запуск из корня проекта:
+    python -m scripts.read_stream_archive --stream order_events --start 1718000000000-0 --end +
+"""
+import argparse
+import asyncio
+import json
+
+from src.services.stream_archive import read_archived_range
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stream", default="order_events", help="Ключ стрима")
+    parser.add_argument("--start", default="-", help="Первый ID диапазона (включительно) или '-'")
+    parser.add_argument("--end", default="+", help="Последний ID диапазона (включительно) или '+'")
+    args = parser.parse_args()
+
+    for entry_id, fields in await read_archived_range(args.stream, args.start, args.end):
+        print(json.dumps({"id": entry_id, "fields": fields}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,10 @@
 """Модуль с общими зависимостями для API."""
 
+import hmac
 from typing import Optional
 from fastapi import HTTPException, status, Query, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.requests import HTTPConnection
+from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import jwt
@@ -10,8 +12,11 @@ import jwt
 from src.core.config import settings
 from src.core.db import get_async_session
 from src.models.user import User
+from src.services.nearby_drivers import NearbyDriversCache
+from src.services.presence_buffer import PresenceBuffer
 
 security = HTTPBearer()
+gateway_key_header = APIKeyHeader(name="X-Gateway-Key", auto_error=False)
 
 
 async def get_current_user_id(
@@ -100,6 +105,44 @@ async def get_current_user_id_websocket(
     return int(user_id)
 
 
+def _parse_gateway_keys(raw: str) -> dict[str, str]:
+    """Разбирает FLEET_GATEWAY_KEYS ("gateway_id:key,...") в словарь {gateway_id: key}."""
+    keys = {}
+    for entry in raw.split(","):
+        gateway_id, _, key = entry.strip().partition(":")
+        if gateway_id and key:
+            keys[gateway_id] = key
+    return keys
+
+
+async def get_fleet_gateway_id(api_key: Optional[str] = Depends(gateway_key_header)) -> str:
+    """
+    Проверяет ключ шлюза партнерского парка из заголовка X-Gateway-Key и возвращает ID шлюза.
+    В отличие от get_current_user_id, не декодирует JWT и не обращается к базе данных.
+    """
+    if api_key:
+        for gateway_id, key in _parse_gateway_keys(settings.FLEET_GATEWAY_KEYS).items():
+            if hmac.compare_digest(key.encode(), api_key.encode()):
+                return gateway_id
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Неверный ключ шлюза",
+    )
+
+
+def get_presence_buffer(connection: HTTPConnection) -> Optional[PresenceBuffer]:
+    """
+    Возвращает буфер heartbeat'ов процесса (создается в lifespan при PRESENCE_BUFFER_ENABLED)
+    или None, если буфер выключен. Подходит и для HTTP-, и для WebSocket-эндпоинтов.
+    """
+    return getattr(connection.app.state, "presence_buffer", None)
+
+
+def get_nearby_drivers_cache(connection: HTTPConnection) -> NearbyDriversCache:
+    """Возвращает общий для процесса кэш снимков водителей по тайлам (создается в lifespan)."""
+    return connection.app.state.nearby_drivers_cache
+
+
 # Для обратной совместимости с существующим кодом
 async def get_current_user_id_stub(
     token: Optional[str] = Query(None, description="Токен аутентификации для WebSocket")
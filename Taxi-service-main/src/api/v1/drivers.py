@@ -1,12 +1,22 @@
 """API эндпоинты для управления состоянием водителя."""
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from redis.asyncio import Redis
 
+from src.core.config import settings
 from src.core.redis import get_redis_client
-from src.schemas.driver import DriverPresenceSchema
+from src.schemas.driver import (
+    DriverPresenceBatchResultSchema,
+    DriverPresenceBatchSchema,
+    DriverPresenceSchema,
+    NearbyDriversSchema,
+)
 from src.services.driver_profile_service import DriverProfileService
-from .dependencies import get_current_user_id
+from src.services.nearby_drivers import NearbyDriversCache
+from src.services.presence_buffer import PresenceBuffer
+from .dependencies import get_current_user_id, get_fleet_gateway_id, get_nearby_drivers_cache, get_presence_buffer
 
 router = APIRouter(prefix="/drivers", tags=["Drivers"])
 
@@ -21,6 +31,7 @@ async def update_driver_presence(
     presence_data: DriverPresenceSchema,
     driver_id: int = Depends(get_current_user_id),
     redis_client: Redis = Depends(get_redis_client),
+    presence_buffer: Optional[PresenceBuffer] = Depends(get_presence_buffer),
 ):
     """
     Обновляет присутствие водителя в системе.
@@ -28,8 +39,62 @@ async def update_driver_presence(
     - **presence_data**: Тело запроса с новым статусом и локацией.
     - **driver_id**: ID водителя, полученный из токена аутентификации (сейчас - заглушка).
     - **redis_client**: Асинхронный клиент Redis, внедренный через зависимость.
+    - **presence_buffer**: Буфер heartbeat'ов процесса, если он включен (PRESENCE_BUFFER_ENABLED).
     """
+    if presence_buffer is not None:
+        await presence_buffer.submit(driver_id, presence_data)
+        return None
+
     service = DriverProfileService(redis_client)
     await service.update_presence(driver_id, presence_data)
     # При успешном обновлении возвращаем пустой ответ со статусом 204
-    return None
\ No newline at end of file
+    return None
+
+
+@router.post(
+    "/presence/batch",
+    response_model=DriverPresenceBatchResultSchema,
+    summary="Пакетное обновление присутствия водителей от шлюза партнерского парка",
+    description="Шлюз передает позиции многих водителей одним запросом; авторизация по ключу шлюза (X-Gateway-Key).",
+)
+async def update_driver_presence_batch(
+    batch: DriverPresenceBatchSchema,
+    gateway_id: str = Depends(get_fleet_gateway_id),
+    redis_client: Redis = Depends(get_redis_client),
+):
+    """
+    Применяет пакет обновлений присутствия одним pipeline Redis.
+
+    - **batch**: Компактный массив [driver_id, status, x, y, ts].
+    - **gateway_id**: ID шлюза, определенный по ключу из заголовка X-Gateway-Key.
+    - **redis_client**: Асинхронный клиент Redis, внедренный через зависимость.
+
+    Устаревшие по ts обновления отбрасываются, обновления водителей чужого парка
+    отклоняются (FORBIDDEN); результат возвращается для каждого элемента.
+    """
+    service = DriverProfileService(redis_client)
+    results = await service.update_presence_batch(batch.items, source=gateway_id, gateway_id=gateway_id)
+    return DriverPresenceBatchResultSchema(results=results)
+
+
+@router.get(
+    "/nearby",
+    response_model=NearbyDriversSchema,
+    summary="Свободные водители рядом с точкой",
+    description="Позиции онлайн-водителей для карты пассажира; ответ собирается из снимков тайлов, "
+                "которые пересчитываются не чаще раза в NEARBY_SNAPSHOT_TTL_MS.",
+)
+async def get_nearby_drivers(
+    x: int = Query(..., ge=0, lt=settings.CITY_GRID_N, description="Координата X точки"),
+    y: int = Query(..., ge=0, lt=settings.CITY_GRID_M, description="Координата Y точки"),
+    radius: int = Query(5, ge=0, le=settings.NEARBY_MAX_RADIUS, description="Манхэттенский радиус (клеток)"),
+    user_id: int = Depends(get_current_user_id),
+    nearby_cache: NearbyDriversCache = Depends(get_nearby_drivers_cache),
+):
+    """
+    Возвращает позиции водителей на линии в радиусе `radius` от (x, y).
+
+    - **user_id**: ID пользователя из токена; эндпоинт доступен любому авторизованному пользователю.
+    - **nearby_cache**: Общий для процесса кэш снимков по тайлам.
+    """
+    return NearbyDriversSchema(drivers=await nearby_cache.nearby(x, y, radius))
@@ -1,10 +1,16 @@
 """API эндпоинт для WebSocket-уведомлений."""
 
 import logging
+from typing import Optional
+
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from redis.asyncio import Redis
 
+from src.core.redis import get_redis_client
+from src.services.driver_frames import DriverFrameHandler
 from src.services.notification_service import notification_manager
-from .dependencies import get_current_user_id_websocket
+from src.services.presence_buffer import PresenceBuffer
+from .dependencies import get_current_user_id_websocket, get_presence_buffer
 
 router = APIRouter(prefix="/notifications", tags=["Notifications"])
 logger = logging.getLogger(__name__)
@@ -13,7 +19,9 @@ logger = logging.getLogger(__name__)
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
-    user_id: int = Depends(get_current_user_id_websocket)
+    user_id: int = Depends(get_current_user_id_websocket),
+    redis_client: Redis = Depends(get_redis_client),
+    presence_buffer: Optional[PresenceBuffer] = Depends(get_presence_buffer),
 ):
     """
     Основной эндпоинт для WebSocket-соединений.
@@ -22,16 +30,22 @@ async def websocket_endpoint(
     ws://<host>/api/v1/notifications/ws?token=<jwt_token>
 
     Принимает соединение и держит его открытым, пока клиент не отключится.
+    Кроме "ping", принимает JSON-кадры водителя (см. DriverInboundFrame):
+    heartbeat ("presence"), принятие ("accept") и отказ ("decline") от предложения.
+    Пользователь аутентифицирован при подключении, поэтому кадры обрабатываются без повторной проверки токена.
     """
     await notification_manager.connect(user_id, websocket)
+    frame_handler = DriverFrameHandler(user_id, redis_client, presence_buffer=presence_buffer)
     try:
         while True:
-            # Просто держим соединение открытым, ожидая данных от клиента.
             data = await websocket.receive_text()
             logger.debug(f"Получено сообщение от пользователя {user_id}: {data}")
 
             if data == "ping":
                 await websocket.send_text("pong")
+                continue
+
+            await websocket.send_json(await frame_handler.handle(data))
 
     except WebSocketDisconnect:
         logger.info(f"Клиент {user_id} отключился.")
@@ -19,6 +19,7 @@ from src.api.v1.dependencies import get_current_user_id
 from src.services.rides_service import (
     create_ride as create_ride_service,
     assign_driver as assign_driver_service,
+    decline_ride as decline_ride_service,
     update_ride_status as update_status_service,
     get_user_rides as get_user_rides_service,
 )
@@ -63,6 +64,15 @@ async def accept_ride(
         raise HTTPException(status_code=500, detail=str(exc))
 
 
+# POST /rides/{id}/decline — водитель отказывается от предложения
+@router.post("/{ride_id}/decline", status_code=status.HTTP_204_NO_CONTENT)
+async def decline_ride(
+    ride_id: int,
+    current_user_id: int = Depends(get_current_user_id),
+):
+    await decline_ride_service(ride_id=str(ride_id), driver_user_id=current_user_id)
+
+
 # PUT /rides/{id}/status — обновление статуса (оба могут)
 @router.put("/{ride_id}/status", response_model=RideResponseSchema)
 async def update_ride_status(
@@ -3,6 +3,7 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import ConfigDict
 from dotenv import load_dotenv
+from typing import Optional
 import os
 
 load_dotenv()
@@ -49,6 +50,83 @@ class Settings(BaseSettings):
     PRICE_PER_CELL: float = 5.0         # стоимость за 1 ячейку (манхэттен)
     PRICE_T_CELL: float = 10.0          # время (в секундах) на 1 ячейку
 
+    # Пакетный прием присутствия от шлюзов партнерских парков
+    FLEET_GATEWAY_KEYS: str = ""  # Ключи шлюзов: "gateway_id:key,gateway_id:key"; пусто — прием выключен
+    # Шлюз обновляет только водителей своего парка: SET fleet_drivers:{gateway_id} (DriverProfileService.add_fleet_drivers)
+    PRESENCE_BATCH_MAX_ITEMS: int = 5000  # Максимум обновлений в одном пакете
+    PRESENCE_TS_MAX_AHEAD_MS: int = 60_000  # Насколько ts обновления может опережать часы сервера (мс); дальше — INVALID
+
+    # Буфер heartbeat'ов в процессе API
+    PRESENCE_BUFFER_ENABLED: bool = False  # Объединять heartbeat'ы онлайн-водителей и писать их в Redis пачкой
+    PRESENCE_BUFFER_FLUSH_MS: int = 200  # Период сброса буфера (мс)
+    PRESENCE_BUFFER_MAX_UPDATES: int = 1000  # Сбросить буфер досрочно после стольких heartbeat'ов
+    PRESENCE_BUFFER_METRICS_HOST: str = "127.0.0.1"  # Адрес эндпоинта метрик буфера (/metrics) без аутентификации
+    PRESENCE_BUFFER_METRICS_PORT: int = 0  # Порт эндпоинта метрик буфера; 0 — выключить. Нужен отдельный порт на каждый воркер uvicorn
+
+    # Схема событий в Redis Streams (см. event_schema)
+    EVENT_SCHEMA_VERSION: int = 1  # Версия, в которой издатели пишут события (1 — JSON в поле data); 2 — только после обновления всех потребителей
+
+    # Издатель событий в Redis Streams (один на процесс)
+    PUBLISHER_MAX_BATCH: int = 256  # Максимум событий в одном pipeline XADD
+    PUBLISHER_LINGER_MS: float = 1.0  # Сколько ждать добора пачки после первого события (мс)
+    PUBLISHER_MAX_PENDING: int = 10_000  # Размер очереди; при заполнении publish ждет, publish_nowait отказывает
+
+    # Transactional outbox событий поездок
+    OUTBOX_BATCH_SIZE: int = 500  # Сколько событий релей выбирает из outbox за проход (в Redis пачками шлет StreamPublisher)
+    OUTBOX_POLL_INTERVAL: float = 0.5  # Период опроса outbox, если релей не разбужен фиксацией (сек.)
+    OUTBOX_RETENTION_SECONDS: float = 86400  # Сколько хранить отправленные события (сек.)
+    OUTBOX_PURGE_INTERVAL: float = 300  # Период удаления отправленных событий старше окна хранения (сек.); 0 — не удалять
+
+    # Водители рядом для карты пассажира (GET /drivers/nearby)
+    NEARBY_TILE_SIZE: int = 10  # Сторона тайла снимка (клеток)
+    NEARBY_SNAPSHOT_TTL_MS: int = 1000  # Снимок тайла пересчитывается не чаще раза в этот период (мс)
+    NEARBY_MAX_RADIUS: int = 20  # Максимальный радиус запроса (клеток, манхэттенский)
+
+    # Хранение локаций водителей
+    DRIVER_LOCATION_BUCKETS: int = 1024  # Число хэшей driver_locations:{bucket}; ~100 водителей на хэш держат его в компактной кодировке
+
+    # Вытеснение водителей без heartbeat
+    PRESENCE_STALE_AFTER: float = 60.0  # Через сколько секунд без heartbeat водитель считается пропавшим
+    PRESENCE_SWEEP_INTERVAL: float = 5.0  # Период вытеснения в процессе подбора (сек.); 0 — не вытеснять
+    PRESENCE_SWEEP_BATCH: int = 500  # Сколько водителей вытеснять за один вызов скрипта
+
+    # Параметры сервиса подбора водителей
+    DRIVER_LOCATOR_BACKEND: str = "cells"  # Пространственный индекс водителей: "cells" (хэши cell:X:Y) или "geo" (Redis GEO)
+    MATCHING_SEARCH_MODE: str = "script"  # "script" (Lua, один round trip), "python" или "diamond" (точный L1-поиск, Lua)
+    MATCHING_OCCUPANCY_BITMAP_ENABLED: bool = False  # Режим "diamond" и пакетный подбор читают битовые карты cell_row:X и пропускают пустые ячейки
+    MATCHING_BLOCK_INDEX_ENABLED: bool = False  # Счетчики водителей по блокам (cell_blocks:*): поиск пропускает пустые блоки целиком
+    MATCHING_BLOCK_SIZE: int = 8  # Сторона блока нижнего уровня; каждый следующий уровень крупнее во столько же раз
+    MATCHING_BLOCK_LEVELS: int = 3  # Число уровней блоков (8, 64, 512 клеток при стороне 8)
+    MATCHING_FRESHNESS_FILTER_ENABLED: bool = False  # Не блокировать водителей без heartbeat дольше PRESENCE_STALE_AFTER
+    MATCHING_LOCAL_INDEX_ENABLED: bool = False  # Поиск кандидатов по локальному зеркалу ячеек
+    MATCHING_LOCAL_INDEX_MAX_LAG: float = 2.0  # Допустимое отставание зеркала (сек.)
+    MATCHING_LOCAL_INDEX_CHECK_INTERVAL: float = 30.0  # Период сверки зеркала с Redis (сек.)
+    MATCHING_CONSUMER_NAME: Optional[str] = None  # Имя потребителя в группе (по умолчанию hostname-pid)
+    MATCHING_CONCURRENCY: int = 8  # Сколько заказов один процесс обрабатывает одновременно
+    MATCHING_PENDING_IDLE_MS: int = 60_000  # Через сколько мс неподтвержденная запись считается зависшей
+    MATCHING_PENDING_CLAIM_INTERVAL: float = 30.0  # Период XAUTOCLAIM зависших записей (сек.)
+    MATCHING_WORKER_PROCESSES: int = 1  # Число процессов run_matching_service в одной группе
+    MATCHING_BATCH_ENABLED: bool = False  # Пакетное назначение заказов вместо поштучного
+    MATCHING_BATCH_WINDOW_MS: int = 200  # Окно сбора пакета (мс)
+    MATCHING_BATCH_MAX_ORDERS: int = 50  # Максимальный размер пакета
+    MATCHING_BATCH_CANDIDATES: int = 8  # Сколько ближайших водителей рассматривать для каждого заказа
+    MATCHING_RETRY_MAX_ATTEMPTS: int = 5  # Максимум повторных поисков водителя для одного заказа
+    MATCHING_RETRY_BACKOFF_BASE: float = 1.0  # Начальная задержка повтора, если водитель не найден (сек.)
+    MATCHING_RETRY_BACKOFF_MAX: float = 30.0  # Максимальная задержка повтора (сек.)
+    MATCHING_METRICS_HOST: str = "127.0.0.1"  # Адрес эндпоинта метрик (/metrics) без аутентификации; "0.0.0.0" — открыть для сборщика извне
+    MATCHING_METRICS_PORT: int = 9108  # Порт эндпоинта метрик; 0 — выключить. При --workers N процессы занимают порты подряд
+
+    # Хранение и архивация стримов заказов и повторного поиска
+    STREAM_RETENTION_SECONDS: int = 86_400  # Сколько хранить записи в Redis; более старые выгружаются в архив (PostgreSQL)
+    STREAM_ARCHIVE_INTERVAL: float = 0.0  # Период выгрузки и обрезки стримов (сек.); 0 — выключить. Требует PostgreSQL
+    STREAM_ARCHIVE_SEGMENT_SIZE: int = 10_000  # Максимум записей в одном сегменте
+
+    # Шардирование потока заказов по регионам сетки
+    ORDER_REGION_SIZE: int = 0  # Сторона региона в клетках; 0 — один общий стрим order_events
+    MATCHING_REGIONS: str = ""  # Явный список регионов экземпляра: "0:0,0:1"; пусто — по шардам
+    MATCHING_SHARD_INDEX: int = 0  # Номер шарда экземпляра
+    MATCHING_SHARD_COUNT: int = 1  # Общее число шардов
+
     model_config = ConfigDict(
         env_file=(".env", ".env.local"),
         env_file_encoding="utf-8",
@@ -12,7 +12,13 @@ from contextvars import ContextVar
 import redis.asyncio as aioredis
 
 # Импорты ядра и настроек
+from src.core.config import settings
+from src.core.metrics import start_metrics_server
 from src.core.redis import redis_pool
+from src.services.nearby_drivers import NearbyDriversCache
+from src.services.outbox import OutboxRelay
+from src.services.presence_buffer import PresenceBuffer
+from src.services.redis_publisher import close_publisher, get_publisher
 from src.services.notification_service import notification_manager
 from src.core.logging_config import setup_logging, RequestIdFilter
 from src.core.db import engine, Base
@@ -22,6 +28,8 @@ from src.models.user import User
 from src.models.driver import Driver
 from src.models.passenger import Passenger
 from src.models.ride import Ride
+from src.models.outbox import OutboxEvent
+from src.models.stream_archive import StreamArchiveSegment
 
 # Импортируем роутеры
 from src.api.v1 import drivers as drivers_v1
@@ -79,6 +87,9 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     Жизненный цикл:
     1. Создаем таблицы в БД (вместо Alembic).
     2. Запускаем слушателя Redis.
+    3. Запускаем буфер heartbeat'ов, если он включен (PRESENCE_BUFFER_ENABLED).
+    4. Создаем общий кэш снимков водителей рядом (GET /drivers/nearby).
+    5. Запускаем релей outbox: события поездок попадают в Redis Streams только через него.
     """
     logger.info("Application startup...")
 
@@ -90,11 +101,38 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
 
     listener_task = asyncio.create_task(redis_pubsub_listener())
 
+    app.state.nearby_drivers_cache = NearbyDriversCache(aioredis.Redis(connection_pool=redis_pool))
+
+    outbox_relay = OutboxRelay(aioredis.Redis(connection_pool=redis_pool), publisher=get_publisher())
+    outbox_relay_task = asyncio.create_task(outbox_relay.run())
+
+    presence_buffer_task = None
+    metrics_server = None
+    if settings.PRESENCE_BUFFER_ENABLED:
+        app.state.presence_buffer = PresenceBuffer(aioredis.Redis(connection_pool=redis_pool))
+        presence_buffer_task = asyncio.create_task(app.state.presence_buffer.run())
+        if settings.PRESENCE_BUFFER_METRICS_PORT:
+            # Метрики буфера — на отдельном внутреннем порту, а не на публичном API
+            metrics_server = await start_metrics_server(
+                app.state.presence_buffer.metrics,
+                settings.PRESENCE_BUFFER_METRICS_HOST,
+                settings.PRESENCE_BUFFER_METRICS_PORT,
+            )
+
     yield
 
     logger.info("Application shutdown...")
     listener_task.cancel()
     await listener_task
+    outbox_relay.stop()
+    await outbox_relay_task
+    await close_publisher()
+    if presence_buffer_task is not None:
+        # Записываем в Redis heartbeat'ы, оставшиеся в буфере
+        await app.state.presence_buffer.stop()
+        await presence_buffer_task
+    if metrics_server is not None:
+        metrics_server.close()
     await redis_pool.disconnect()
     logger.info("Redis pool disconnected.")
 
@@ -143,4 +181,4 @@ app.include_router(rides_v1.router, prefix="/api/v1", tags=["Rides"])
 
 @app.get("/healthcheck", tags=["Healthcheck"])
 async def healthcheck():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
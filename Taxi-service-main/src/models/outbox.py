@@ -0,0 +1,52 @@
+"""
+SQLAlchemy-модель исходящего события (transactional outbox).
+Событие пишется в той же транзакции, что и изменение поездки, а в Redis Streams
+его переносит OutboxRelay.
+"""
+
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import (
+    BigInteger,
+    String,
+    Text,
+    DateTime,
+    Index,
+)
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from src.core.db import Base
+
+
+class OutboxEvent(Base):
+    """
+    Событие, ожидающее публикации в стрим Redis.
+    Пока sent_at пуст, событие не опубликовано.
+    """
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # Релей выбирает неотправленные события по порядку id; частичный индекс остается маленьким
+        Index("ix_outbox_events_unsent", "id", postgresql_where="sent_at IS NULL"),
+        # Очистка отправленных событий по sent_at (OutboxRelay.purge_sent)
+        Index("ix_outbox_events_sent_at", "sent_at", postgresql_where="sent_at IS NOT NULL"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+
+    stream: Mapped[str] = mapped_column(String(64), nullable=False)
+    event: Mapped[str] = mapped_column(String(64), nullable=False)
+    # Полезная нагрузка в JSON; релей записывает ее в стрим в формате event_schema
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<OutboxEvent id={self.id} event={self.event} stream={self.stream} sent={self.sent_at is not None}>"
@@ -0,0 +1,59 @@
+"""
+SQLAlchemy-модель сегмента архива стримов событий.
+Сегменты пишет StreamArchiver перед обрезкой стрима в Redis; таблица общая
+для всех экземпляров сервиса подбора, поэтому история читается с любого узла.
+"""
+
+from __future__ import annotations
+from datetime import datetime
+
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    String,
+    LargeBinary,
+    DateTime,
+    Index,
+    UniqueConstraint,
+)
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from src.core.db import Base
+
+
+class StreamArchiveSegment(Base):
+    """
+    Сегмент архива: подряд идущие записи одного стрима с ID от first до last включительно.
+    ID записи стрима "ms-seq" хранится двумя числами, чтобы сравнивать диапазоны в SQL.
+    """
+    __tablename__ = "stream_archive_segments"
+    __table_args__ = (
+        # Два архиватора не выгрузят один и тот же участок стрима дважды
+        UniqueConstraint("stream", "first_ms", "first_seq", name="uq_stream_archive_segments_first"),
+        # Последний выгруженный ID стрима и поиск сегментов по диапазону
+        Index("ix_stream_archive_segments_last", "stream", "last_ms", "last_seq"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+
+    stream: Mapped[str] = mapped_column(String(64), nullable=False)
+    first_ms: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    first_seq: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    last_ms: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    last_seq: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    entry_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Записи в gzip JSON Lines: {"id": ..., "fields": {...}} на строку
+    entries: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"<StreamArchiveSegment stream={self.stream} "
+            f"{self.first_ms}-{self.first_seq}..{self.last_ms}-{self.last_seq} entries={self.entry_count}>"
+        )
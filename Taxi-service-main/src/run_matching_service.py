@@ -1,21 +1,33 @@
 """
 Точка входа для запуска фонового сервиса DriverMatchingService.
+
+Несколько процессов (в том числе на разных узлах) могут работать одновременно:
+все они читают поток заказов в одной группе потребителей `matching_group`.
+Число локальных процессов задается флагом --workers или MATCHING_WORKER_PROCESSES.
 """
+import argparse
 import asyncio
+import multiprocessing
 import signal
 import platform
 
+from src.core.config import settings
 from src.core.redis import redis_pool
 from src.services.matching_service import DriverMatchingService
 import redis.asyncio as aioredis
 
 
-async def main():
+async def main(worker_index: int = 0):
     """
     Инициализирует и запускает сервис, обрабатывает корректное завершение.
+
+    Args:
+        worker_index: Номер локального процесса; эндпоинт метрик слушает порт MATCHING_METRICS_PORT + worker_index.
     """
     redis_client = aioredis.Redis(connection_pool=redis_pool)
     service = DriverMatchingService(redis=redis_client)
+    if service.metrics_port:
+        service.metrics_port += worker_index
 
     # Создаем задачу для запуска сервиса, чтобы мы могли ее отменить
     service_task = asyncio.create_task(service.run())
@@ -25,7 +37,7 @@ async def main():
         loop = asyncio.get_running_loop()
         for sig in (signal.SIGINT, signal.SIGTERM):
             loop.add_signal_handler(sig, lambda: service_task.cancel())
-    
+
     # Ожидаем завершения задачи.
     try:
         await service_task
@@ -36,8 +48,57 @@ async def main():
         print("Matching service stopped and Redis pool disconnected.")
 
 
-if __name__ == "__main__":
+def _run_worker(worker_index: int):
+    """Точка входа дочернего процесса."""
     try:
-        asyncio.run(main())
+        asyncio.run(main(worker_index))
     except KeyboardInterrupt:
-        print("\nПроцесс прерван пользователем (KeyboardInterrupt).")
\ No newline at end of file
+        pass
+
+
+def run_workers(num_workers: int):
+    """
+    Запускает `num_workers` процессов сервиса и ждет их завершения.
+    Каждый процесс получает собственное имя потребителя (hostname-pid).
+    """
+    processes = [
+        multiprocessing.Process(target=_run_worker, args=(i,), name=f"matching-worker-{i}")
+        for i in range(num_workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # SIGTERM родителю пересылаем дочерним процессам для корректного завершения
+    if platform.system() != "Windows":
+        signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in processes])
+    print(f"Запущено {num_workers} процессов сервиса подбора.")
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Запуск DriverMatchingService")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.MATCHING_WORKER_PROCESSES,
+        help="Количество процессов сервиса в одной группе потребителей",
+    )
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        if settings.MATCHING_CONSUMER_NAME:
+            parser.error("MATCHING_CONSUMER_NAME нельзя задавать при --workers > 1: имена потребителей должны различаться.")
+        run_workers(args.workers)
+    else:
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            print("\nПроцесс прерван пользователем (KeyboardInterrupt).")
@@ -1,7 +1,9 @@
 """Pydantic схемы для сущностей, связанных с водителем."""
 
 from enum import Enum
-from pydantic import BaseModel, Field, conint
+from typing import Annotated, Literal, Union
+
+from pydantic import BaseModel, Field, TypeAdapter, conint
 
 from src.core.config import settings
 
@@ -45,4 +47,73 @@ class DriverPresenceSchema(BaseModel):
     location: DriverLocationSchema = Field(
         ...,
         description="Текущее местоположение водителя."
-    )
\ No newline at end of file
+    )
+
+class PresenceUpdateResult(str, Enum):
+    """
+    Результат применения одного обновления присутствия.
+
+    - APPLIED: Присутствие изменено.
+    - UNCHANGED: Водитель уже в этой клетке (или уже снят с карты), запись не потребовалась.
+    - STALE: Обновление старше последнего примененного для водителя и отброшено.
+    - INVALID: Координаты вне сетки города или ts дальше PRESENCE_TS_MAX_AHEAD_MS в будущем.
+    - FORBIDDEN: Водитель не закреплен за шлюзом, приславшим пакет.
+    """
+    APPLIED = "applied"
+    UNCHANGED = "unchanged"
+    STALE = "stale"
+    INVALID = "invalid"
+    FORBIDDEN = "forbidden"
+
+
+class DriverPresenceBatchSchema(BaseModel):
+    """
+    Схема пакета обновлений присутствия от шлюза партнерского парка.
+    Используется в теле запроса POST /api/v1/drivers/presence/batch.
+    """
+    items: list[tuple[int, DriverStatus, int, int, int]] = Field(
+        ...,
+        max_length=settings.PRESENCE_BATCH_MAX_ITEMS,
+        description="Обновления в компактном виде: [driver_id, status, x, y, ts], ts — время на устройстве в мс.",
+    )
+
+
+class DriverPresenceBatchResultSchema(BaseModel):
+    """Результаты применения пакета: по одному на каждый элемент `items`, в том же порядке."""
+    results: list[PresenceUpdateResult]
+
+
+class NearbyDriversSchema(BaseModel):
+    """
+    Свободные водители рядом с точкой для карты пассажира.
+    Используется в ответе GET /api/v1/drivers/nearby.
+    """
+    drivers: list[tuple[int, int]] = Field(
+        ...,
+        description="Позиции водителей в компактном виде: [x, y]. Данные могут отставать на NEARBY_SNAPSHOT_TTL_MS.",
+    )
+
+
+class DriverPresenceFrame(DriverPresenceSchema):
+    """Входящий WebSocket-кадр heartbeat: {"type": "presence", "status": ..., "location": {"x": ..., "y": ...}}."""
+    type: Literal["presence"]
+
+
+class RideAcceptFrame(BaseModel):
+    """Входящий WebSocket-кадр принятия предложения: {"type": "accept", "ride_id": ...}."""
+    type: Literal["accept"]
+    ride_id: int
+
+
+class RideDeclineFrame(BaseModel):
+    """Входящий WebSocket-кадр отказа от предложения: {"type": "decline", "ride_id": ...}."""
+    type: Literal["decline"]
+    ride_id: int
+
+
+# Входящие кадры водителя в /api/v1/notifications/ws, различаются по полю `type`
+DriverInboundFrame = Annotated[
+    Union[DriverPresenceFrame, RideAcceptFrame, RideDeclineFrame],
+    Field(discriminator="type"),
+]
+driver_inbound_frame_adapter = TypeAdapter(DriverInboundFrame)
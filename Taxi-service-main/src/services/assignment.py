@@ -0,0 +1,121 @@
+"""
+Алгоритмы назначения заказов водителям для пакетного режима подбора.
+
+- solve_min_cost_assignment: оптимальное назначение (венгерский алгоритм) по матрице стоимостей.
+- greedy_assignment: жадное назначение в порядке поступления заказов (для сравнения).
+"""
+
+import math
+from typing import Optional, Sequence
+
+INF = math.inf
+
+
+def solve_min_cost_assignment(cost: Sequence[Sequence[float]]) -> list[Optional[int]]:
+    """
+    Находит назначение строк (заказов) столбцам (водителям) с минимальной суммарной стоимостью.
+
+    Недопустимые пары задаются стоимостью INF. Каждой строке назначается не более
+    одного столбца и наоборот. Сложность O(n^2 * m) для n <= m.
+
+    Args:
+        cost: Матрица стоимостей n x m.
+
+    Returns:
+        Для каждой строки — индекс назначенного столбца или None.
+    """
+    n = len(cost)
+    m = len(cost[0]) if n else 0
+    if n == 0 or m == 0:
+        return [None] * n
+
+    # Алгоритм требует n <= m: иначе решаем транспонированную задачу
+    if n > m:
+        transposed = [[cost[i][j] for i in range(n)] for j in range(m)]
+        column_rows = solve_min_cost_assignment(transposed)
+        result: list[Optional[int]] = [None] * n
+        for j, i in enumerate(column_rows):
+            if i is not None:
+                result[i] = j
+        return result
+
+    # Недопустимые пары заменяем большой конечной стоимостью, чтобы потенциалы оставались конечными
+    finite = [c for row in cost for c in row if c != INF]
+    big = (max(finite) if finite else 0.0) * (n + 1) + 1.0
+
+    def c(i: int, j: int) -> float:
+        value = cost[i][j]
+        return big if value == INF else value
+
+    # Венгерский алгоритм с потенциалами (индексация с 1, столбец 0 — фиктивный)
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [INF] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta = INF
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = c(i0 - 1, j - 1) - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+
+    result = [None] * n
+    for j in range(1, m + 1):
+        i = p[j]
+        if i and cost[i - 1][j - 1] != INF:
+            result[i - 1] = j - 1
+    return result
+
+
+def greedy_assignment(cost: Sequence[Sequence[float]]) -> list[Optional[int]]:
+    """
+    Жадное назначение: строки по порядку берут ближайший свободный столбец
+    (при равенстве — с меньшим индексом), как при поштучном подборе.
+    """
+    taken: set[int] = set()
+    result: list[Optional[int]] = []
+    for row in cost:
+        best = None
+        for j, value in enumerate(row):
+            if value == INF or j in taken:
+                continue
+            if best is None or value < row[best]:
+                best = j
+        if best is not None:
+            taken.add(best)
+        result.append(best)
+    return result
+
+
+def assignment_cost(cost: Sequence[Sequence[float]], assignment: Sequence[Optional[int]]) -> tuple[int, float]:
+    """Возвращает (число назначенных строк, суммарная стоимость) для назначения."""
+    matched = [(i, j) for i, j in enumerate(assignment) if j is not None]
+    return len(matched), sum(cost[i][j] for i, j in matched)
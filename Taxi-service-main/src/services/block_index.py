@@ -0,0 +1,206 @@
+"""
+Иерархический индекс числа водителей по блокам сетки (от крупных блоков к мелким).
+
+Уровень i делит сетку на квадратные блоки со стороной BLOCK_SIZE ** (i + 1) клеток
+(по умолчанию 8, 64, 512). Для уровня хранится хэш `cell_blocks:{сторона}`
+{"bx:by": число водителей}, в котором есть только непустые блоки, поэтому память
+растет с числом водителей, а не с площадью сетки. Счетчики меняются атомарно вместе
+с хэшем ячейки (UPDATE_CELL_MEMBER) при каждом обновлении присутствия.
+
+Поиск ближайших водителей идет от непустых блоков верхнего уровня вниз: блоки
+раскрываются в порядке нижней оценки манхэттенского расстояния до них, пустые
+блоки не читаются вовсе. Поэтому радиус поиска определяется плотностью: в плотном
+районе поиск заканчивается в первом же блоке, а пустой район пропускается целиком,
+сколько бы колец он ни занимал.
+"""
+
+import heapq
+import logging
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from src.services.redis_scripts import UPDATE_CELL_MEMBER
+
+logger = logging.getLogger(__name__)
+
+BLOCK_KEY_PREFIX = "cell_blocks"
+SCAN_BATCH_SIZE = 1000
+
+_BLOCK, _DRIVER = 0, 1  # Блоки раскрываются раньше водителей на той же оценке расстояния
+
+
+class BlockCountIndex:
+    """Счетчики водителей в блоках нескольких уровней и поиск по ним."""
+
+    def __init__(self, redis: Redis, grid_n: int, grid_m: int, block_size: int = 8, levels: int = 3):
+        if block_size < 2 or levels < 1:
+            raise ValueError("Сторона блока должна быть не меньше 2, а число уровней — не меньше 1")
+        self.redis = redis
+        self.grid_n = grid_n
+        self.grid_m = grid_m
+        self.sizes = [block_size ** (level + 1) for level in range(levels)]  # от мелких к крупным
+        self._update_member_script = redis.register_script(UPDATE_CELL_MEMBER)
+
+    def block_key(self, level: int) -> str:
+        """Ключ хэша счетчиков уровня `level`."""
+        return f"{BLOCK_KEY_PREFIX}:{self.sizes[level]}"
+
+    def _block_fields(self, x: int, y: int) -> list[str]:
+        return [f"{x // size}:{y // size}" for size in self.sizes]
+
+    async def add(self, pipe, driver_id: int, x: int, y: int, value: str = "online") -> None:
+        """Добавляет в pipeline HSET в `cell:x:y` с увеличением счетчиков блоков."""
+        await self._update_member_script(
+            keys=[f"cell:{x}:{y}", *(self.block_key(level) for level in range(len(self.sizes)))],
+            args=["add", driver_id, value, *self._block_fields(x, y)],
+            client=pipe,
+        )
+
+    async def remove(self, pipe, driver_id: int, x: int, y: int) -> None:
+        """Добавляет в pipeline HDEL из `cell:x:y` с уменьшением счетчиков блоков."""
+        await self._update_member_script(
+            keys=[f"cell:{x}:{y}", *(self.block_key(level) for level in range(len(self.sizes)))],
+            args=["del", driver_id, "", *self._block_fields(x, y)],
+            client=pipe,
+        )
+
+    def _bounds(self, level: int, bx: int, by: int) -> tuple[int, int, int, int]:
+        size = self.sizes[level]
+        return (
+            bx * size,
+            by * size,
+            min((bx + 1) * size, self.grid_n) - 1,
+            min((by + 1) * size, self.grid_m) - 1,
+        )
+
+    @staticmethod
+    def _lower_bound(x: int, y: int, bounds: tuple[int, int, int, int]) -> int:
+        """Манхэттенское расстояние от точки до ближайшей клетки прямоугольника."""
+        x_min, y_min, x_max, y_max = bounds
+        return max(x_min - x, 0, x - x_max) + max(y_min - y, 0, y - y_max)
+
+    async def nearest(
+        self, x: int, y: int, k: int, max_radius: int, excluded: frozenset[int] = frozenset()
+    ) -> list[tuple[int, int]]:
+        """
+        Возвращает до `k` ближайших водителей в пределах манхэттенского радиуса `max_radius`.
+
+        Все блоки с одинаковой нижней оценкой раскрываются одним pipeline.
+
+        Returns:
+            Список (ID водителя, расстояние), отсортированный по расстоянию и ID.
+        """
+        top = len(self.sizes) - 1
+        heap: list[tuple[int, int, int, int, int]] = []
+        for field in await self.redis.hkeys(self.block_key(top)):
+            bx, by = (int(v) for v in field.split(":"))
+            distance = self._lower_bound(x, y, self._bounds(top, bx, by))
+            if distance <= max_radius:
+                heap.append((distance, _BLOCK, top, bx, by))
+        heapq.heapify(heap)
+
+        found: list[tuple[int, int]] = []
+        while heap and len(found) < k:
+            distance, kind = heap[0][0], heap[0][1]
+            if kind == _DRIVER:
+                _, _, driver_id, _, _ = heapq.heappop(heap)
+                found.append((driver_id, distance))
+                continue
+
+            batch = []
+            while heap and heap[0][0] == distance and heap[0][1] == _BLOCK:
+                batch.append(heapq.heappop(heap))
+            for entry in await self._expand(x, y, max_radius, excluded, batch):
+                heapq.heappush(heap, entry)
+        return found
+
+    async def _expand(
+        self,
+        x: int,
+        y: int,
+        max_radius: int,
+        excluded: frozenset[int],
+        blocks: list[tuple[int, int, int, int, int]],
+    ) -> list[tuple[int, int, int, int, int]]:
+        """Читает содержимое блоков одним pipeline: счетчики дочерних блоков или водителей в клетках."""
+        pipe = self.redis.pipeline(transaction=False)
+        requests = []
+        for _, _, level, bx, by in blocks:
+            x_min, y_min, x_max, y_max = self._bounds(level, bx, by)
+            if level == 0:
+                cells = [(cx, cy) for cx in range(x_min, x_max + 1) for cy in range(y_min, y_max + 1)]
+                cells = [(cx, cy) for cx, cy in cells if abs(cx - x) + abs(cy - y) <= max_radius]
+                for cx, cy in cells:
+                    pipe.hkeys(f"cell:{cx}:{cy}")
+                requests.append((level, cells))
+            else:
+                child_size = self.sizes[level - 1]
+                children = [
+                    (cbx, cby)
+                    for cbx in range(x_min // child_size, x_max // child_size + 1)
+                    for cby in range(y_min // child_size, y_max // child_size + 1)
+                ]
+                pipe.hmget(self.block_key(level - 1), [f"{cbx}:{cby}" for cbx, cby in children])
+                requests.append((level, children))
+        results = iter(await pipe.execute())
+
+        entries = []
+        for level, items in requests:
+            if level == 0:
+                for cx, cy in items:
+                    distance = abs(cx - x) + abs(cy - y)
+                    for driver_id in next(results):
+                        if int(driver_id) not in excluded:
+                            entries.append((distance, _DRIVER, int(driver_id), 0, 0))
+                continue
+            for (cbx, cby), count in zip(items, next(results)):
+                if not count or int(count) <= 0:
+                    continue
+                distance = self._lower_bound(x, y, self._bounds(level - 1, cbx, cby))
+                if distance <= max_radius:
+                    entries.append((distance, _BLOCK, level - 1, cbx, cby))
+        return entries
+
+    async def rebuild(self) -> int:
+        """
+        Пересчитывает счетчики всех уровней по существующим хэшам `cell:*`.
+
+        Нужна один раз после включения индекса на уже заполненном геоиндексе.
+        Обновления присутствия во время пересчета могут потеряться, поэтому
+        запускать ее нужно, пока водители не меняют положение.
+
+        Returns:
+            Число водителей в индексе.
+        """
+        counts: list[dict[str, int]] = [{} for _ in self.sizes]
+        cursor = 0
+        while True:
+            cursor, keys = await self.redis.scan(cursor=cursor, match="cell:*", count=SCAN_BATCH_SIZE)
+            if keys:
+                pipe = self.redis.pipeline(transaction=False)
+                for key in keys:
+                    pipe.hlen(key)
+                for key, drivers in zip(keys, await pipe.execute()):
+                    if not drivers:
+                        continue
+                    _, cx, cy = key.split(":")
+                    for level, field in enumerate(self._block_fields(int(cx), int(cy))):
+                        counts[level][field] = counts[level].get(field, 0) + drivers
+            if cursor == 0:
+                break
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for level, level_counts in enumerate(counts):
+                pipe.delete(self.block_key(level))
+                if level_counts:
+                    pipe.hset(self.block_key(level), mapping=level_counts)
+            await pipe.execute()
+
+        total = sum(counts[0].values())
+        logger.info(f"Иерархический индекс блоков пересчитан: {total} водителей.")
+        return total
+
+    async def is_built(self) -> bool:
+        """Есть ли счетчики верхнего уровня (индекс уже заполнялся)."""
+        return bool(await self.redis.exists(self.block_key(len(self.sizes) - 1)))
@@ -0,0 +1,76 @@
+"""
+Обработка входящих WebSocket-кадров водителя.
+
+Водитель уже держит открытым /api/v1/notifications/ws, поэтому heartbeat и ответы
+на предложения принимаются по нему же: соединение аутентифицировано один раз при
+подключении, и каждый кадр сразу передается в DriverProfileService или сервис поездок
+без HTTP-запроса, декодирования JWT и поиска пользователя в БД.
+"""
+
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.db import async_session_maker
+from src.schemas.driver import DriverPresenceFrame, RideAcceptFrame, driver_inbound_frame_adapter
+from src.services.driver_profile_service import DriverProfileService
+from src.services.presence_buffer import PresenceBuffer
+from src.services.rides_service import assign_driver, decline_ride
+
+logger = logging.getLogger(__name__)
+
+
+class DriverFrameHandler:
+    """
+    Обрабатывает кадры одного WebSocket-соединения водителя.
+
+    На каждый кадр возвращается ответ для отправки клиенту:
+    {"type": "<тип>_ack", ...} при успехе или {"type": "error", "ref": "<тип>", "detail": ...}.
+    Если heartbeat отложен в буфер процесса, presence_ack содержит "changed": null.
+    """
+
+    def __init__(
+        self,
+        driver_id: int,
+        redis: Redis,
+        session_factory: Callable[[], AsyncSession] = async_session_maker,
+        presence_buffer: Optional[PresenceBuffer] = None,
+    ):
+        self.driver_id = driver_id
+        self.redis = redis
+        self.session_factory = session_factory  # Сессия БД открывается только для accept
+        self.profile_service = DriverProfileService(redis)
+        self.presence_buffer = presence_buffer
+
+    async def handle(self, raw: str) -> Dict[str, Any]:
+        """Разбирает кадр, выполняет команду и возвращает ответ."""
+        try:
+            frame = driver_inbound_frame_adapter.validate_json(raw)
+        except ValidationError as e:
+            return {"type": "error", "ref": None, "detail": e.errors(include_url=False, include_context=False)}
+
+        try:
+            if isinstance(frame, DriverPresenceFrame):
+                if self.presence_buffer is not None:
+                    changed = await self.presence_buffer.submit(self.driver_id, frame)
+                else:
+                    changed = await self.profile_service.update_presence(self.driver_id, frame)
+                return {"type": "presence_ack", "changed": changed}
+
+            if isinstance(frame, RideAcceptFrame):
+                async with self.session_factory() as db:
+                    ride = await assign_driver(str(frame.ride_id), self.driver_id, db)
+                return {"type": "accept_ack", "ride": ride.model_dump(mode="json")}
+
+            await decline_ride(str(frame.ride_id), self.driver_id, redis=self.redis)
+            return {"type": "decline_ack", "ride_id": frame.ride_id}
+
+        except HTTPException as e:
+            return {"type": "error", "ref": frame.type, "status": e.status_code, "detail": e.detail}
+        except Exception as e:
+            logger.error(f"Ошибка обработки кадра {frame.type} от водителя {self.driver_id}: {e}")
+            return {"type": "error", "ref": frame.type, "status": 500, "detail": "Внутренняя ошибка"}
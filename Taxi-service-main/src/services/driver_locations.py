@@ -0,0 +1,101 @@
+"""
+Хранилище текущих клеток онлайн-водителей.
+
+Локации лежат в хэшах `driver_locations:{bucket}`, где bucket = driver_id % DRIVER_LOCATION_BUCKETS,
+а значение — упакованное целое x * PACK_BASE + y. При ~100 водителях на хэш Redis хранит
+его компактно (listpack) и без накладных расходов на отдельный ключ на водителя, а позиции
+многих водителей читаются одним pipeline HMGET по хэшам.
+
+Запись выполняют только Lua-скрипты присутствия (UPDATE_DRIVER_PRESENCE, EVICT_STALE_DRIVERS);
+на время перехода они читают и старые ключи `driver_location:{id}` (см. migrate_legacy_keys).
+"""
+
+import logging
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from redis.asyncio import Redis
+
+from src.core.config import settings
+from src.services.redis_scripts import MIGRATE_DRIVER_LOCATIONS
+
+logger = logging.getLogger(__name__)
+
+
+class DriverLocationStore:
+    """Чтение локаций водителей из хэшей `driver_locations:{bucket}` и миграция старых ключей."""
+    KEY_PREFIX = "driver_locations:"
+    LEGACY_KEY_PREFIX = "driver_location:"  # Старый формат: строка "x:y" на каждого водителя
+    PACK_BASE = 65536  # Упаковка клетки: x * PACK_BASE + y (стороны сетки до 65536)
+
+    def __init__(self, redis: Redis, buckets: Optional[int] = None):
+        self.redis = redis
+        self.buckets = buckets or settings.DRIVER_LOCATION_BUCKETS
+
+    def bucket_key(self, driver_id: int) -> str:
+        return f"{self.KEY_PREFIX}{int(driver_id) % self.buckets}"
+
+    @classmethod
+    def pack(cls, x: int, y: int) -> int:
+        return x * cls.PACK_BASE + y
+
+    @classmethod
+    def unpack(cls, value) -> tuple[int, int]:
+        return divmod(int(value), cls.PACK_BASE)
+
+    def script_args(self) -> list:
+        """Параметры хранилища для скриптов присутствия: число хэшей и основание упаковки."""
+        return [self.buckets, self.PACK_BASE]
+
+    async def get(self, driver_id: int) -> Optional[tuple[int, int]]:
+        """Клетка (x, y) водителя или None, если водитель не на линии."""
+        return (await self.get_many([driver_id])).get(int(driver_id))
+
+    async def get_many(self, driver_ids: Iterable[int]) -> dict[int, tuple[int, int]]:
+        """
+        Клетки многих водителей за один round trip (HMGET по каждому затронутому хэшу).
+
+        Returns:
+            {driver_id: (x, y)} только для водителей на линии.
+        """
+        by_bucket: dict[str, list[int]] = defaultdict(list)
+        for driver_id in driver_ids:
+            by_bucket[self.bucket_key(driver_id)].append(int(driver_id))
+        if not by_bucket:
+            return {}
+
+        pipe = self.redis.pipeline(transaction=False)
+        for key, ids in by_bucket.items():
+            pipe.hmget(key, ids)
+        replies = await pipe.execute()
+
+        locations = {}
+        for ids, values in zip(by_bucket.values(), replies):
+            for driver_id, value in zip(ids, values):
+                if value is not None:
+                    locations[driver_id] = self.unpack(value)
+        return locations
+
+    async def migrate_legacy_keys(self, batch_size: int = 1000) -> int:
+        """
+        Переносит ключи `driver_location:{id}` ("x:y") в хэши и удаляет их (MIGRATE_DRIVER_LOCATIONS).
+
+        Безопасна при работающем сервисе: каждый ключ переносится атомарно, HSETNX не затирает
+        локацию, уже записанную скриптом присутствия, а до переноса скрипты читают старый ключ.
+
+        Returns:
+            Число перенесенных водителей.
+        """
+        migrate_script = self.redis.register_script(MIGRATE_DRIVER_LOCATIONS)
+        migrated = 0
+        batch = []
+        async for key in self.redis.scan_iter(match=f"{self.LEGACY_KEY_PREFIX}*", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                migrated += await migrate_script(keys=batch, args=self.script_args())
+                batch = []
+        if batch:
+            migrated += await migrate_script(keys=batch, args=self.script_args())
+
+        logger.info(f"Перенесено {migrated} локаций водителей в хэши {self.KEY_PREFIX}*.")
+        return migrated
@@ -0,0 +1,293 @@
+"""
+Пространственный индекс свободных водителей (DriverLocator) и его реализации.
+
+- CellHashLocator: хэши ячеек `cell:X:Y` и битовые карты занятости `cell_row:X`
+  (исходный геоиндекс; на нем же работают Lua-поиск и локальный индекс сервиса подбора),
+  при необходимости — со счетчиками блоков (BlockCountIndex) для больших сеток.
+- RedisGeoLocator: один geo-набор `drivers_geo` (GEOADD / GEOSEARCH).
+
+Реализация выбирается настройкой DRIVER_LOCATOR_BACKEND ("cells" или "geo").
+Расстояние везде манхэттенское, в клетках сетки.
+"""
+
+import math
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from src.core.config import settings
+from src.services.block_index import BlockCountIndex
+from src.services.grid_geometry import diamond_ring_cells, max_manhattan_distance
+from src.services.occupancy_bitmap import read_occupancy_window, row_key
+from src.services.redis_scripts import SYNC_CELL_OCCUPANCY
+
+
+class DriverLocator(ABC):
+    """
+    Интерфейс пространственного индекса водителей.
+
+    DriverProfileService обновляет индекс скриптами UPDATE_DRIVER_PRESENCE и EVICT_STALE_DRIVERS,
+    получая его параметры из presence_script_args. upsert/remove добавляют те же изменения
+    в переданный pipeline (массовая загрузка, бенчмарки).
+    """
+
+    name = ""
+
+    def __init__(self, redis: Redis, grid_n: int, grid_m: int):
+        self.redis = redis
+        self.grid_n = grid_n
+        self.grid_m = grid_m
+
+    @abstractmethod
+    def presence_script_args(self) -> list:
+        """Имя индекса и его параметры для скриптов присутствия (см. _PRESENCE_INDEX_FUNCTIONS)."""
+
+    @abstractmethod
+    async def upsert(self, pipe, driver_id: int, x: int, y: int, previous: Optional[tuple[int, int]]) -> None:
+        """Добавляет в pipeline перемещение водителя в клетку (x, y); previous — его прежняя клетка."""
+
+    @abstractmethod
+    async def remove(self, pipe, driver_id: int, previous: tuple[int, int]) -> None:
+        """Добавляет в pipeline удаление водителя из индекса."""
+
+    @abstractmethod
+    async def nearest(
+        self, x: int, y: int, k: int, max_radius: int, excluded: frozenset[int] = frozenset()
+    ) -> list[tuple[int, int]]:
+        """
+        Возвращает до `k` ближайших водителей в пределах манхэттенского радиуса `max_radius`.
+
+        Returns:
+            Список (ID водителя, расстояние), отсортированный по расстоянию и ID.
+        """
+
+    @abstractmethod
+    async def count_in_box(self, x_min: int, y_min: int, x_max: int, y_max: int) -> int:
+        """Число водителей в прямоугольнике клеток [x_min, x_max] x [y_min, y_max] (включительно)."""
+
+    @abstractmethod
+    async def drivers_in_box(self, x_min: int, y_min: int, x_max: int, y_max: int) -> list[tuple[int, int, int]]:
+        """Водители в прямоугольнике клеток [x_min, x_max] x [y_min, y_max] (включительно): (ID, x, y)."""
+
+
+class CellHashLocator(DriverLocator):
+    """
+    Хэши `cell:X:Y` {driver_id: статус} и битовые карты занятости строк.
+
+    Если задан `block_index`, вместе с хэшами ячеек обновляются счетчики блоков,
+    а nearest идет по ним от крупных блоков к мелким вместо обхода ромбов.
+    """
+
+    name = "cells"
+
+    def __init__(
+        self,
+        redis: Redis,
+        grid_n: int,
+        grid_m: int,
+        use_bitmap: bool = False,
+        block_index: Optional[BlockCountIndex] = None,
+    ):
+        super().__init__(redis, grid_n, grid_m)
+        self.use_bitmap = use_bitmap  # Читать битовые карты перед HKEYS/HLEN
+        self.block_index = block_index
+        self._sync_cell_script = redis.register_script(SYNC_CELL_OCCUPANCY)
+
+    def presence_script_args(self) -> list:
+        return [self.name, *(self.block_index.sizes if self.block_index is not None else ())]
+
+    async def upsert(self, pipe, driver_id: int, x: int, y: int, previous: Optional[tuple[int, int]]) -> None:
+        if previous:
+            await self.remove(pipe, driver_id, previous)
+        if self.block_index is not None:
+            await self.block_index.add(pipe, driver_id, x, y)
+        else:
+            pipe.hset(f"cell:{x}:{y}", str(driver_id), "online")
+        pipe.setbit(row_key(x), y, 1)
+
+    async def remove(self, pipe, driver_id: int, previous: tuple[int, int]) -> None:
+        prev_x, prev_y = previous
+        cell_key = f"cell:{prev_x}:{prev_y}"
+        if self.block_index is not None:
+            await self.block_index.remove(pipe, driver_id, prev_x, prev_y)
+        else:
+            pipe.hdel(cell_key, str(driver_id))
+        await self._sync_cell_script(keys=[cell_key, row_key(prev_x)], args=[prev_y], client=pipe)
+
+    async def nearest(
+        self, x: int, y: int, k: int, max_radius: int, excluded: frozenset[int] = frozenset()
+    ) -> list[tuple[int, int]]:
+        if self.block_index is not None:
+            return await self.block_index.nearest(x, y, k, max_radius, excluded)
+
+        # Все ячейки L1-ромба на одном расстоянии: после ромба, на котором набралось k, можно остановиться
+        last_radius = min(max_radius, max_manhattan_distance(x, y, self.grid_n, self.grid_m))
+        occupancy = None
+        if self.use_bitmap:
+            occupancy = await read_occupancy_window(
+                self.redis,
+                max(x - last_radius, 0), min(x + last_radius, self.grid_n - 1),
+                max(y - last_radius, 0), min(y + last_radius, self.grid_m - 1),
+            )
+
+        found: list[tuple[int, int]] = []
+        for radius in range(0, last_radius + 1):
+            cells = list(diamond_ring_cells(x, y, radius, self.grid_n, self.grid_m))
+            if occupancy is not None:
+                cells = [(cx, cy) for cx, cy in cells if occupancy.is_occupied(cx, cy)]
+            if not cells:
+                continue
+            pipe = self.redis.pipeline()
+            for cx, cy in cells:
+                pipe.hkeys(f"cell:{cx}:{cy}")
+            results = await pipe.execute()
+            ring = sorted(int(d) for driver_ids in results for d in driver_ids if int(d) not in excluded)
+            found.extend((driver_id, radius) for driver_id in ring)
+            if len(found) >= k:
+                break
+        return found[:k]
+
+    async def _box_cells(self, x_min: int, y_min: int, x_max: int, y_max: int) -> list[tuple[int, int]]:
+        """Клетки прямоугольника в пределах сетки (с битовыми картами — только занятые)."""
+        x_min, y_min = max(x_min, 0), max(y_min, 0)
+        x_max, y_max = min(x_max, self.grid_n - 1), min(y_max, self.grid_m - 1)
+        if x_min > x_max or y_min > y_max:
+            return []
+
+        cells = [(cx, cy) for cx in range(x_min, x_max + 1) for cy in range(y_min, y_max + 1)]
+        if self.use_bitmap:
+            occupancy = await read_occupancy_window(self.redis, x_min, x_max, y_min, y_max)
+            cells = [(cx, cy) for cx, cy in cells if occupancy.is_occupied(cx, cy)]
+        return cells
+
+    async def count_in_box(self, x_min: int, y_min: int, x_max: int, y_max: int) -> int:
+        cells = await self._box_cells(x_min, y_min, x_max, y_max)
+        if not cells:
+            return 0
+        pipe = self.redis.pipeline()
+        for cx, cy in cells:
+            pipe.hlen(f"cell:{cx}:{cy}")
+        return sum(await pipe.execute())
+
+    async def drivers_in_box(self, x_min: int, y_min: int, x_max: int, y_max: int) -> list[tuple[int, int, int]]:
+        cells = await self._box_cells(x_min, y_min, x_max, y_max)
+        if not cells:
+            return []
+        pipe = self.redis.pipeline()
+        for cx, cy in cells:
+            pipe.hkeys(f"cell:{cx}:{cy}")
+        return [
+            (int(driver_id), cx, cy)
+            for (cx, cy), driver_ids in zip(cells, await pipe.execute())
+            for driver_id in driver_ids
+        ]
+
+
+class RedisGeoLocator(DriverLocator):
+    """
+    Geo-набор `drivers_geo`: клетка (x, y) хранится как точка (x * CELL_DEGREES, y * CELL_DEGREES).
+
+    Клетки переводятся в координаты у экватора, где градус широты и долготы
+    почти одинаковой длины; точная клетка восстанавливается округлением WITHCOORD.
+    """
+
+    name = "geo"
+    GEO_KEY = "drivers_geo"
+    CELL_DEGREES = 0.001  # Размер клетки в градусах (~111 м)
+    METERS_PER_DEGREE = 6372797.560856 * math.pi / 180  # Радиус Земли, который использует Redis GEO
+    INITIAL_RADIUS = 4  # Начальный радиус расширяющегося поиска (клеток)
+
+    def _lonlat(self, x: float, y: float) -> tuple[float, float]:
+        return x * self.CELL_DEGREES, y * self.CELL_DEGREES
+
+    def _cell(self, lon: float, lat: float) -> tuple[int, int]:
+        return round(float(lon) / self.CELL_DEGREES), round(float(lat) / self.CELL_DEGREES)
+
+    def _meters(self, cells: float) -> float:
+        return cells * self.CELL_DEGREES * self.METERS_PER_DEGREE
+
+    def presence_script_args(self) -> list:
+        return [self.name, self.GEO_KEY, self.CELL_DEGREES]
+
+    async def upsert(self, pipe, driver_id: int, x: int, y: int, previous: Optional[tuple[int, int]]) -> None:
+        lon, lat = self._lonlat(x, y)
+        pipe.geoadd(self.GEO_KEY, [lon, lat, str(driver_id)])
+
+    async def remove(self, pipe, driver_id: int, previous: tuple[int, int]) -> None:
+        pipe.zrem(self.GEO_KEY, str(driver_id))
+
+    async def _search(self, x: int, y: int, radius_cells: float) -> list[tuple[int, int, int]]:
+        """Водители в круге радиуса `radius_cells` клеток: (ID, x, y)."""
+        lon, lat = self._lonlat(x, y)
+        results = await self.redis.execute_command(
+            "GEOSEARCH", self.GEO_KEY, "FROMLONLAT", lon, lat,
+            "BYRADIUS", self._meters(radius_cells), "m", "WITHCOORD",
+        )
+        return [(int(member), *self._cell(*coord)) for member, coord in results]
+
+    async def nearest(
+        self, x: int, y: int, k: int, max_radius: int, excluded: frozenset[int] = frozenset()
+    ) -> list[tuple[int, int]]:
+        # L1-ромб радиуса r вписан в круг радиуса r, поэтому круг (а не описанный квадрат BYBOX)
+        # — минимальная область, гарантирующая всех водителей на расстоянии <= r
+        radius = min(self.INITIAL_RADIUS, max_radius)
+        while True:
+            found = sorted(
+                (distance, driver_id)
+                for driver_id, dx, dy in await self._search(x, y, radius + 0.5)
+                if driver_id not in excluded and (distance := abs(dx - x) + abs(dy - y)) <= radius
+            )
+            if len(found) >= k or radius >= max_radius:
+                return [(driver_id, distance) for distance, driver_id in found[:k]]
+            radius = min(radius * 2, max_radius)
+
+    async def count_in_box(self, x_min: int, y_min: int, x_max: int, y_max: int) -> int:
+        return len(await self.drivers_in_box(x_min, y_min, x_max, y_max))
+
+    async def drivers_in_box(self, x_min: int, y_min: int, x_max: int, y_max: int) -> list[tuple[int, int, int]]:
+        if x_min > x_max or y_min > y_max:
+            return []
+        lon, lat = self._lonlat((x_min + x_max) / 2, (y_min + y_max) / 2)
+        # Ширина с запасом в одну клетку; граница уточняется по восстановленным клеткам
+        results = await self.redis.execute_command(
+            "GEOSEARCH", self.GEO_KEY, "FROMLONLAT", lon, lat,
+            "BYBOX", self._meters(x_max - x_min + 2), self._meters(y_max - y_min + 2), "m", "WITHCOORD",
+        )
+        drivers = []
+        for member, coord in results:
+            cx, cy = self._cell(*coord)
+            if x_min <= cx <= x_max and y_min <= cy <= y_max:
+                drivers.append((int(member), cx, cy))
+        return drivers
+
+
+LOCATOR_BACKENDS = {
+    CellHashLocator.name: CellHashLocator,
+    RedisGeoLocator.name: RedisGeoLocator,
+}
+
+
+def create_driver_locator(redis: Redis, backend: Optional[str] = None) -> DriverLocator:
+    """Создает реализацию DriverLocator по имени (по умолчанию — из DRIVER_LOCATOR_BACKEND)."""
+    backend = backend or settings.DRIVER_LOCATOR_BACKEND
+    if backend not in LOCATOR_BACKENDS:
+        raise ValueError(f"Неизвестный DRIVER_LOCATOR_BACKEND '{backend}', допустимо: {sorted(LOCATOR_BACKENDS)}")
+    if backend == CellHashLocator.name:
+        block_index = None
+        if settings.MATCHING_BLOCK_INDEX_ENABLED:
+            block_index = BlockCountIndex(
+                redis,
+                settings.CITY_GRID_N,
+                settings.CITY_GRID_M,
+                block_size=settings.MATCHING_BLOCK_SIZE,
+                levels=settings.MATCHING_BLOCK_LEVELS,
+            )
+        return CellHashLocator(
+            redis,
+            settings.CITY_GRID_N,
+            settings.CITY_GRID_M,
+            use_bitmap=settings.MATCHING_OCCUPANCY_BITMAP_ENABLED,
+            block_index=block_index,
+        )
+    return LOCATOR_BACKENDS[backend](redis, settings.CITY_GRID_N, settings.CITY_GRID_M)
@@ -1,10 +1,15 @@
 """Сервис для управления профилем и состоянием водителя."""
 
 import logging
+import time
 from typing import Optional
 from redis.asyncio import Redis
 
-from src.schemas.driver import DriverPresenceSchema, DriverStatus
+from src.core.config import settings
+from src.schemas.driver import DriverPresenceSchema, DriverStatus, PresenceUpdateResult
+from src.services.driver_locations import DriverLocationStore
+from src.services.driver_locator import DriverLocator, create_driver_locator
+from src.services.redis_scripts import UPDATE_DRIVER_PRESENCE
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -14,68 +19,151 @@ class DriverProfileService:
     """
     Инкапсулирует бизнес-логику, связанную с состоянием водителя.
     - Обновление статуса (online/offline)
-    - Обновление местоположения в геоиндексе Redis
+    - Обновление местоположения в пространственном индексе (DriverLocator)
+    - Публикация изменений присутствия в стрим `driver_presence_events`
+    - Пакетный прием присутствия от шлюзов партнерских парков
     """
-    def __init__(self, redis: Redis):
+    PRESENCE_STREAM_KEY = "driver_presence_events"  # Стрим изменений присутствия водителей
+    PRESENCE_STREAM_MAXLEN = 100_000  # Приблизительный лимит длины стрима
+    PRESENCE_TS_KEY = "driver_presence_ts"  # Хэш {driver_id: ts последнего примененного обновления с меткой времени}
+    LAST_SEEN_KEY = "driver_last_seen"  # ZSET {driver_id: время последнего heartbeat онлайн-водителя}
+    FLEET_DRIVERS_KEY_PREFIX = "fleet_drivers:"  # SET водителей, за которых может отчитываться шлюз парка
+    _SCRIPT_RESULTS = {
+        1: PresenceUpdateResult.APPLIED,
+        0: PresenceUpdateResult.UNCHANGED,
+        -1: PresenceUpdateResult.STALE,
+    }
+
+    def __init__(self, redis: Redis, locator: Optional[DriverLocator] = None):
         self.redis = redis
+        self.locator = locator or create_driver_locator(redis)
+        self.locations = DriverLocationStore(redis)
+        self._update_presence_script = self.redis.register_script(UPDATE_DRIVER_PRESENCE)
+
+
+    async def _run_presence_script(
+        self, driver_id: int, status: DriverStatus, x: int, y: int, ts: Optional[int] = None, client=None
+    ):
+        """Вызывает UPDATE_DRIVER_PRESENCE (или добавляет вызов в pipeline `client`)."""
+        return await self._update_presence_script(
+            keys=[
+                self.locations.bucket_key(driver_id),
+                self.PRESENCE_STREAM_KEY,
+                self.PRESENCE_TS_KEY,
+                self.LAST_SEEN_KEY,
+            ],
+            args=[
+                driver_id,
+                status.value,
+                x,
+                y,
+                self.PRESENCE_STREAM_MAXLEN,
+                "" if ts is None else ts,
+                time.time(),
+                self.locations.PACK_BASE,
+                *self.locator.presence_script_args(),
+            ],
+            client=client,
+        )
+
+
+    async def update_presence(self, driver_id: int, presence_data: DriverPresenceSchema) -> bool:
+        """
+        Обновляет статус и местоположение водителя в Redis одним Lua-скриптом (UPDATE_DRIVER_PRESENCE).
+
+        Алгоритм (выполняется атомарно на стороне Redis):
+        1. Записать время heartbeat в `driver_last_seen` (для 'offline'/'busy' — удалить).
+        2. Прочитать предыдущую локацию водителя из хэша `driver_locations:{bucket}` (DriverLocationStore);
+           если водитель остался в той же клетке (или уже снят с карты), больше ничего не менять.
+        3. Удалить водителя из старой клетки пространственного индекса (DriverLocator).
+        4. Если новый статус - 'online', добавить его в новую клетку и сохранить локацию.
+        5. Если новый статус - 'offline' или 'busy', удалить информацию о его локации.
+        6. Опубликовать событие в `driver_presence_events` для локальных индексов подбора.
+
+        Returns:
+            True, если присутствие изменилось, False — если обновление ничего не поменяло.
+        """
+        logger.info(f"Обновление присутствия для водителя {driver_id}: статус {presence_data.status.value}")
 
+        location = presence_data.location
+        changed = await self._run_presence_script(driver_id, presence_data.status, location.x, location.y)
 
-    async def _get_driver_previous_location(self, driver_id: int) -> Optional[tuple[int, int]]:
-        """Вспомогательный метод для получения предыдущей локации водителя из Redis."""
-        location_str = await self.redis.get(f"driver_location:{driver_id}")
-        if location_str:
-            try:
-                x_str, y_str = location_str.split(":")
-                return int(x_str), int(y_str)
-            except (ValueError, TypeError):
-                logger.warning(
-                    f"Некорректный формат локации для водителя {driver_id} в Redis: {location_str}"
-                )
-        return None
+        if changed:
+            logger.info(f"Присутствие для водителя {driver_id} успешно обновлено в Redis.")
+        else:
+            logger.debug(f"Присутствие водителя {driver_id} не изменилось, запись пропущена.")
+        return bool(changed)
 
 
-    async def update_presence(self, driver_id: int, presence_data: DriverPresenceSchema) -> None:
-        """
-        Обновляет статус и местоположение водителя в Redis.
-
-        Алгоритм:
-        1. Получить предыдущую локацию водителя, чтобы очистить старую ячейку геоиндекса.
-        2. Если водитель был где-то на карте, удалить его ID из старой ячейки `cell:X:Y`.
-        3. Если новый статус - 'online', добавить водителя в новую ячейку геоиндекса `cell:X:Y`.
-        4. Сохранить новую локацию водителя в `driver_location:{driver_id}` для будущих обновлений.
-        5. Если новый статус - 'offline', удалить информацию о его локации.
+    def fleet_drivers_key(self, gateway_id: str) -> str:
+        return f"{self.FLEET_DRIVERS_KEY_PREFIX}{gateway_id}"
+
+
+    async def add_fleet_drivers(self, gateway_id: str, driver_ids: list[int]) -> None:
+        """Закрепляет водителей за шлюзом парка: только по ним шлюз может присылать присутствие."""
+        if driver_ids:
+            await self.redis.sadd(self.fleet_drivers_key(gateway_id), *driver_ids)
+
+
+    async def remove_fleet_drivers(self, gateway_id: str, driver_ids: list[int]) -> None:
+        """Снимает водителей со шлюза парка (водитель ушел из парка)."""
+        if driver_ids:
+            await self.redis.srem(self.fleet_drivers_key(gateway_id), *driver_ids)
+
+
+    async def update_presence_batch(
+        self,
+        items: list[tuple[int, DriverStatus, int, int, Optional[int]]],
+        source: str = "",
+        gateway_id: Optional[str] = None,
+    ) -> list[PresenceUpdateResult]:
         """
-        logger.info(f"Обновление присутствия для водителя {driver_id}: статус {presence_data.status.value}")
+        Применяет пакет обновлений (driver_id, status, x, y, ts) одним pipeline скриптов UPDATE_DRIVER_PRESENCE.
 
-        # Шаг 1: Получаем предыдущую локацию
-        previous_location = await self._get_driver_previous_location(driver_id)
-
-        # Используем Redis Pipeline для атомарного выполнения нескольких команд
-        async with self.redis.pipeline() as pipe:
-            # Шаг 2: Если водитель был на карте, удаляем его из старой ячейки
-            if previous_location:
-                prev_x, prev_y = previous_location
-                old_cell_key = f"cell:{prev_x}:{prev_y}"
-                pipe.hdel(old_cell_key, str(driver_id))
-                logger.debug(f"Водитель {driver_id} удален из старой ячейки {old_cell_key}")
-
-            # Шаги 3-5: Обрабатываем новый статус
-            new_location = presence_data.location
-            new_location_key = f"driver_location:{driver_id}"
-            new_location_str = f"{new_location.x}:{new_location.y}"
-
-            if presence_data.status == DriverStatus.ONLINE:
-                # Добавляем в новую ячейку и обновляем текущую позицию
-                new_cell_key = f"cell:{new_location.x}:{new_location.y}"
-                pipe.hset(new_cell_key, str(driver_id), presence_data.status.value)
-                pipe.set(new_location_key, new_location_str)
-                logger.debug(f"Водитель {driver_id} добавлен в ячейку {new_cell_key} и его локация обновлена")
-            else: # offline или busy
-                # Просто удаляем ключ с его локацией
-                pipe.delete(new_location_key)
-                logger.debug(f"Локация водителя {driver_id} удалена (статус offline/busy)")
-
-            # Выполняем все команды в транзакции
-            await pipe.execute()
-
-        logger.info(f"Присутствие для водителя {driver_id} успешно обновлено в Redis.")
\ No newline at end of file
+        Обновления применяются по порядку; обновление с ts не новее уже примененного
+        для того же водителя отбрасывается (в том числе внутри одного пакета).
+        Обновление с ts=None применяется без проверки порядка; обновление с ts, опережающим
+        часы сервера больше чем на PRESENCE_TS_MAX_AHEAD_MS, отклоняется как INVALID —
+        иначе оно сделало бы устаревшими все следующие обновления водителя.
+
+        Args:
+            source: Источник пакета для логов.
+            gateway_id: ID шлюза парка, приславшего пакет. Если задан, обновления водителей,
+                не закрепленных за шлюзом (add_fleet_drivers), отклоняются как FORBIDDEN.
+
+        Returns:
+            Результаты в порядке элементов пакета.
+        """
+        results: list[Optional[PresenceUpdateResult]] = [None] * len(items)
+        owned = None
+        if gateway_id is not None and items:
+            # Одна проверка членства на весь пакет вместо запроса на каждого водителя
+            driver_ids = [driver_id for driver_id, *_ in items]
+            flags = await self.redis.smismember(self.fleet_drivers_key(gateway_id), driver_ids)
+            owned = {driver_id for driver_id, flag in zip(driver_ids, flags) if flag}
+
+        max_ts = time.time() * 1000 + settings.PRESENCE_TS_MAX_AHEAD_MS
+        positions = []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for position, (driver_id, status, x, y, ts) in enumerate(items):
+                if owned is not None and driver_id not in owned:
+                    results[position] = PresenceUpdateResult.FORBIDDEN
+                    continue
+                if not (0 <= x < settings.CITY_GRID_N and 0 <= y < settings.CITY_GRID_M) or (
+                    ts is not None and ts > max_ts
+                ):
+                    results[position] = PresenceUpdateResult.INVALID
+                    continue
+                await self._run_presence_script(driver_id, status, x, y, ts, client=pipe)
+                positions.append(position)
+            replies = await pipe.execute() if positions else []
+
+        for position, reply in zip(positions, replies):
+            results[position] = self._SCRIPT_RESULTS[reply]
+        logger.info(
+            f"Пакет присутствия {source}: {len(items)} обновлений, "
+            f"применено {results.count(PresenceUpdateResult.APPLIED)}, "
+            f"устарело {results.count(PresenceUpdateResult.STALE)}, "
+            f"отклонено {results.count(PresenceUpdateResult.FORBIDDEN)}."
+        )
+        return results
@@ -0,0 +1,106 @@
+"""
+Схема событий в Redis Streams, общая для издателей и потребителей.
+
+Версия 2: поля нагрузки лежат плоско, отдельными полями записи стрима рядом
+с `v` (версия схемы) и `event` (тип события); значения — строки. Потребитель берет
+нужные ему поля прямо из записи, без разбора JSON и без копии всей нагрузки.
+
+Версия 1 (до введения схемы): {"event": тип, "data": JSON нагрузки}. Такие записи
+еще могут лежать в стримах, поэтому потребители читают обе версии, а издатели пишут
+в версии EVENT_SCHEMA_VERSION (1 — пока не обновлены все потребители).
+"""
+
+import json
+from typing import Any, Mapping, Optional
+
+from src.core.config import settings
+
+SCHEMA_VERSION = 2  # Последняя версия схемы
+VERSION_FIELD = "v"
+EVENT_FIELD = "event"
+LEGACY_DATA_FIELD = "data"  # Поле с JSON нагрузки в версии 1
+_RESERVED_FIELDS = frozenset((VERSION_FIELD, EVENT_FIELD))
+_CURRENT_VERSION = str(SCHEMA_VERSION)
+
+
+class UnsupportedEventVersion(ValueError):
+    """Запись стрима в неизвестной версии схемы (издатель новее потребителя)."""
+
+
+def _encode_value(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise TypeError(f"Поле события должно быть скаляром, получено {type(value).__name__}")
+
+
+def encode_event(event_name: str, payload: Mapping[str, Any], version: Optional[int] = None) -> dict[str, str]:
+    """
+    Поля записи стрима для события.
+
+    Args:
+        version: Версия схемы; по умолчанию — EVENT_SCHEMA_VERSION из настроек.
+            В версии 2 поля со значением None не записываются.
+
+    Raises:
+        ValueError: Поле нагрузки совпадает со служебным (`v`, `event`).
+        TypeError: Значение поля не скаляр (версия 2).
+    """
+    version = version or settings.EVENT_SCHEMA_VERSION
+    if version == 1:
+        return {EVENT_FIELD: event_name, LEGACY_DATA_FIELD: json.dumps(payload, ensure_ascii=False)}
+
+    fields = {VERSION_FIELD: _CURRENT_VERSION, EVENT_FIELD: event_name}
+    for name, value in payload.items():
+        if name in _RESERVED_FIELDS:
+            raise ValueError(f"Поле '{name}' зарезервировано схемой событий")
+        if value is not None:
+            fields[name] = _encode_value(value)
+    return fields
+
+
+def decode_event(fields: Mapping[str, Any]) -> tuple[Optional[str], dict[str, Any]]:
+    """
+    Тип события и вся нагрузка из записи любой поддерживаемой версии.
+
+    В версии 2 значения нагрузки — строки, в версии 1 — как в исходном JSON.
+
+    Raises:
+        UnsupportedEventVersion: Неизвестная версия схемы.
+        KeyError, ValueError: Запись версии 1 без корректного `data`.
+    """
+    version = fields.get(VERSION_FIELD)
+    if version is None:
+        raw_payload = fields[LEGACY_DATA_FIELD]
+        payload = json.loads(raw_payload) if isinstance(raw_payload, (str, bytes)) else raw_payload
+        if not isinstance(payload, dict):
+            raise ValueError(f"Нагрузка события версии 1 должна быть объектом, получено {type(payload).__name__}")
+        # В самых старых записях тип события есть только внутри нагрузки
+        return fields.get(EVENT_FIELD, payload.get(EVENT_FIELD)), payload
+    if version != _CURRENT_VERSION:
+        raise UnsupportedEventVersion(f"Неподдерживаемая версия схемы события: {version}")
+    return fields.get(EVENT_FIELD), {name: value for name, value in fields.items() if name not in _RESERVED_FIELDS}
+
+
+def decode_order_created(fields: Mapping[str, Any]) -> dict[str, Any]:
+    """
+    Поля OrderCreated, нужные сервису подбора.
+
+    Запись версии 2 читается напрямую по именам полей; версия 1 — через decode_event.
+
+    Raises:
+        KeyError, ValueError: Нет координат подачи или они некорректны.
+    """
+    source = fields if fields.get(VERSION_FIELD) == _CURRENT_VERSION else decode_event(fields)[1]
+    return {
+        "ride_id": str(source["ride_id"]),
+        "start_x": int(source["start_x"]),
+        "start_y": int(source["start_y"]),
+        "end_x": int(source.get("end_x", 0)),
+        "end_y": int(source.get("end_y", 0)),
+        "price": float(source.get("price", 0)),
+        "passenger_user_id": source.get("passenger_user_id", ""),
+    }
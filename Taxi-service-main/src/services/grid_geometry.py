@@ -0,0 +1,61 @@
+"""Геометрия сетки города: обход колец вокруг точки."""
+
+from typing import Callable, Iterator
+
+# Функция обхода кольца: (start_x, start_y, radius, grid_n, grid_m) -> ячейки кольца
+RingCells = Callable[[int, int, int, int, int], Iterator[tuple[int, int]]]
+
+
+def square_ring_cells(
+    start_x: int, start_y: int, radius: int, grid_n: int, grid_m: int
+) -> Iterator[tuple[int, int]]:
+    """
+    Перечисляет ячейки периметра квадрата с центром (start_x, start_y) и заданным радиусом.
+
+    Ячейки за пределами сетки [0, grid_n) x [0, grid_m) пропускаются.
+    Для radius == 0 возвращается только центральная ячейка.
+    """
+    if radius == 0:
+        cells = [(start_x, start_y)]
+    else:
+        cells = []
+        for i in range(-radius, radius + 1):
+            # Горизонтальные стороны
+            cells.append((start_x + i, start_y + radius))
+            cells.append((start_x + i, start_y - radius))
+            # Вертикальные стороны (исключая углы, чтобы не проверять дважды)
+            if abs(i) != radius:
+                cells.append((start_x + radius, start_y + i))
+                cells.append((start_x - radius, start_y + i))
+
+    for x, y in cells:
+        if 0 <= x < grid_n and 0 <= y < grid_m:
+            yield x, y
+
+
+def diamond_ring_cells(
+    start_x: int, start_y: int, radius: int, grid_n: int, grid_m: int
+) -> Iterator[tuple[int, int]]:
+    """
+    Перечисляет ячейки на манхэттенском расстоянии ровно `radius` от (start_x, start_y) (L1-ромб).
+
+    Ромб радиуса r содержит 4r ячеек против 8r у квадратного кольца, и все его
+    ячейки равноудалены от центра. Ячейки за пределами сетки не перечисляются.
+    """
+    if radius == 0:
+        if 0 <= start_x < grid_n and 0 <= start_y < grid_m:
+            yield start_x, start_y
+        return
+
+    for dx in range(max(-radius, -start_x), min(radius, grid_n - 1 - start_x) + 1):
+        x = start_x + dx
+        dy = radius - abs(dx)
+        if 0 <= start_y + dy < grid_m:
+            yield x, start_y + dy
+        if dy != 0 and 0 <= start_y - dy < grid_m:
+            yield x, start_y - dy
+
+
+def max_manhattan_distance(start_x: int, start_y: int, grid_n: int, grid_m: int) -> int:
+    """Расстояние от точки до самого дальнего угла сетки: дальше него ромбы пусты."""
+    return max(start_x, grid_n - 1 - start_x) + max(start_y, grid_m - 1 - start_y)
@@ -0,0 +1,270 @@
+"""
+Локальное (in-process) зеркало занятости ячеек геоиндекса для процесса подбора водителей.
+
+Зеркало строится при старте из хэшей `cell:X:Y` и поддерживается в актуальном
+состоянии событиями из стрима `driver_presence_events`, которые публикует
+DriverProfileService. Благодаря этому поиск кандидатов выполняется в памяти,
+а в Redis уходит только финальная блокировка `driver_lock:{id}`.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Iterator, Optional
+
+from redis.asyncio import Redis
+
+from src.services.driver_profile_service import DriverProfileService
+from src.services.grid_geometry import RingCells, square_ring_cells
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_STREAM_KEY = DriverProfileService.PRESENCE_STREAM_KEY
+
+
+class GridOccupancyIndex:
+    """
+    Массив ячеек N×M с множествами ID водителей.
+
+    Ячейка (x, y) хранится по индексу `x * grid_m + y`; пустые ячейки — None.
+    """
+
+    SCAN_BATCH_SIZE = 1000  # Сколько ключей `cell:*` читать за один проход SCAN
+    EVENTS_BATCH_SIZE = 1000  # Сколько событий присутствия читать за один XREAD
+
+    def __init__(self, redis: Redis, grid_n: int, grid_m: int, max_lag: float = 2.0):
+        self.redis = redis
+        self.grid_n = grid_n
+        self.grid_m = grid_m
+        self.max_lag = max_lag  # Максимальное отставание (сек.), после которого зеркало считается устаревшим
+        self._cells: list[Optional[set[int]]] = [None] * (grid_n * grid_m)
+        self._driver_cells: dict[int, int] = {}
+        self._last_event_id = "0-0"
+        self._synced_at: Optional[float] = None
+        self._running = False
+
+
+    @property
+    def is_fresh(self) -> bool:
+        """True, если зеркало построено и недавно синхронизировалось со стримом событий."""
+        return self._synced_at is not None and time.monotonic() - self._synced_at <= self.max_lag
+
+
+    def mark_stale(self) -> None:
+        """Помечает зеркало устаревшим: поиск уйдет в Redis до следующей перестройки."""
+        self._synced_at = None
+
+
+    def _offset(self, x: int, y: int) -> Optional[int]:
+        if 0 <= x < self.grid_n and 0 <= y < self.grid_m:
+            return x * self.grid_m + y
+        return None
+
+
+    def drivers_in_cell(self, x: int, y: int) -> set[int]:
+        """Возвращает множество водителей в ячейке (пустое, если ячейка пуста или вне сетки)."""
+        offset = self._offset(x, y)
+        if offset is None:
+            return set()
+        return self._cells[offset] or set()
+
+
+    def _remove_driver(self, driver_id: int) -> None:
+        offset = self._driver_cells.pop(driver_id, None)
+        if offset is None:
+            return
+        cell = self._cells[offset]
+        if cell is not None:
+            cell.discard(driver_id)
+            if not cell:
+                self._cells[offset] = None
+
+
+    def apply_presence(self, driver_id: int, location: Optional[tuple[int, int]]) -> None:
+        """
+        Применяет изменение присутствия: водитель теперь в ячейке `location` или снят с карты (None).
+        Операция идемпотентна, поэтому повторное применение события безопасно.
+        """
+        self._remove_driver(driver_id)
+        if location is None:
+            return
+        offset = self._offset(*location)
+        if offset is None:
+            return
+        if self._cells[offset] is None:
+            self._cells[offset] = set()
+        self._cells[offset].add(driver_id)
+        self._driver_cells[driver_id] = offset
+
+
+    async def _latest_event_id(self) -> str:
+        entries = await self.redis.xrevrange(PRESENCE_STREAM_KEY, count=1)
+        return entries[0][0] if entries else "0-0"
+
+
+    async def rebuild(self) -> None:
+        """
+        Строит зеркало заново из хэшей `cell:*`.
+
+        Позиция в стриме событий запоминается ДО чтения ячеек: события, пришедшие
+        во время перестройки, будут применены повторно, что безопасно.
+        """
+        started = time.monotonic()
+        last_event_id = await self._latest_event_id()
+
+        cells: list[Optional[set[int]]] = [None] * (self.grid_n * self.grid_m)
+        driver_cells: dict[int, int] = {}
+
+        cursor = 0
+        while True:
+            cursor, keys = await self.redis.scan(cursor=cursor, match="cell:*", count=self.SCAN_BATCH_SIZE)
+            if keys:
+                pipe = self.redis.pipeline()
+                for key in keys:
+                    pipe.hkeys(key)
+                results = await pipe.execute()
+                for key, driver_ids in zip(keys, results):
+                    try:
+                        _, x_str, y_str = key.split(":")
+                        offset = self._offset(int(x_str), int(y_str))
+                    except ValueError:
+                        continue
+                    if offset is None or not driver_ids:
+                        continue
+                    cells[offset] = {int(d) for d in driver_ids}
+                    for d in cells[offset]:
+                        driver_cells[d] = offset
+            if cursor == 0:
+                break
+
+        self._cells = cells
+        self._driver_cells = driver_cells
+        self._last_event_id = last_event_id
+        self._synced_at = time.monotonic()
+        logger.info(
+            f"Локальный индекс занятости построен: {len(driver_cells)} водителей "
+            f"за {time.monotonic() - started:.3f} с."
+        )
+
+
+    async def poll_events(self, block_ms: Optional[int] = None) -> int:
+        """
+        Читает и применяет новые события присутствия.
+
+        Returns:
+            Количество примененных событий.
+        """
+        response = await self.redis.xread(
+            {PRESENCE_STREAM_KEY: self._last_event_id}, count=self.EVENTS_BATCH_SIZE, block=block_ms
+        )
+        applied = 0
+        read = 0
+        for _, messages in response or []:
+            read += len(messages)
+            for message_id, fields in messages:
+                try:
+                    driver_id = int(fields["driver_id"])
+                    cell = fields.get("cell")
+                    location = None
+                    if cell:
+                        x_str, y_str = cell.split(":")
+                        location = (int(x_str), int(y_str))
+                except (KeyError, ValueError):
+                    logger.warning(f"Некорректное событие присутствия {message_id}: {fields}")
+                else:
+                    self.apply_presence(driver_id, location)
+                    applied += 1
+                self._last_event_id = message_id
+        # Зеркало считается синхронизированным, только если стрим прочитан до конца
+        if read < self.EVENTS_BATCH_SIZE:
+            self._synced_at = time.monotonic()
+        return applied
+
+
+    async def check_consistency(self, sample_size: int = 50) -> Optional[bool]:
+        """
+        Сверяет случайную выборку ячеек (занятых и произвольных) с Redis.
+
+        Снимок ячеек и позиция стрима читаются в одной транзакции, поэтому
+        сверка выполняется, только если зеркало догнало стрим.
+
+        Returns:
+            True/False — результат сверки; None, если зеркало отстает и сверка пропущена.
+        """
+        occupied = list(set(self._driver_cells.values()))
+        sample = random.sample(occupied, min(len(occupied), sample_size // 2))
+        sample += [random.randrange(len(self._cells)) for _ in range(sample_size - len(sample))]
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xrevrange(PRESENCE_STREAM_KEY, count=1)
+            for offset in sample:
+                x, y = divmod(offset, self.grid_m)
+                pipe.hkeys(f"cell:{x}:{y}")
+            latest, *results = await pipe.execute()
+
+        latest_id = latest[0][0] if latest else "0-0"
+        if latest_id != self._last_event_id:
+            return None
+
+        for offset, driver_ids in zip(sample, results):
+            if {int(d) for d in driver_ids} != (self._cells[offset] or set()):
+                x, y = divmod(offset, self.grid_m)
+                logger.warning(f"Локальный индекс расходится с Redis в ячейке ({x}, {y}).")
+                return False
+        return True
+
+
+    def ring_candidates(
+        self, start_x: int, start_y: int, max_radius: int, ring_cells: RingCells = square_ring_cells
+    ) -> Iterator[tuple[int, list[int]]]:
+        """
+        Перечисляет (радиус, отсортированные ID водителей) по кольцам вокруг точки.
+
+        Args:
+            ring_cells: Обход кольца — квадратный (square_ring_cells) или L1-ромб (diamond_ring_cells).
+        """
+        for radius in range(0, max_radius + 1):
+            candidates: list[int] = []
+            for x, y in ring_cells(start_x, start_y, radius, self.grid_n, self.grid_m):
+                cell = self._cells[x * self.grid_m + y]
+                if cell:
+                    candidates.extend(cell)
+            if candidates:
+                yield radius, sorted(candidates)
+
+
+    async def follow_events(self) -> None:
+        """Фоновый воркер: применяет события присутствия по мере их поступления."""
+        self._running = True
+        logger.info("Воркер синхронизации локального индекса занятости запущен.")
+        while self._running:
+            try:
+                await self.poll_events(block_ms=int(self.max_lag * 1000 / 2))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации локального индекса: {e}", exc_info=True)
+                self.mark_stale()
+                await asyncio.sleep(1)
+
+
+    async def run_consistency_checks(self, interval: float) -> None:
+        """Фоновый воркер: периодическая сверка с Redis и перестройка при расхождении или устаревании."""
+        self._running = True
+        while self._running:
+            await asyncio.sleep(interval)
+            try:
+                if not self.is_fresh or await self.check_consistency() is False:
+                    logger.warning("Локальный индекс занятости устарел, перестраиваем...")
+                    self.mark_stale()
+                    await self.rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка проверки локального индекса: {e}", exc_info=True)
+                self.mark_stale()
+
+
+    def stop(self) -> None:
+        self._running = False
@@ -0,0 +1,104 @@
+"""
+Метрики сервиса подбора водителей по этапам обработки заказа.
+
+Экспортируются в формате Prometheus HTTP-сервером процесса подбора
+(см. DriverMatchingService.run и настройки MATCHING_METRICS_*).
+"""
+
+from typing import Iterable
+
+from redis.asyncio import Redis
+
+from src.core.metrics import MetricsRegistry
+
+# Границы корзин для счетных величин за один поиск
+RING_BUCKETS = (0, 1, 2, 3, 5, 8, 12, 16, 20)
+CELL_BUCKETS = (1, 8, 25, 50, 100, 200, 400, 800, 1681)
+LOCK_ATTEMPT_BUCKETS = (0, 1, 2, 3, 5, 10, 20)
+# Время от создания заказа до предложения включает повторные поиски
+ORDER_TO_PROPOSAL_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class MatchingMetrics:
+    """Набор метрик одного процесса DriverMatchingService."""
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        r = self.registry
+        self.xreadgroup_wait = r.histogram(
+            "matching_xreadgroup_wait_seconds", "Время ожидания XREADGROUP в потоке заказов"
+        )
+        self.search_duration = r.histogram(
+            "matching_search_duration_seconds", "Длительность поиска и блокировки водителя",
+            labelnames=("mode",),
+        )
+        self.rings_scanned = r.histogram(
+            "matching_search_rings_scanned", "Число просмотренных колец за один поиск", buckets=RING_BUCKETS
+        )
+        self.cells_queried = r.histogram(
+            "matching_search_cells_queried", "Число запрошенных ячеек сетки за один поиск", buckets=CELL_BUCKETS
+        )
+        self.lock_attempts = r.histogram(
+            "matching_lock_attempts", "Число попыток SET NX до блокировки водителя (или до отказа)",
+            buckets=LOCK_ATTEMPT_BUCKETS,
+        )
+        self.publish_latency = r.histogram(
+            "matching_publish_duration_seconds", "Время отправки предложений, таймаутов и XACK одним pipeline"
+        )
+        self.order_to_proposal = r.histogram(
+            "matching_order_to_proposal_seconds", "Время от публикации заказа до отправки предложения водителю",
+            buckets=ORDER_TO_PROPOSAL_BUCKETS,
+        )
+        self.search_results = r.counter(
+            "matching_searches_total", "Число поисков водителя по результату", labelnames=("result",)
+        )
+        self.proposals = r.counter("matching_proposals_total", "Число отправленных предложений водителям")
+        self.ghost_proposals = r.counter(
+            "matching_ghost_proposals_total",
+            "Число предложений, истекших у водителей без heartbeat дольше PRESENCE_STALE_AFTER",
+        )
+        self.evicted_drivers = r.counter(
+            "presence_evicted_drivers_total", "Число водителей, вытесненных из индекса из-за отсутствия heartbeat"
+        )
+        self.archived_entries = r.counter(
+            "stream_archived_entries_total", "Число записей стримов, выгруженных в архив и обрезанных",
+            labelnames=("stream",),
+        )
+        self.group_lag = r.gauge(
+            "matching_consumer_group_lag", "Число записей стрима, еще не выданных группе (XINFO GROUPS lag)",
+            labelnames=("stream",),
+        )
+        self.group_pending = r.gauge(
+            "matching_consumer_group_pending", "Число выданных, но не подтвержденных записей группы",
+            labelnames=("stream",),
+        )
+
+    def observe_search(self, mode: str, seconds: float, rings: int, cells: int, lock_attempts: int, found: bool) -> None:
+        """Записывает результаты одного поиска водителя."""
+        self.search_duration.observe(seconds, mode=mode)
+        self.rings_scanned.observe(rings)
+        self.cells_queried.observe(cells)
+        self.lock_attempts.observe(lock_attempts)
+        self.search_results.inc(result="found" if found else "not_found")
+
+    async def collect_group_lag(self, redis: Redis, stream_keys: Iterable[str], group: str) -> None:
+        """
+        Обновляет отставание группы потребителей по XINFO GROUPS.
+
+        Поле `lag` есть начиная с Redis 7; если Redis его не сообщает, gauge не обновляется.
+        """
+        pipe = redis.pipeline(transaction=False)
+        stream_keys = list(stream_keys)
+        for stream_key in stream_keys:
+            pipe.xinfo_groups(stream_key)
+        results = await pipe.execute(raise_on_error=False)
+
+        for stream_key, groups in zip(stream_keys, results):
+            if isinstance(groups, Exception):
+                continue  # Стрим еще не создан
+            for info in groups:
+                if info.get("name") != group:
+                    continue
+                if info.get("lag") is not None:
+                    self.group_lag.set(info["lag"], stream=stream_key)
+                self.group_pending.set(info.get("pending", 0), stream=stream_key)
@@ -5,11 +5,38 @@
 
 import asyncio
 import logging
-from typing import Optional, Dict, Any
+import os
+import socket
+from typing import Callable, Optional, Dict, Any
 from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
 import json
 import time
 
+from src.core.config import settings
+from src.core.db import async_session_maker
+from src.models.ride import Ride, RideStatusEnum
+from src.services.assignment import INF, assignment_cost, greedy_assignment, solve_min_cost_assignment
+from src.services.block_index import BlockCountIndex
+from src.services.driver_locator import CellHashLocator, DriverLocator, create_driver_locator
+from src.services.driver_profile_service import DriverProfileService
+from src.services.event_schema import UnsupportedEventVersion, decode_event, decode_order_created
+from src.services.grid_geometry import diamond_ring_cells, max_manhattan_distance, square_ring_cells
+from src.core.metrics import start_metrics_server
+from src.services.grid_index import GridOccupancyIndex
+from src.services.matching_metrics import MatchingMetrics
+from src.services.occupancy_bitmap import OccupancyWindow, read_occupancy_window, sync_occupancy_bitmap
+from src.services.order_regions import owned_stream_keys
+from src.services.presence_sweeper import StaleDriverSweeper
+from src.services.stream_archive import StreamArchiver
+from src.services.redis_scripts import (
+    FIND_AND_LOCK_NEAREST_DRIVER,
+    FIND_AND_LOCK_NEAREST_DRIVER_L1,
+    LOCK_DRIVER_IF_FRESH,
+    POP_DUE_MEMBERS,
+    POP_DUE_PROPOSAL_TIMEOUTS,
+)
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -20,44 +47,123 @@ logger = logging.getLogger(__name__)
 
 class DriverMatchingService:
     """
-    Слушает поток 'order_events', ищет водителя для новых заказов
-    и инициирует процесс назначения.
+    Слушает поток 'order_events' (или стримы своих регионов при шардировании),
+    ищет водителя для новых заказов и инициирует процесс назначения.
     """
-    STREAM_KEY = "order_events"  # Ключ потока для событий заказов
+    STREAM_KEY = "order_events"  # Ключ потока для событий заказов (без шардирования)
     CONSUMER_GROUP = "matching_group"  # Имя группы потребителей
     NOTIFICATION_CHANNEL = "driver_notifications" # Имя канала для отправки уведомлений
     TIMEOUT_ZSET_KEY = "proposal_timeouts" # Ключ для отложенной очереди таймаутов
     RETRY_STREAM_KEY = "retry_search_events" # Имя стрима для повторного поиска
+    LIFECYCLE_STREAM_KEY = "ride_lifecycle_events" # Стрим DriverAssigned/RideCompleted (подбор его не читает)
+    READ_BLOCK_MS = 1000 # Максимальное ожидание XREADGROUP, чтобы цикл замечал остановку
+    TIMEOUT_BATCH_SIZE = 100 # Сколько истекших предложений обрабатывать за один вызов скрипта
+    RETRY_SCHEDULE_KEY = "retry_schedule" # ZSET отложенных повторных поисков: ride_id -> время попытки
+    RIDE_STATE_TTL = 3600 # Сколько хранить параметры заказа и исключенных водителей (сек.)
+    RIDE_STATE_FIELDS = ("ride_id", "start_x", "start_y", "end_x", "end_y", "price", "passenger_user_id", "created_ms")
+    PASSENGER_NOTIFICATION_CHANNEL = "passenger_notifications" # Канал уведомлений пассажиров
+    LOCATOR_CANDIDATES = 16 # Сколько ближайших водителей запрашивать у DriverLocator за раз
 
 
-    def __init__(self, redis: Redis):
+    def __init__(
+        self,
+        redis: Redis,
+        stream_keys: Optional[list[str]] = None,
+        locator: Optional[DriverLocator] = None,
+        session_factory: Callable[[], AsyncSession] = async_session_maker,
+    ):
         self.redis = redis
+        # БД нужна только повторному поиску: проверить, что заказ еще никто не принял
+        self.session_factory = session_factory
+        # Пространственный индекс водителей; Lua-поиск и локальный индекс обходят ячейки кольцами
+        self.locator = locator or create_driver_locator(redis)
+        # Стримы заказов, которые обслуживает экземпляр (регионы сетки, см. order_regions)
+        self.stream_keys = stream_keys or owned_stream_keys()
         self._running = False
         self.MAX_SEARCH_RADIUS = 20 # Максимальный радиус поиска водителя
         self.DRIVER_LOCK_TIMEOUT = 30 # Время блокировки водителя в секундах
         self.PROPOSAL_TIMEOUT = 25 # Время ожидания ответа водителя на предложение в секундах
+        self.search_mode = settings.MATCHING_SEARCH_MODE
+        self.consumer_name = settings.MATCHING_CONSUMER_NAME or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = settings.MATCHING_CONCURRENCY
+        self.pending_idle_ms = settings.MATCHING_PENDING_IDLE_MS
+        self.pending_claim_interval = settings.MATCHING_PENDING_CLAIM_INTERVAL
+        self._order_slots = asyncio.Semaphore(self.concurrency)
+        self.batch_enabled = settings.MATCHING_BATCH_ENABLED
+        self.batch_window_ms = settings.MATCHING_BATCH_WINDOW_MS
+        self.batch_max_orders = settings.MATCHING_BATCH_MAX_ORDERS
+        self.batch_candidates = settings.MATCHING_BATCH_CANDIDATES
+        self._in_flight: set[asyncio.Task] = set()
+        self._find_and_lock_script = self.redis.register_script(FIND_AND_LOCK_NEAREST_DRIVER)
+        self._find_and_lock_l1_script = self.redis.register_script(FIND_AND_LOCK_NEAREST_DRIVER_L1)
+        self._pop_due_timeouts_script = self.redis.register_script(POP_DUE_PROPOSAL_TIMEOUTS)
+        self._pop_due_members_script = self.redis.register_script(POP_DUE_MEMBERS)
+        self.retry_max_attempts = settings.MATCHING_RETRY_MAX_ATTEMPTS
+        self.retry_backoff_base = settings.MATCHING_RETRY_BACKOFF_BASE
+        self.retry_backoff_max = settings.MATCHING_RETRY_BACKOFF_MAX
+        self.occupancy_bitmap_enabled = settings.MATCHING_OCCUPANCY_BITMAP_ENABLED
+        self.freshness_filter_enabled = settings.MATCHING_FRESHNESS_FILTER_ENABLED
+        self.stale_after = settings.PRESENCE_STALE_AFTER
+        self._lock_fresh_driver_script = self.redis.register_script(LOCK_DRIVER_IF_FRESH)
+        self.metrics = MatchingMetrics()
+        self.metrics_host = settings.MATCHING_METRICS_HOST
+        self.metrics_port = settings.MATCHING_METRICS_PORT
+        self.presence_sweeper: Optional[StaleDriverSweeper] = None
+        if settings.PRESENCE_SWEEP_INTERVAL > 0:
+            self.presence_sweeper = StaleDriverSweeper(redis, self.locator, self.metrics.evicted_drivers)
+        self.stream_archiver: Optional[StreamArchiver] = None
+        if settings.STREAM_ARCHIVE_INTERVAL > 0:
+            self.stream_archiver = StreamArchiver(
+                redis,
+                [*self.stream_keys, self.RETRY_STREAM_KEY, self.LIFECYCLE_STREAM_KEY],
+                self.metrics.archived_entries,
+            )
+        self.grid_index: Optional[GridOccupancyIndex] = None
+        if settings.MATCHING_LOCAL_INDEX_ENABLED and self._scans_cells:
+            self.grid_index = GridOccupancyIndex(
+                redis,
+                settings.CITY_GRID_N,
+                settings.CITY_GRID_M,
+                max_lag=settings.MATCHING_LOCAL_INDEX_MAX_LAG,
+            )
+
+
+    @property
+    def _scans_cells(self) -> bool:
+        """
+        Поиск обходит кольца хэшей `cell:X:Y` (Lua-скрипты, Python-поиск, локальный индекс).
+        Иначе (другой индекс или счетчики блоков) кандидатов возвращает DriverLocator.nearest.
+        """
+        return isinstance(self.locator, CellHashLocator) and self.locator.block_index is None
+
+
+    @property
+    def _block_index(self) -> Optional[BlockCountIndex]:
+        """Иерархический индекс блоков индекса ячеек или None, если он выключен."""
+        return getattr(self.locator, "block_index", None)
 
 
     async def _ensure_consumer_group(self):
         """
-        Убеждается, что группа потребителей существует.
+        Убеждается, что группа потребителей существует во всех обслуживаемых стримах.
         Если стрима или группы нет, они будут созданы.
         """
-        try:
-            await self.redis.xgroup_create(
-                name=self.STREAM_KEY,
-                groupname=self.CONSUMER_GROUP,
-                id="0",  # Начинаем читать с самого начала
-                mkstream=True,  # Создать стрим, если его нет
-            )
+        for stream_key in self.stream_keys:
+            try:
+                await self.redis.xgroup_create(
+                    name=stream_key,
+                    groupname=self.CONSUMER_GROUP,
+                    id="0",  # Начинаем читать с самого начала
+                    mkstream=True,  # Создать стрим, если его нет
+                )
 
-            logger.info(f"Создана группа потребителей '{self.CONSUMER_GROUP}' для потока '{self.STREAM_KEY}'.")
-        except Exception as e:
-            if "BUSYGROUP" in str(e):
-                logger.info(f"Группа потребителей '{self.CONSUMER_GROUP}' уже существует.")
-            else:
-                logger.error(f"Не удалось создать группу потребителей: {e}")
-                raise
+                logger.info(f"Создана группа потребителей '{self.CONSUMER_GROUP}' для потока '{stream_key}'.")
+            except Exception as e:
+                if "BUSYGROUP" in str(e):
+                    logger.info(f"Группа потребителей '{self.CONSUMER_GROUP}' для потока '{stream_key}' уже существует.")
+                else:
+                    logger.error(f"Не удалось создать группу потребителей: {e}")
+                    raise
 
 
     async def _lock_driver(self, driver_id: int, ride_id: str) -> bool:
@@ -73,37 +179,254 @@ class DriverMatchingService:
         """
         lock_key = f"driver_lock:{driver_id}"
 
+        if self.freshness_filter_enabled:
+            # Водитель без свежего heartbeat не блокируется (см. LOCK_DRIVER_IF_FRESH)
+            locked = await self._lock_fresh_driver_script(
+                keys=[lock_key, DriverProfileService.LAST_SEEN_KEY],
+                args=[driver_id, ride_id, self.DRIVER_LOCK_TIMEOUT, self._min_last_seen()],
+            )
+            return bool(locked)
+
         was_set = await self.redis.set(
             lock_key, ride_id, ex=self.DRIVER_LOCK_TIMEOUT, nx=True
         )
         return was_set
 
 
+    async def _queue_driver_lock(self, pipe, driver_id: int, ride_id: str) -> None:
+        """
+        Добавляет в pipeline блокировку водителя по тем же правилам, что и _lock_driver
+        (с фильтром по свежести — через LOCK_DRIVER_IF_FRESH). Результат в pipe.execute()
+        истинный, если блокировка установлена.
+        """
+        lock_key = f"driver_lock:{driver_id}"
+        if self.freshness_filter_enabled:
+            await self._lock_fresh_driver_script(
+                keys=[lock_key, DriverProfileService.LAST_SEEN_KEY],
+                args=[driver_id, ride_id, self.DRIVER_LOCK_TIMEOUT, self._min_last_seen()],
+                client=pipe,
+            )
+        else:
+            pipe.set(lock_key, ride_id, ex=self.DRIVER_LOCK_TIMEOUT, nx=True)
+
+
+    def _min_last_seen(self) -> float:
+        """Минимальное время последнего heartbeat кандидата; 0 — без фильтра по свежести."""
+        return time.time() - self.stale_after if self.freshness_filter_enabled else 0
+
+
     async def _find_and_lock_nearest_driver(
-        self, start_x: int, start_y: int, ride_id: str
+        self, start_x: int, start_y: int, ride_id: str, excluded: frozenset[int] = frozenset()
     ) -> Optional[int]:
         """
         Ищет ближайшего СВОБОДНОГО (не заблокированного) водителя и блокирует его.
 
+        Если включен и актуален локальный индекс занятости, кандидаты ищутся в памяти.
+        Иначе в режимах "script" и "diamond" поиск и блокировка выполняются одним Lua-скриптом.
+        Если скрипт выполнить не удалось, используется Python-реализация.
+
+        Режимы "script" и "python" обходят квадратные кольца (внутри кольца — по ID),
+        режим "diamond" — L1-ромбы, то есть выбирает водителя точно по (манхэттенское расстояние, ID),
+        а MAX_SEARCH_RADIUS задает манхэттенский радиус.
+
+        Если водители хранятся не в ячейках (DRIVER_LOCATOR_BACKEND != "cells") или включены
+        счетчики блоков, кандидатов возвращает DriverLocator.nearest — тоже по (манхэттенское расстояние, ID).
+
+        Длительность поиска, число колец, ячеек и попыток блокировки попадают в метрики.
+
+        Args:
+            excluded: Водители, которых нужно пропустить (например, не ответившие на этот заказ).
+
+        Returns:
+            ID заблокированного водителя или None.
+        """
+        stats = {"rings": 0, "cells": 0, "lock_attempts": 0}
+        started = time.perf_counter()
+        driver_id = await self._search_with_mode(start_x, start_y, ride_id, excluded, stats)
+        self.metrics.observe_search(
+            stats.get("mode", self.search_mode),
+            time.perf_counter() - started,
+            stats["rings"],
+            stats["cells"],
+            stats["lock_attempts"],
+            driver_id is not None,
+        )
+        return driver_id
+
+
+    async def _search_with_mode(
+        self, start_x: int, start_y: int, ride_id: str, excluded: frozenset[int], stats: Dict[str, Any]
+    ) -> Optional[int]:
+        """Выбирает реализацию поиска (локальный индекс, Lua-скрипт, Python или DriverLocator) и запускает ее."""
+        if not self._scans_cells:
+            stats["mode"] = "blocks" if self._block_index is not None else f"locator_{self.locator.name}"
+            return await self._find_and_lock_nearest_driver_locator(start_x, start_y, ride_id, excluded, stats)
+
+        if self.grid_index is not None and self.grid_index.is_fresh:
+            stats["mode"] = "local"
+            return await self._find_and_lock_nearest_driver_local(start_x, start_y, ride_id, excluded, stats)
+
+        if self.search_mode in ("script", "diamond"):
+            try:
+                stats["mode"] = self.search_mode
+                return await self._find_and_lock_nearest_driver_script(start_x, start_y, ride_id, excluded, stats)
+            except Exception as e:
+                logger.error(f"Ошибка Lua-поиска водителя, переключаемся на Python-поиск: {e}")
+
+        stats.update(rings=0, cells=0, lock_attempts=0)
+        if self.search_mode == "diamond":
+            stats["mode"] = "diamond_python"
+            return await self._find_and_lock_nearest_driver_diamond(start_x, start_y, ride_id, excluded, stats)
+        stats["mode"] = "python"
+        return await self._find_and_lock_nearest_driver_python(start_x, start_y, ride_id, excluded, stats)
+
+
+    async def _find_and_lock_nearest_driver_local(
+        self,
+        start_x: int,
+        start_y: int,
+        ride_id: str,
+        excluded: frozenset[int] = frozenset(),
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> Optional[int]:
+        """
+        Поиск кандидатов по локальному зеркалу ячеек; в Redis уходят только SET NX блокировки.
+
+        Returns:
+            ID заблокированного водителя или None.
+        """
+        stats = {} if stats is None else stats
+        ring_cells = diamond_ring_cells if self.search_mode == "diamond" else square_ring_cells
+        for radius, candidate_ids in self.grid_index.ring_candidates(
+            start_x, start_y, self.MAX_SEARCH_RADIUS, ring_cells
+        ):
+            stats["rings"] = radius + 1
+            logger.info(f"Найдены кандидаты (локальный индекс) в радиусе {radius}: {candidate_ids}")
+            for driver_id in candidate_ids:
+                if driver_id in excluded:
+                    continue
+                stats["lock_attempts"] = stats.get("lock_attempts", 0) + 1
+                if await self._lock_driver(driver_id, ride_id):
+                    logger.info(f"Водитель {driver_id} успешно заблокирован.")
+                    return driver_id
+
+        # Ячейки читаются из памяти, поэтому запросов к Redis за ячейками нет
+        stats["rings"] = self.MAX_SEARCH_RADIUS + 1
+        logger.warning(f"Свободные водители не найдены в радиусе {self.MAX_SEARCH_RADIUS} от ({start_x}, {start_y})")
+        return None
+
+
+    async def _find_and_lock_nearest_driver_locator(
+        self,
+        start_x: int,
+        start_y: int,
+        ride_id: str,
+        excluded: frozenset[int] = frozenset(),
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> Optional[int]:
+        """
+        Поиск через DriverLocator.nearest: запрашивает по LOCATOR_CANDIDATES ближайших водителей
+        (без уже проверенных) и пытается заблокировать их по порядку.
+
+        Returns:
+            ID заблокированного водителя или None.
+        """
+        stats = {"rings": 0, "cells": 0, "lock_attempts": 0} if stats is None else stats
+        tried = set(excluded)
+        while True:
+            stats["rings"] += 1
+            candidates = await self.locator.nearest(
+                start_x, start_y, self.LOCATOR_CANDIDATES, self.MAX_SEARCH_RADIUS, frozenset(tried)
+            )
+            for driver_id, distance in candidates:
+                tried.add(driver_id)
+                stats["lock_attempts"] += 1
+                if await self._lock_driver(driver_id, ride_id):
+                    logger.info(f"Водитель {driver_id} на расстоянии {distance} успешно заблокирован.")
+                    return driver_id
+            # Вернулось меньше запрошенного — других водителей в радиусе нет
+            if len(candidates) < self.LOCATOR_CANDIDATES:
+                break
+
+        logger.warning(f"Свободные водители не найдены в манхэттенском радиусе {self.MAX_SEARCH_RADIUS} от ({start_x}, {start_y})")
+        return None
+
+
+    async def _find_and_lock_nearest_driver_script(
+        self,
+        start_x: int,
+        start_y: int,
+        ride_id: str,
+        excluded: frozenset[int] = frozenset(),
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> Optional[int]:
+        """
+        Поиск и блокировка водителя за один round trip (EVALSHA).
+        В режиме "diamond" используется скрипт с обходом L1-ромбов.
+
+        Returns:
+            ID заблокированного водителя или None.
+        """
+        args = [
+            start_x,
+            start_y,
+            self.MAX_SEARCH_RADIUS,
+            settings.CITY_GRID_N,
+            settings.CITY_GRID_M,
+            ride_id,
+            self.DRIVER_LOCK_TIMEOUT,
+        ]
+        if self.search_mode == "diamond":
+            script = self._find_and_lock_l1_script
+            args.append(1 if self.occupancy_bitmap_enabled else 0)
+        else:
+            script = self._find_and_lock_script
+        args.append(self._min_last_seen())
+        driver_id, rings, cells, lock_attempts = await script(args=[*args, *sorted(excluded)])
+        if stats is not None:
+            stats.update(rings=rings, cells=cells, lock_attempts=lock_attempts)
+        if not driver_id:
+            logger.warning(f"Свободные водители не найдены в радиусе {self.MAX_SEARCH_RADIUS} от ({start_x}, {start_y})")
+            return None
+
+        logger.info(f"Водитель {driver_id} успешно заблокирован (Lua) для заказа {ride_id}.")
+        return int(driver_id)
+
+
+    async def _find_and_lock_nearest_driver_python(
+        self,
+        start_x: int,
+        start_y: int,
+        ride_id: str,
+        excluded: frozenset[int] = frozenset(),
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> Optional[int]:
+        """
+        Поиск по спирали с отдельными запросами к Redis на каждое кольцо и кандидата.
+
         Returns:
             ID заблокированного водителя или None.
         """
+        stats = {"rings": 0, "cells": 0, "lock_attempts": 0} if stats is None else stats
         logger.info(f"Начинаем поиск и блокировку водителя из точки ({start_x}, {start_y}) для заказа {ride_id}")
 
         # Проверяем водителей в точке заказа (радиус 0)
         cell_key = f"cell:{start_x}:{start_y}"
         drivers_in_cell = await self.redis.hkeys(cell_key)
+        stats["rings"], stats["cells"] = 1, 1
         if drivers_in_cell:
-            candidate_ids = sorted([int(d) for d in drivers_in_cell])
+            candidate_ids = sorted([int(d) for d in drivers_in_cell if int(d) not in excluded])
             logger.info(f"Найдены кандидаты в ячейке 0: {candidate_ids}")
             # Пытаемся заблокировать каждого кандидата по очереди
             for driver_id in candidate_ids:
+                stats["lock_attempts"] += 1
                 if await self._lock_driver(driver_id, ride_id):
                     logger.info(f"Водитель {driver_id} успешно заблокирован.")
                     return driver_id
 
         # Расширяем поиск по спирали
         for radius in range(1, self.MAX_SEARCH_RADIUS + 1):
+            stats["rings"] += 1
             candidate_ids = []
             # Итерируемся по периметру квадрата с текущим радиусом
             for i in range(-radius, radius + 1):
@@ -124,171 +447,840 @@ class DriverMatchingService:
                     pipe = self.redis.pipeline()
                     for key in set(keys_to_check):
                         pipe.hkeys(key)
+                    stats["cells"] += len(set(keys_to_check))
                     
                     results = await pipe.execute()
                     
                     for driver_list in results:
-                        candidate_ids.extend([int(d) for d in driver_list])
+                        candidate_ids.extend([int(d) for d in driver_list if int(d) not in excluded])
 
             if candidate_ids:
                 sorted_candidates = sorted(candidate_ids)
                 logger.info(f"Найдены кандидаты в радиусе {radius}: {sorted_candidates}")
                 # Пытаемся заблокировать каждого кандидата
                 for driver_id in sorted_candidates:
+                    stats["lock_attempts"] += 1
                     if await self._lock_driver(driver_id, ride_id):
                         logger.info(f"Водитель {driver_id} успешно заблокирован.")
                         return driver_id
 
         logger.warning(f"Свободные водители не найдены в радиусе {self.MAX_SEARCH_RADIUS} от ({start_x}, {start_y})")
         return None
+
+
+    async def _find_and_lock_nearest_driver_diamond(
+        self,
+        start_x: int,
+        start_y: int,
+        ride_id: str,
+        excluded: frozenset[int] = frozenset(),
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> Optional[int]:
+        """
+        Точный поиск ближайшего по манхэттенскому расстоянию водителя (Python-версия
+        FIND_AND_LOCK_NEAREST_DRIVER_L1): один pipeline HKEYS на L1-ромб, ромбы обрезаны по сетке.
+
+        Returns:
+            ID заблокированного водителя или None.
+        """
+        stats = {"rings": 0, "cells": 0, "lock_attempts": 0} if stats is None else stats
+        grid_n, grid_m = settings.CITY_GRID_N, settings.CITY_GRID_M
+        last_radius = min(self.MAX_SEARCH_RADIUS, max_manhattan_distance(start_x, start_y, grid_n, grid_m))
+        occupancy = await self._read_occupancy(start_x, start_y, last_radius)
+
+        for radius in range(0, last_radius + 1):
+            stats["rings"] += 1
+            cells = list(diamond_ring_cells(start_x, start_y, radius, grid_n, grid_m))
+            if occupancy is not None:
+                cells = [(x, y) for x, y in cells if occupancy.is_occupied(x, y)]
+            if not cells:
+                continue
+            stats["cells"] += len(cells)
+
+            pipe = self.redis.pipeline()
+            for x, y in cells:
+                pipe.hkeys(f"cell:{x}:{y}")
+            results = await pipe.execute()
+
+            # Все кандидаты ромба на одном расстоянии — порядок по ID
+            candidate_ids = sorted(int(d) for driver_ids in results for d in driver_ids if int(d) not in excluded)
+            for driver_id in candidate_ids:
+                stats["lock_attempts"] += 1
+                if await self._lock_driver(driver_id, ride_id):
+                    logger.info(f"Водитель {driver_id} на расстоянии {radius} успешно заблокирован.")
+                    return driver_id
+
+        logger.warning(f"Свободные водители не найдены в манхэттенском радиусе {self.MAX_SEARCH_RADIUS} от ({start_x}, {start_y})")
+        return None
     
 
+    async def _pop_due_timeouts(self, now: float) -> tuple[int, Optional[float], list[str]]:
+        """
+        Атомарно обрабатывает истекшие предложения (см. POP_DUE_PROPOSAL_TIMEOUTS).
+
+        Returns:
+            (число забранных предложений, срок ближайшего оставшегося или None, снятые предложения).
+        """
+        result = await self._pop_due_timeouts_script(
+            keys=[self.TIMEOUT_ZSET_KEY, self.RETRY_STREAM_KEY],
+            args=[now, self.TIMEOUT_BATCH_SIZE],
+        )
+        popped, next_due, released = int(result[0]), result[1], list(result[2:])
+        return popped, float(next_due) if next_due else None, released
+
+
+    async def _count_ghost_proposals(self, released: list[str]) -> int:
+        """
+        Считает истекшие предложения водителям-"призракам": без heartbeat дольше PRESENCE_STALE_AFTER
+        (или уже вытесненным). Доля таких предложений показывает, сколько PROPOSAL_TIMEOUT
+        тратится на пропавших водителей.
+        """
+        driver_ids = [proposal.rsplit(":", 1)[1] for proposal in released]
+        last_seen = await self.redis.zmscore(DriverProfileService.LAST_SEEN_KEY, driver_ids)
+        cutoff = time.time() - self.stale_after
+        ghosts = sum(1 for seen in last_seen if seen is None or seen < cutoff)
+        if ghosts:
+            self.metrics.ghost_proposals.inc(ghosts)
+        return ghosts
+
+
     async def _timeout_checker(self):
         """
-        Фоновый воркер, который проверяет ZSET на наличие истекших предложений.
+        Фоновый воркер, обрабатывающий истекшие предложения.
+
+        Воркер спит до ближайшего срока в ZSET, а не опрашивает его раз в секунду.
+        Новые предложения всегда получают срок не раньше now + PROPOSAL_TIMEOUT,
+        поэтому при пустой очереди достаточно просыпаться раз в PROPOSAL_TIMEOUT.
+        Несколько экземпляров сервиса могут работать одновременно: обработка атомарна.
         """
         logger.info("Воркер проверки таймаутов запущен.")
         while self._running:
             try:
-                # Находим все предложения, у которых истек срок
-                expired_proposals = await self.redis.zrangebyscore(
-                    self.TIMEOUT_ZSET_KEY, 0, time.time()
-                )
+                popped, next_due, released = await self._pop_due_timeouts(time.time())
 
-                if not expired_proposals:
-                    await asyncio.sleep(1)  # Пауза, если нет работы
-                    continue
-                
-                logger.info(f"Обнаружены истекшие предложения: {expired_proposals}")
-
-                # Удаляем их из очереди, чтобы не обрабатывать повторно
-                await self.redis.zrem(self.TIMEOUT_ZSET_KEY, *expired_proposals)
-
-                for proposal in expired_proposals:
-                    ride_id, driver_id_str = proposal.split(":")
-                    driver_id = int(driver_id_str)
-
-                    # Снимаем блокировку, только если она все еще принадлежит этому заказу
-                    lock_key = f"driver_lock:{driver_id}"
-                    current_lock_ride_id = await self.redis.get(lock_key)
-
-                    if current_lock_ride_id == ride_id:
-                        logger.warning(f"Таймаут для водителя {driver_id} по заказу {ride_id}. Снимаем блокировку.")
-                        await self.redis.delete(lock_key)
-                        
-                        # Публикуем событие для повторного поиска
-                        await self.redis.xadd(
-                            self.RETRY_STREAM_KEY,
-                            {"ride_id": ride_id, "exclude_driver_id": driver_id}
-                        )
-                    else:
-                        logger.info(f"Таймаут для заказа {ride_id} проигнорирован, т.к. водитель {driver_id} уже не заблокирован этим заказом.")
+                for proposal in released:
+                    ride_id, driver_id = proposal.rsplit(":", 1)
+                    logger.warning(f"Таймаут для водителя {driver_id} по заказу {ride_id}. Блокировка снята, заказ отправлен на повторный поиск.")
+                if released:
+                    await self._count_ghost_proposals(released)
+                if popped > len(released):
+                    logger.info(f"Проигнорировано {popped - len(released)} истекших предложений: водители уже не заблокированы этими заказами.")
+
+                if popped >= self.TIMEOUT_BATCH_SIZE:
+                    continue  # Истекших предложений больше, чем размер пачки
+
+                delay = self.PROPOSAL_TIMEOUT if next_due is None else next_due - time.time()
+                await asyncio.sleep(min(max(delay, 0), self.PROPOSAL_TIMEOUT))
             
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Ошибка в воркере проверки таймаутов: {e}", exc_info=True)
                 await asyncio.sleep(5)
 
 
-    async def _order_events_listener(self):
+    async def _ensure_retry_consumer_group(self):
+        """Убеждается, что группа потребителей существует в стриме повторного поиска."""
+        try:
+            await self.redis.xgroup_create(
+                name=self.RETRY_STREAM_KEY,
+                groupname=self.CONSUMER_GROUP,
+                id="0",
+                mkstream=True,
+            )
+            logger.info(f"Создана группа потребителей '{self.CONSUMER_GROUP}' для потока '{self.RETRY_STREAM_KEY}'.")
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                logger.error(f"Не удалось создать группу потребителей: {e}")
+                raise
+
+
+    def _retry_backoff(self, attempt: int) -> float:
+        """Задержка перед следующей попыткой поиска: экспоненциальная, с ограничением сверху."""
+        return min(self.retry_backoff_base * 2 ** (attempt - 1), self.retry_backoff_max)
+
+
+    async def _retry_ride(self, ride_id: str, exclude_driver_id: Optional[int] = None) -> Optional[int]:
         """
-        Основной воркер, который слушает новые заказы и запускает поиск.
+        Повторный поиск водителя для заказа.
+
+        Берет координаты из `ride_order:{ride_id}` и пропускает водителей из
+        `ride_excluded:{ride_id}` без попыток блокировки; заказ, который уже не ожидает
+        водителя по данным БД, не предлагается. Если БД недоступна, попытка не засчитывается
+        и заказ возвращается в отложенную очередь. Если водитель не найден,
+        заказ ставится в отложенную очередь с экспоненциальной задержкой; после
+        `retry_max_attempts` попыток пассажир получает уведомление, а состояние заказа удаляется.
+
+        Returns:
+            ID заблокированного водителя или None.
         """
-        await self._ensure_consumer_group()
-        logger.info("Слушатель новых заказов запущен...")
-        self._running = True
+        ride_key = f"ride_order:{ride_id}"
+        excluded_key = f"ride_excluded:{ride_id}"
+
+        pipe = self.redis.pipeline(transaction=False)
+        if exclude_driver_id is not None:
+            pipe.sadd(excluded_key, exclude_driver_id)
+            pipe.expire(excluded_key, self.RIDE_STATE_TTL)
+        pipe.hgetall(ride_key)
+        pipe.smembers(excluded_key)
+        pipe.hincrby(ride_key, "attempts", 1)
+        *_, state, excluded_members, attempts = await pipe.execute()
+
+        if not state:
+            # Заказ принят, отменен или устарел — состояние уже удалено
+            await self.redis.delete(ride_key, excluded_key)
+            logger.info(f"Повторный поиск для заказа {ride_id} не нужен: состояние заказа отсутствует.")
+            return None
+
+        if attempts > self.retry_max_attempts:
+            await self._give_up_ride(ride_id, state)
+            return None
+
+        try:
+            pending = await self._ride_is_pending(ride_id)
+        except Exception as e:
+            # Без ответа БД заказ не предлагается, но и не теряется: проверка повторится позже
+            delay = self._retry_backoff(attempts)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hincrby(ride_key, "attempts", -1)
+            pipe.zadd(self.RETRY_SCHEDULE_KEY, {ride_id: time.time() + delay})
+            await pipe.execute()
+            logger.error(f"Не удалось проверить статус заказа {ride_id} в БД, повтор через {delay:.1f} с: {e}")
+            return None
+        if not pending:
+            # Заказ принят, пока его состояние еще не было снято (см. OutboxRelay.clear_matching_state)
+            await self.redis.delete(ride_key, excluded_key)
+            logger.info(f"Повторный поиск для заказа {ride_id} не нужен: заказ уже не ожидает водителя.")
+            return None
+
+        excluded = frozenset(int(d) for d in excluded_members)
+        driver_id = await self._find_and_lock_nearest_driver(
+            int(state["start_x"]), int(state["start_y"]), ride_id, excluded
+        )
+
+        if driver_id:
+            await self._send_proposals([(self._order_from_state(ride_id, state), driver_id)])
+            logger.info(f"Повторный поиск (попытка {attempts}): водитель {driver_id} для заказа {ride_id}.")
+            return driver_id
+
+        delay = self._retry_backoff(attempts)
+        await self.redis.zadd(self.RETRY_SCHEDULE_KEY, {ride_id: time.time() + delay})
+        logger.warning(f"Повторный поиск (попытка {attempts}) для заказа {ride_id} не нашел водителя. Следующая попытка через {delay:.1f} с.")
+        return None
+
+
+    async def _ride_is_pending(self, ride_id: str) -> bool:
+        """
+        Проверяет по БД, что заказ все еще ожидает водителя (не принят и не отменен).
+        Заказ с нечисловым ID (например, из нагрузочного теста) в БД не найти — он не ожидает.
+        """
+        try:
+            ride_pk = int(ride_id)
+        except ValueError:
+            return False
+        async with self.session_factory() as db:
+            ride = await db.get(Ride, ride_pk)
+        return ride is not None and ride.status == RideStatusEnum.PENDING.value
+
+
+    @staticmethod
+    def _order_from_state(ride_id: str, state: Dict[str, str]) -> Dict[str, Any]:
+        """Заказ из хэша `ride_order:{ride_id}` с теми же типами полей, что у заказа из стрима."""
+        return {
+            "ride_id": ride_id,
+            "start_x": int(state["start_x"]),
+            "start_y": int(state["start_y"]),
+            "end_x": int(state.get("end_x") or 0),
+            "end_y": int(state.get("end_y") or 0),
+            "price": float(state.get("price") or 0),
+            "passenger_user_id": state.get("passenger_user_id", ""),
+            "created_ms": state.get("created_ms", ""),
+        }
+
+
+    async def _give_up_ride(self, ride_id: str, state: Dict[str, str]):
+        """Прекращает поиск для заказа: уведомляет пассажира и удаляет состояние заказа."""
+        logger.warning(f"Поиск водителя для заказа {ride_id} прекращен после {self.retry_max_attempts} попыток.")
+        pipe = self.redis.pipeline(transaction=False)
+        if state.get("passenger_user_id"):
+            pipe.publish(
+                self.PASSENGER_NOTIFICATION_CHANNEL,
+                json.dumps({
+                    "type": "NO_DRIVERS_AVAILABLE",
+                    "recipient_user_id": state["passenger_user_id"],
+                    "data": {"ride_id": ride_id},
+                }),
+            )
+        pipe.delete(f"ride_order:{ride_id}", f"ride_excluded:{ride_id}")
+        await pipe.execute()
+
+
+    async def _process_retry_message(self, message_id: str, fields: Optional[Dict[str, Any]]):
+        """
+        Обрабатывает событие повторного поиска и подтверждает его (XACK).
+        Если поиск упал (например, недоступна БД), запись остается в pending и будет заявлена повторно.
+        """
+        if fields is not None:
+            try:
+                exclude_driver_id = fields.get("exclude_driver_id")
+                await self._retry_ride(
+                    fields["ride_id"],
+                    int(exclude_driver_id) if exclude_driver_id else None,
+                )
+            except (KeyError, ValueError) as e:
+                logger.error(f"Некорректное событие повторного поиска {message_id}: {e}")
+        await self.redis.xack(self.RETRY_STREAM_KEY, self.CONSUMER_GROUP, message_id)
+
+
+    async def _retry_events_listener(self):
+        """
+        Воркер, который читает `retry_search_events` (таймауты предложений)
+        и сразу запускает повторный поиск, исключая не ответившего водителя.
+        """
+        await self._ensure_retry_consumer_group()
+        logger.info("Слушатель повторного поиска запущен...")
+
+        while self._running:
+            try:
+                response = await self.redis.xreadgroup(
+                    groupname=self.CONSUMER_GROUP,
+                    consumername=self.consumer_name,
+                    streams={self.RETRY_STREAM_KEY: ">"},
+                    count=self.concurrency,
+                    block=self.READ_BLOCK_MS,
+                )
+                for _, messages in response or []:
+                    for message_id, fields in messages:
+                        await self._process_retry_message(message_id, fields)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if "NOGROUP" in str(e):
+                    await self._ensure_retry_consumer_group()
+                    continue
+                logger.error(f"Ошибка в слушателе повторного поиска: {e}", exc_info=True)
+                await asyncio.sleep(5)
+
 
+    async def _pop_due_members(self, key: str, now: float, limit: int) -> tuple[Optional[float], list[str]]:
+        """
+        Атомарно забирает наступившие элементы отложенной очереди (см. POP_DUE_MEMBERS).
+
+        Returns:
+            (срок ближайшего оставшегося элемента или None, забранные элементы).
+        """
+        result = await self._pop_due_members_script(keys=[key], args=[now, limit])
+        next_due = float(result[0]) if result[0] else None
+        return next_due, list(result[1:])
+
+
+    async def _retry_due_rides(self) -> tuple[Optional[float], list[str]]:
+        """
+        Забирает наступившие заказы из отложенной очереди и ищет для них водителей параллельно
+        (не больше concurrency за раз). Заказ, поиск которого упал (например, ошибка Redis),
+        возвращается в очередь с задержкой retry_backoff_base, а не теряется.
+
+        Returns:
+            (срок ближайшего оставшегося заказа или None, забранные заказы).
+        """
+        next_due, ride_ids = await self._pop_due_members(self.RETRY_SCHEDULE_KEY, time.time(), self.concurrency)
+        results = await asyncio.gather(*(self._retry_ride(ride_id) for ride_id in ride_ids), return_exceptions=True)
+        failed = {ride_id: result for ride_id, result in zip(ride_ids, results) if isinstance(result, Exception)}
+        if failed:
+            due = time.time() + self.retry_backoff_base
+            # nx: заказ, который поиск успел сам поставить в очередь, сохраняет свой срок
+            await self.redis.zadd(self.RETRY_SCHEDULE_KEY, {ride_id: due for ride_id in failed}, nx=True)
+            for ride_id, error in failed.items():
+                logger.error(f"Повторный поиск для заказа {ride_id} упал, заказ возвращен в очередь: {error}")
+        return next_due, ride_ids
+
+
+    async def _retry_scheduler(self):
+        """
+        Воркер отложенной очереди повторного поиска: спит до ближайшего срока
+        и запускает поиск для наступивших заказов. Элементы ставятся в очередь
+        не раньше чем через retry_backoff_base, поэтому при пустой очереди
+        достаточно просыпаться с этим периодом.
+        """
+        logger.info("Воркер отложенных повторных поисков запущен.")
         while self._running:
             try:
+                next_due, ride_ids = await self._retry_due_rides()
+                if ride_ids:
+                    continue
+
+                delay = self.retry_backoff_base if next_due is None else next_due - time.time()
+                await asyncio.sleep(min(max(delay, 0), self.retry_backoff_base))
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка в воркере отложенных повторных поисков: {e}", exc_info=True)
+                await asyncio.sleep(5)
+
+
+    async def _parse_order_message(
+        self, stream_key: str, message_id: str, raw_data: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Разбирает сообщение из потока заказов.
+
+        Сообщения, не являющиеся корректным OrderCreated, сразу подтверждаются (XACK).
+
+        Returns:
+            Словарь с полями заказа или None, если сообщение обрабатывать не нужно.
+        """
+        if raw_data is None:
+            # Запись удалена из стрима (например, при обрезке), пока висела в pending
+            await self.redis.xack(stream_key, self.CONSUMER_GROUP, message_id)
+            return None
+
+        # Тип события лежит в отдельном поле записи: чужие события подтверждаются без разбора нагрузки
+        event_type = raw_data.get('event')
+        if event_type is not None and event_type != 'OrderCreated':
+            await self.redis.xack(stream_key, self.CONSUMER_GROUP, message_id)
+            return None
+
+        logger.info(f"Получен новый заказ {raw_data} с ID {message_id}")
+
+        try:
+            if event_type is None:
+                event_type, _ = decode_event(raw_data)
+            if event_type != 'OrderCreated':
+                await self.redis.xack(stream_key, self.CONSUMER_GROUP, message_id)
+                return None
+            # Валидируем, что данные о координатах пришли
+            order = decode_order_created(raw_data)
+
+        except UnsupportedEventVersion as e:
+            # Запись от более нового издателя не подтверждается: ее заберет (XAUTOCLAIM) обновленный экземпляр
+            logger.error(f"Заказ {message_id} оставлен в pending: {e}")
+            return None
+        except (KeyError, ValueError, TypeError) as e:
+            logger.error(f"Некорректные данные в сообщении о заказе {message_id}: {e}")
+            await self.redis.xack(stream_key, self.CONSUMER_GROUP, message_id)
+            return None
+
+        order["stream_key"] = stream_key
+        order["message_id"] = message_id
+        # ID записи стрима начинается со времени публикации заказа (мс)
+        order["created_ms"] = message_id.split("-", 1)[0]
+        return order
+
+
+    def _queue_proposal(self, pipe, order: Dict[str, Any], driver_id: int) -> None:
+        """
+        Добавляет в pipeline отправку предложения водителю, постановку таймаута,
+        сохранение параметров заказа для повторного поиска и подтверждение (XACK)
+        сообщения о заказе, если заказ пришел из стрима.
+        """
+        ride_id = order["ride_id"]
+        notification_payload = {
+            "type": "NEW_ORDER_PROPOSAL",
+            "recipient_user_id": driver_id,
+            "data": {
+                "ride_id": ride_id,
+                "start_x": order["start_x"],
+                "start_y": order["start_y"],
+                "end_x": order["end_x"],
+                "end_y": order["end_y"],
+                "price": order["price"],
+            }
+        }
+        pipe.publish(self.NOTIFICATION_CHANNEL, json.dumps(notification_payload))
+
+        proposal_member = f"{ride_id}:{driver_id}"
+        timeout_score = time.time() + self.PROPOSAL_TIMEOUT
+        pipe.zadd(self.TIMEOUT_ZSET_KEY, {proposal_member: timeout_score})
+
+        self._queue_ride_state(pipe, order)
+
+        if "message_id" in order:
+            pipe.xack(order["stream_key"], self.CONSUMER_GROUP, order["message_id"])
+
+
+    async def _send_proposals(self, proposals: list[tuple[Dict[str, Any], int]], deferred: list[Dict[str, Any]] = ()):
+        """
+        Отправляет предложения и переносы заказов в отложенную очередь одним pipeline.
+
+        Время выполнения pipeline и время от публикации заказа до предложения попадают в метрики.
+        """
+        started = time.perf_counter()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for order, driver_id in proposals:
+                self._queue_proposal(pipe, order, driver_id)
+            for order in deferred:
+                self._queue_deferral(pipe, order)
+            await pipe.execute()
+        self.metrics.publish_latency.observe(time.perf_counter() - started)
+        self.metrics.proposals.inc(len(proposals))
+
+        now_ms = time.time() * 1000
+        for order, _ in proposals:
+            if order.get("created_ms"):
+                self.metrics.order_to_proposal.observe(max(now_ms - int(order["created_ms"]), 0) / 1000)
+
+
+    def _queue_ride_state(self, pipe, order: Dict[str, Any]) -> None:
+        """Добавляет в pipeline сохранение параметров заказа (нужны повторному поиску без обращения к БД)."""
+        ride_key = f"ride_order:{order['ride_id']}"
+        pipe.hset(ride_key, mapping={field: order[field] for field in self.RIDE_STATE_FIELDS})
+        pipe.expire(ride_key, self.RIDE_STATE_TTL)
+
+
+    def _queue_deferral(self, pipe, order: Dict[str, Any]) -> None:
+        """
+        Добавляет в pipeline перенос заказа без водителя в отложенную очередь
+        `retry_schedule` и подтверждение (XACK) сообщения о заказе.
+
+        Дальше заказом занимается _retry_scheduler, поэтому основной слушатель
+        не ждет появления водителей и не держит запись в pending.
+        """
+        self._queue_ride_state(pipe, order)
+        pipe.zadd(self.RETRY_SCHEDULE_KEY, {order["ride_id"]: time.time() + self._retry_backoff(1)})
+        pipe.xack(order["stream_key"], self.CONSUMER_GROUP, order["message_id"])
+
+
+    async def _process_order_message(self, stream_key: str, message_id: str, raw_data: Optional[Dict[str, Any]]):
+        """
+        Обрабатывает одно сообщение из потока заказов: поиск, блокировка, предложение, XACK.
+        """
+        order = await self._parse_order_message(stream_key, message_id, raw_data)
+        if order is None:
+            return
+
+        ride_id = order["ride_id"]
+        driver_id = await self._find_and_lock_nearest_driver(order["start_x"], order["start_y"], ride_id)
+
+        if driver_id:
+            logger.info(f"Найден и заблокирован водитель: ID {driver_id} для заказа {ride_id}")
+            await self._send_proposals([(order, driver_id)])
+
+            logger.info(f"Заказ {ride_id} успешно обработан и подтвержден.")
+
+        else:
+            logger.warning(f"Не удалось найти водителя для заказа {ride_id}. Заказ перенесен в отложенную очередь.")
+            await self._send_proposals([], [order])
+
+
+    async def _read_occupancy(self, start_x: int, start_y: int, radius: int) -> Optional[OccupancyWindow]:
+        """
+        Читает битовые карты занятости квадратного окна радиуса `radius` вокруг точки
+        (одним pipeline). Возвращает None, если карты не используются.
+        """
+        if not self.occupancy_bitmap_enabled:
+            return None
+        return await read_occupancy_window(
+            self.redis,
+            max(start_x - radius, 0),
+            min(start_x + radius, settings.CITY_GRID_N - 1),
+            max(start_y - radius, 0),
+            min(start_y + radius, settings.CITY_GRID_M - 1),
+        )
+
+
+    async def _collect_candidates(
+        self, start_x: int, start_y: int, limit: int
+    ) -> list[tuple[int, int]]:
+        """
+        Собирает до `limit` ближайших (по манхэттенскому расстоянию) водителей вокруг точки.
+
+        Кольца читаются из локального индекса, если он актуален, иначе одним
+        pipeline на кольцо (с битовыми картами — только занятые ячейки).
+        Поиск останавливается, когда более близких водителей в следующих кольцах быть не может.
+        Для индексов без ячеек и при счетчиках блоков кандидатов возвращает DriverLocator.nearest.
+
+        Returns:
+            Список (ID водителя, расстояние), отсортированный по расстоянию и ID.
+        """
+        if not self._scans_cells:
+            return await self.locator.nearest(start_x, start_y, limit, self.MAX_SEARCH_RADIUS)
+
+        use_local_index = self.grid_index is not None and self.grid_index.is_fresh
+        occupancy = None if use_local_index else await self._read_occupancy(start_x, start_y, self.MAX_SEARCH_RADIUS)
+        candidates: list[tuple[int, int]] = []
+
+        for radius in range(0, self.MAX_SEARCH_RADIUS + 1):
+            cells = list(square_ring_cells(start_x, start_y, radius, settings.CITY_GRID_N, settings.CITY_GRID_M))
+            if use_local_index:
+                results = [self.grid_index.drivers_in_cell(x, y) for x, y in cells]
+            elif occupancy is not None:
+                cells = [(x, y) for x, y in cells if occupancy.is_occupied(x, y)]
+                pipe = self.redis.pipeline()
+                for x, y in cells:
+                    pipe.hkeys(f"cell:{x}:{y}")
+                results = await pipe.execute() if cells else []
+            else:
+                pipe = self.redis.pipeline()
+                for x, y in cells:
+                    pipe.hkeys(f"cell:{x}:{y}")
+                results = await pipe.execute()
+
+            for (x, y), driver_ids in zip(cells, results):
+                distance = abs(x - start_x) + abs(y - start_y)
+                candidates.extend((int(d), distance) for d in driver_ids)
+
+            # Все водители в следующих кольцах дальше, чем radius
+            if len(candidates) >= limit:
+                candidates.sort(key=lambda c: (c[1], c[0]))
+                if candidates[limit - 1][1] <= radius:
+                    break
+
+        candidates.sort(key=lambda c: (c[1], c[0]))
+        return candidates[:limit]
+
+
+    async def _read_order_batch(self) -> list:
+        """
+        Собирает пакет заказов: до `batch_max_orders` записей или пока не истечет окно `batch_window_ms`,
+        отсчитываемое от первой полученной записи.
+        """
+        messages = await self._read_orders(self.batch_max_orders, self.READ_BLOCK_MS)
+        if not messages:
+            return []
+
+        deadline = time.monotonic() + self.batch_window_ms / 1000
+        while len(messages) < self.batch_max_orders:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                break
+            messages.extend(await self._read_orders(self.batch_max_orders - len(messages), remaining_ms))
+        return messages
+
+
+    async def _process_order_batch(self, messages: list) -> Optional[Dict[str, float]]:
+        """
+        Пакетный подбор: решает задачу назначения заказов водителям с минимальной
+        суммарной дистанцией подачи, затем блокирует водителей и отправляет предложения
+        одним pipeline. Заказы, чей водитель был перехвачен другим процессом,
+        добираются поштучным поиском.
+
+        Returns:
+            Статистика пакета (время решения, средняя дистанция подачи пакетного и жадного режимов)
+            или None, если в пакете нет заказов.
+        """
+        orders = []
+        for stream_key, message_id, raw_data in messages:
+            order = await self._parse_order_message(stream_key, message_id, raw_data)
+            if order is not None:
+                orders.append(order)
+        if not orders:
+            return None
+
+        # Кандидаты для каждого заказа
+        candidate_lists = [
+            await self._collect_candidates(o["start_x"], o["start_y"], self.batch_candidates)
+            for o in orders
+        ]
+        driver_ids = sorted({d for candidates in candidate_lists for d, _ in candidates})
+
+        # Отбрасываем уже заблокированных водителей одним MGET
+        if driver_ids:
+            locks = await self.redis.mget([f"driver_lock:{d}" for d in driver_ids])
+            driver_ids = [d for d, lock in zip(driver_ids, locks) if lock is None]
+        column = {d: j for j, d in enumerate(driver_ids)}
+
+        cost = [[INF] * len(driver_ids) for _ in orders]
+        for i, candidates in enumerate(candidate_lists):
+            for d, distance in candidates:
+                if d in column:
+                    cost[i][column[d]] = distance
+
+        solve_started = time.perf_counter()
+        assignment = solve_min_cost_assignment(cost) if driver_ids else [None] * len(orders)
+        solve_seconds = time.perf_counter() - solve_started
+
+        matched, total_distance = assignment_cost(cost, assignment)
+        greedy_matched, greedy_distance = assignment_cost(cost, greedy_assignment(cost)) if driver_ids else (0, 0.0)
+        stats = {
+            "orders": len(orders),
+            "solve_ms": solve_seconds * 1000,
+            "matched": matched,
+            "avg_pickup_distance": total_distance / matched if matched else 0.0,
+            "greedy_matched": greedy_matched,
+            "greedy_avg_pickup_distance": greedy_distance / greedy_matched if greedy_matched else 0.0,
+        }
+        logger.info(
+            f"Пакет из {len(orders)} заказов решен за {stats['solve_ms']:.2f} мс: "
+            f"назначено {matched}, средняя подача {stats['avg_pickup_distance']:.2f} "
+            f"(жадно: {greedy_matched}, {stats['greedy_avg_pickup_distance']:.2f})"
+        )
+
+        # Блокируем назначенных водителей одним pipeline
+        planned = [(order, driver_ids[j]) for order, j in zip(orders, assignment) if j is not None]
+        pipe = self.redis.pipeline(transaction=False)
+        for order, driver_id in planned:
+            await self._queue_driver_lock(pipe, driver_id, order["ride_id"])
+        lock_results = await pipe.execute() if planned else []
+
+        proposals = [(order, driver_id) for (order, driver_id), locked in zip(planned, lock_results) if locked]
+        leftovers = [order for order, j in zip(orders, assignment) if j is None]
+        leftovers += [order for (order, _), locked in zip(planned, lock_results) if not locked]
+
+        # Водителей перехватили, они без свежего heartbeat или кандидатов не хватило — поштучный поиск
+        deferred = []
+        for order in leftovers:
+            driver_id = await self._find_and_lock_nearest_driver(order["start_x"], order["start_y"], order["ride_id"])
+            if driver_id:
+                proposals.append((order, driver_id))
+            else:
+                logger.warning(f"Не удалось найти водителя для заказа {order['ride_id']}. Заказ перенесен в отложенную очередь.")
+                deferred.append(order)
+
+        # Предложения, таймауты, отложенные заказы и XACK — одним pipeline
+        if proposals or deferred:
+            await self._send_proposals(proposals, deferred)
+
+        return stats
+
+
+    async def _run_order_message(self, stream_key: str, message_id: str, raw_data: Optional[Dict[str, Any]]):
+        """Обертка для обработки сообщения в отдельной задаче: ошибки логируются, запись остается в pending."""
+        try:
+            await self._process_order_message(stream_key, message_id, raw_data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка обработки заказа {message_id}: {e}", exc_info=True)
+
+
+    async def _dispatch_order(self, stream_key: str, message_id: str, raw_data: Optional[Dict[str, Any]]):
+        """
+        Запускает обработку сообщения в фоне, ожидая свободный слот,
+        если в работе уже `concurrency` заказов.
+        """
+        await self._order_slots.acquire()
+        task = asyncio.create_task(self._run_order_message(stream_key, message_id, raw_data))
+        self._in_flight.add(task)
+        task.add_done_callback(self._on_order_done)
+
+
+    def _on_order_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self._order_slots.release()
+
+
+    async def _recover_pending_entries(self) -> int:
+        """
+        Заявляет (XAUTOCLAIM) записи стримов заказов и повторного поиска, которые были
+        прочитаны, но не подтверждены дольше `pending_idle_ms` (например, после падения
+        процесса между XREADGROUP и XACK), и отправляет их на повторную обработку.
+
+        Returns:
+            Количество заявленных записей.
+        """
+        claimed_total = 0
+        for stream_key in [*self.stream_keys, self.RETRY_STREAM_KEY]:
+            start_id = "0-0"
+            while True:
                 try:
-                    response = await self.redis.xreadgroup(
+                    response = await self.redis.xautoclaim(
+                        name=stream_key,
                         groupname=self.CONSUMER_GROUP,
-                        consumername="consumer-1",
-                        streams={self.STREAM_KEY: ">"},
-                        count=1,
-                        block=0,
+                        consumername=self.consumer_name,
+                        min_idle_time=self.pending_idle_ms,
+                        start_id=start_id,
+                        count=self.concurrency,
                     )
                 except Exception as e:
                     if "NOGROUP" in str(e):
-                        logger.warning("Группа потребителей не найдена (был flushdb?). Пересоздаем...")
-                        await self._ensure_consumer_group()
-                        continue
-                    # Если другая ошибка — пробрасываем дальше
-                    raise e
+                        break  # Слушатель стрима еще не создал группу — заявлять нечего
+                    raise
+                start_id, messages = response[0], response[1]
+                for message_id, raw_data in messages:
+                    if stream_key == self.RETRY_STREAM_KEY:
+                        await self._process_retry_message(message_id, raw_data)
+                    else:
+                        await self._dispatch_order(stream_key, message_id, raw_data)
+                claimed_total += len(messages)
+                if start_id in ("0-0", b"0-0"):
+                    break
 
-                if not response:
-                    continue
+        if claimed_total:
+            logger.warning(f"Заявлено {claimed_total} зависших записей из pending группы '{self.CONSUMER_GROUP}'.")
+        return claimed_total
 
-                stream_key, messages = response[0]
-                message_id, raw_data = messages[0]
 
-                logger.info(f"Получен новый заказ {raw_data} с ID {message_id}")
+    async def _pending_recovery_worker(self):
+        """Фоновый воркер, который периодически забирает зависшие записи других потребителей."""
+        while self._running:
+            await asyncio.sleep(self.pending_claim_interval)
+            try:
+                await self._recover_pending_entries()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка восстановления pending-записей: {e}", exc_info=True)
 
-                try:
-                    raw_payload = raw_data['data']
-                    
-                    if isinstance(raw_payload, str):
-                        data = json.loads(raw_payload)
-                    elif isinstance(raw_payload, dict):
-                        data = raw_payload
-                    else:
-                        logger.error(f"Unknown data type: {type(raw_payload)}")
-                        await self.redis.xack(self.STREAM_KEY, self.CONSUMER_GROUP, message_id)
-                        continue
 
-                    # Проверка типа события
-                    event_type = raw_data.get('event', data.get('event'))
-                    
-                    if event_type != 'OrderCreated':
-                        await self.redis.xack(self.STREAM_KEY, self.CONSUMER_GROUP, message_id)
-                        continue
-                    # Валидируем, что данные о координатах пришли
-                    start_x = int(data['start_x'])
-                    start_y = int(data['start_y'])
-                    ride_id = data['ride_id']
-                    end_x = int(data.get('end_x', 0))
-                    end_y = int(data.get('end_y', 0))
-                    price = data.get('price', 0)
-                    
-                except (KeyError, ValueError) as e:
-                    logger.error(f"Некорректные данные в сообщении о заказе {message_id}: {e}")
-                    await self.redis.xack(self.STREAM_KEY, self.CONSUMER_GROUP, message_id)
-                    continue
+    async def _read_orders(self, count: int, block_ms: int) -> list:
+        """
+        Читает до `count` новых записей из каждого обслуживаемого стрима заказов.
+        Если группа пропала (например, после FLUSHDB), она пересоздается.
 
-                driver_id = await self._find_and_lock_nearest_driver(start_x, start_y, ride_id)
-
-                if driver_id:
-                    logger.info(f"Найден и заблокирован водитель: ID {driver_id} для заказа {ride_id}")
-
-                    notification_payload = {
-                        "type": "NEW_ORDER_PROPOSAL",
-                        "recipient_user_id": driver_id,
-                        "data": {
-                            "ride_id": ride_id,
-                            "start_x": start_x,
-                            "start_y": start_y,
-                            "end_x": int(data['end_x']), 
-                            "end_y": int(data['end_y']),
-                            "price": data.get('price', 0)
-                        }
-                    }
-
-                    await self.redis.publish(
-                        self.NOTIFICATION_CHANNEL,
-                        json.dumps(notification_payload)
-                    )
-                    
-                    proposal_member = f"{ride_id}:{driver_id}"
-                    timeout_score = int(time.time() + self.PROPOSAL_TIMEOUT)
-                    await self.redis.zadd(self.TIMEOUT_ZSET_KEY, {proposal_member: timeout_score})
-                    
-                    await self.redis.xack(self.STREAM_KEY, self.CONSUMER_GROUP, message_id)
-                    logger.info(f"Заказ {ride_id} успешно обработан и подтвержден.")
+        Returns:
+            Список (ключ стрима, ID записи, поля записи).
+        """
+        started = time.perf_counter()
+        try:
+            response = await self.redis.xreadgroup(
+                groupname=self.CONSUMER_GROUP,
+                consumername=self.consumer_name,
+                streams={stream_key: ">" for stream_key in self.stream_keys},
+                count=count,
+                block=block_ms,
+            )
+            self.metrics.xreadgroup_wait.observe(time.perf_counter() - started)
+        except Exception as e:
+            if "NOGROUP" in str(e):
+                logger.warning("Группа потребителей не найдена (был flushdb?). Пересоздаем...")
+                await self._ensure_consumer_group()
+                return []
+            # Если другая ошибка — пробрасываем дальше
+            raise e
 
-                else:
-                    logger.warning(f"Не удалось найти водителя для заказа {data.get('ride_id')}. Заказ остается в очереди.")
-                    await asyncio.sleep(1)
+        if not response:
+            return []
+
+        return [
+            (stream_key, message_id, raw_data)
+            for stream_key, messages in response
+            for message_id, raw_data in messages
+        ]
+
+
+    async def _order_events_listener(self):
+        """
+        Основной воркер, который слушает новые заказы и запускает поиск.
+        Одновременно обрабатывается до `concurrency` заказов, а в пакетном режиме
+        заказы собираются в окно и назначаются вместе.
+        """
+        await self._ensure_consumer_group()
+        logger.info(f"Слушатель новых заказов запущен (потребитель '{self.consumer_name}', параллелизм {self.concurrency})...")
+        self._running = True
+
+        try:
+            await self._recover_pending_entries()
+        except Exception as e:
+            logger.error(f"Ошибка восстановления pending-записей при старте: {e}", exc_info=True)
+
+        while self._running:
+            try:
+                if self.batch_enabled:
+                    messages = await self._read_order_batch()
+                    if messages:
+                        await self._process_order_batch(messages)
                     continue
 
+                free_slots = self.concurrency - len(self._in_flight)
+                if free_slots <= 0:
+                    await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                for stream_key, message_id, raw_data in await self._read_orders(free_slots, self.READ_BLOCK_MS):
+                    await self._dispatch_order(stream_key, message_id, raw_data)
+
             except asyncio.CancelledError:
                 logger.info("Цикл обработки остановлен.")
                 break
@@ -296,6 +1288,16 @@ class DriverMatchingService:
                 logger.error(f"Ошибка в цикле обработки DriverMatchingService: {e}", exc_info=True)
                 await asyncio.sleep(5)
 
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+
+    async def _collect_group_lag(self):
+        """Обновляет метрики отставания группы по стримам заказов и стриму повторного поиска."""
+        await self.metrics.collect_group_lag(
+            self.redis, [*self.stream_keys, self.RETRY_STREAM_KEY], self.CONSUMER_GROUP
+        )
+
 
     async def run(self):
         """
@@ -303,26 +1305,69 @@ class DriverMatchingService:
         Слушает новые сообщения в потоке и обрабатывает их.
         """
         self._running = True
+
+        # HTTP-эндпоинт метрик; отставание группы снимается при каждом запросе
+        metrics_server = None
+        if self.metrics_port:
+            metrics_server = await start_metrics_server(
+                self.metrics.registry, self.metrics_host, self.metrics_port, before_scrape=self._collect_group_lag
+            )
         
-        # Запускаем оба воркера параллельно
+        # Биты занятости для ячеек, заполненных до включения карт
+        if self.occupancy_bitmap_enabled and isinstance(self.locator, CellHashLocator):
+            await sync_occupancy_bitmap(self.redis)
+
+        # Счетчики блоков для ячеек, заполненных до включения иерархического индекса
+        if self._block_index is not None and not await self._block_index.is_built():
+            await self._block_index.rebuild()
+
+        # Запускаем воркеры параллельно
         listener_task = asyncio.create_task(self._order_events_listener())
         timeout_task = asyncio.create_task(self._timeout_checker())
+        recovery_task = asyncio.create_task(self._pending_recovery_worker())
+        retry_listener_task = asyncio.create_task(self._retry_events_listener())
+        retry_scheduler_task = asyncio.create_task(self._retry_scheduler())
+        tasks = [listener_task, timeout_task, recovery_task, retry_listener_task, retry_scheduler_task]
+
+        # Вытеснение водителей, переставших присылать heartbeat
+        if self.presence_sweeper is not None:
+            tasks.append(asyncio.create_task(self.presence_sweeper.run()))
+
+        # Выгрузка старых записей стримов в архив и обрезка стримов
+        if self.stream_archiver is not None:
+            tasks.append(asyncio.create_task(self.stream_archiver.run()))
+
+        # Локальный индекс занятости: начальная сборка и фоновая синхронизация
+        if self.grid_index is not None:
+            await self.grid_index.rebuild()
+            tasks.append(asyncio.create_task(self.grid_index.follow_events()))
+            tasks.append(asyncio.create_task(
+                self.grid_index.run_consistency_checks(settings.MATCHING_LOCAL_INDEX_CHECK_INTERVAL)
+            ))
         
-        logger.info("DriverMatchingService запущен с двумя воркерами.")
+        logger.info(f"DriverMatchingService запущен с {len(tasks)} воркерами.")
         
         # Ожидаем завершения любой из задач (в случае ошибки)
         done, pending = await asyncio.wait(
-            [listener_task, timeout_task],
+            tasks,
             return_when=asyncio.FIRST_COMPLETED,
         )
 
         # Если одна задача завершилась, отменяем другую для чистого выхода
         for task in pending:
             task.cancel()
+        if metrics_server is not None:
+            metrics_server.close()
         
         logger.info("DriverMatchingService остановлен.")
 
     def stop(self):
         """Останавливает основной цикл работы."""
         self._running = False
+        if self.grid_index is not None:
+            self.grid_index.stop()
+        if self.presence_sweeper is not None:
+            self.presence_sweeper.stop()
+        if self.stream_archiver is not None:
+            self.stream_archiver.stop()
         logger.info("Получен сигнал на остановку DriverMatchingService.")
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+Позиции свободных водителей рядом с точкой для карты пассажира.
+
+Город разбит на квадратные тайлы NEARBY_TILE_SIZE x NEARBY_TILE_SIZE клеток. Для каждого
+тайла процесс API держит снимок позиций водителей, который пересчитывается не чаще раза
+в NEARBY_SNAPSHOT_TTL_MS: все запросы к тайлу в пределах этого окна (в том числе
+пришедшие, пока снимок пересчитывается) получают один и тот же снимок, и тысячи
+пассажиров, смотрящих на один район, стоят одного чтения индекса за период.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from src.core.config import settings
+from src.services.driver_locator import DriverLocator, create_driver_locator
+
+logger = logging.getLogger(__name__)
+
+Tile = tuple[int, int]
+
+
+class NearbyDriversCache:
+    """Снимки позиций водителей по тайлам с ограниченной частотой пересчета."""
+
+    def __init__(
+        self,
+        redis: Redis,
+        locator: Optional[DriverLocator] = None,
+        tile_size: Optional[int] = None,
+        ttl_ms: Optional[int] = None,
+    ):
+        self.locator = locator or create_driver_locator(redis)
+        self.tile_size = tile_size or settings.NEARBY_TILE_SIZE
+        self.ttl_ms = settings.NEARBY_SNAPSHOT_TTL_MS if ttl_ms is None else ttl_ms
+        # {тайл: (время снимка по time.monotonic, позиции водителей)}
+        self._snapshots: dict[Tile, tuple[float, list[tuple[int, int]]]] = {}
+        # Пересчеты, которые идут сейчас: запросы того же тайла ждут их, а не читают индекс сами
+        self._refreshing: dict[Tile, asyncio.Future] = {}
+        self.index_reads = 0  # Сколько раз снимки читали индекс (для метрик и бенчмарков)
+
+    def tiles_for(self, x: int, y: int, radius: int) -> list[Tile]:
+        """Тайлы, покрывающие квадрат [x - radius, x + radius] x [y - radius, y + radius] в пределах сетки."""
+        x_min, x_max = max(x - radius, 0), min(x + radius, self.locator.grid_n - 1)
+        y_min, y_max = max(y - radius, 0), min(y + radius, self.locator.grid_m - 1)
+        size = self.tile_size
+        return [
+            (tx, ty)
+            for tx in range(x_min // size, x_max // size + 1)
+            for ty in range(y_min // size, y_max // size + 1)
+        ]
+
+    async def nearby(self, x: int, y: int, radius: int) -> list[tuple[int, int]]:
+        """
+        Позиции свободных водителей на манхэттенском расстоянии не больше `radius` от (x, y).
+
+        Данные отстают от индекса не больше чем на ttl_ms.
+        """
+        snapshots = await asyncio.gather(*(self.tile_snapshot(tile) for tile in self.tiles_for(x, y, radius)))
+        return sorted(
+            (cx, cy)
+            for positions in snapshots
+            for cx, cy in positions
+            if abs(cx - x) + abs(cy - y) <= radius
+        )
+
+    async def tile_snapshot(self, tile: Tile) -> list[tuple[int, int]]:
+        """Снимок тайла: свежий из кэша, иначе — результат единственного идущего пересчета."""
+        cached = self._snapshots.get(tile)
+        if cached is not None and (time.monotonic() - cached[0]) * 1000 < self.ttl_ms:
+            return cached[1]
+
+        refresh = self._refreshing.get(tile)
+        if refresh is None:
+            refresh = self._refreshing[tile] = asyncio.ensure_future(self._refresh(tile))
+            refresh.add_done_callback(lambda _: self._refreshing.pop(tile, None))
+        # shield: отмена одного запроса не должна отменять пересчет, которого ждут остальные
+        return await asyncio.shield(refresh)
+
+    async def _refresh(self, tile: Tile) -> list[tuple[int, int]]:
+        tx, ty = tile
+        x_min, y_min = tx * self.tile_size, ty * self.tile_size
+        drivers = await self.locator.drivers_in_box(
+            x_min, y_min, x_min + self.tile_size - 1, y_min + self.tile_size - 1
+        )
+        self.index_reads += 1
+        positions = sorted((x, y) for _, x, y in drivers)
+        self._snapshots[tile] = (time.monotonic(), positions)
+        return positions
@@ -0,0 +1,100 @@
+"""
+Битовые карты занятости ячеек геоиндекса.
+
+Для каждой строки сетки x хранится битовая строка `cell_row:{x}`: бит y равен 1,
+если в хэше `cell:x:y` есть хотя бы один водитель. Карты поддерживает
+DriverProfileService.update_presence; сервис подбора читает занятость окна
+вокруг заказа одним pipeline BITFIELD и запрашивает HKEYS только у занятых ячеек.
+
+Бит опустевшей ячейки сбрасывается атомарно с проверкой хэша (SYNC_CELL_OCCUPANCY),
+поэтому занятая ячейка никогда не выглядит пустой. Лишний единичный бит
+стоит только одного напрасного HKEYS.
+"""
+
+import logging
+
+from redis.asyncio import Redis
+
+from src.services.redis_scripts import SYNC_CELL_OCCUPANCY
+
+logger = logging.getLogger(__name__)
+
+ROW_KEY_PREFIX = "cell_row"
+CHUNK_BITS = 32  # Ширина поля BITFIELD GET (u32) при чтении окна
+SCAN_BATCH_SIZE = 1000
+
+
+def row_key(x: int) -> str:
+    """Ключ битовой карты строки сетки x."""
+    return f"{ROW_KEY_PREFIX}:{x}"
+
+
+class OccupancyWindow:
+    """Занятость прямоугольного окна сетки, прочитанная из битовых карт строк."""
+
+    def __init__(self, first_chunk: int, rows: dict[int, list[int]]):
+        self.first_chunk = first_chunk
+        self.rows = rows  # x -> значения u32 по порядку, начиная с first_chunk
+
+    def is_occupied(self, x: int, y: int) -> bool:
+        chunks = self.rows.get(x)
+        if not chunks:
+            return False
+        index = y // CHUNK_BITS - self.first_chunk
+        if not 0 <= index < len(chunks):
+            return False
+        # Бит 0 карты — старший бит первого байта, как у SETBIT
+        return bool((chunks[index] >> (CHUNK_BITS - 1 - y % CHUNK_BITS)) & 1)
+
+
+async def read_occupancy_window(
+    redis: Redis, x_min: int, x_max: int, y_min: int, y_max: int
+) -> OccupancyWindow:
+    """
+    Читает занятость ячеек [x_min, x_max] x [y_min, y_max] одним pipeline:
+    по одной команде BITFIELD на строку с полями u32, покрывающими диапазон y.
+    """
+    first_chunk = y_min // CHUNK_BITS
+    last_chunk = y_max // CHUNK_BITS
+    xs = list(range(x_min, x_max + 1))
+    if not xs or y_min > y_max:
+        return OccupancyWindow(first_chunk, {})
+
+    fields = []
+    for chunk in range(first_chunk, last_chunk + 1):
+        fields.extend(("GET", f"u{CHUNK_BITS}", f"#{chunk}"))
+
+    pipe = redis.pipeline(transaction=False)
+    for x in xs:
+        pipe.execute_command("BITFIELD", row_key(x), *fields)
+    results = await pipe.execute()
+    return OccupancyWindow(first_chunk, {x: [int(v) for v in values] for x, values in zip(xs, results)})
+
+
+async def sync_occupancy_bitmap(redis: Redis) -> int:
+    """
+    Выставляет биты занятости по всем существующим хэшам `cell:*`.
+
+    Нужна один раз после включения карт на уже заполненном геоиндексе.
+    Работает параллельно с обновлениями присутствия: каждый бит пишется
+    атомарно с проверкой своего хэша.
+
+    Returns:
+        Число обработанных ячеек.
+    """
+    script = redis.register_script(SYNC_CELL_OCCUPANCY)
+    synced = 0
+    cursor = 0
+    while True:
+        cursor, keys = await redis.scan(cursor=cursor, match="cell:*", count=SCAN_BATCH_SIZE)
+        if keys:
+            async with redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    _, x, y = key.split(":")
+                    await script(keys=[key, row_key(int(x))], args=[int(y)], client=pipe)
+                await pipe.execute()
+            synced += len(keys)
+        if cursor == 0:
+            break
+    logger.info(f"Битовые карты занятости синхронизированы по {synced} ячейкам.")
+    return synced
@@ -0,0 +1,91 @@
+"""
+Географическое шардирование потока заказов по регионам сетки.
+
+Сетка делится на квадратные регионы размером ORDER_REGION_SIZE клеток.
+Заказ публикуется в стрим региона точки подачи `order_events:{rx}:{ry}`;
+каждый экземпляр DriverMatchingService читает только свои регионы.
+Поиск водителя при этом не ограничен регионом, поэтому водители
+за границей региона находятся как обычно.
+
+При ORDER_REGION_SIZE = 0 шардирование выключено и используется общий стрим `order_events`.
+"""
+
+import math
+
+from src.core.config import settings
+
+ORDER_STREAM_PREFIX = "order_events"
+
+
+def region_grid_size() -> tuple[int, int]:
+    """Возвращает количество регионов по осям X и Y."""
+    size = settings.ORDER_REGION_SIZE
+    if size <= 0:
+        return 1, 1
+    return math.ceil(settings.CITY_GRID_N / size), math.ceil(settings.CITY_GRID_M / size)
+
+
+def region_of(x: int, y: int) -> tuple[int, int]:
+    """Возвращает регион (rx, ry), в который попадает клетка (x, y)."""
+    size = settings.ORDER_REGION_SIZE
+    if size <= 0:
+        return 0, 0
+    regions_x, regions_y = region_grid_size()
+    return min(max(x // size, 0), regions_x - 1), min(max(y // size, 0), regions_y - 1)
+
+
+def region_stream_key(region: tuple[int, int]) -> str:
+    """Ключ стрима заказов для региона."""
+    if settings.ORDER_REGION_SIZE <= 0:
+        return ORDER_STREAM_PREFIX
+    rx, ry = region
+    return f"{ORDER_STREAM_PREFIX}:{rx}:{ry}"
+
+
+def order_stream_key(start_x: int, start_y: int) -> str:
+    """Ключ стрима, в который публикуется заказ с точкой подачи (start_x, start_y)."""
+    return region_stream_key(region_of(start_x, start_y))
+
+
+def all_regions() -> list[tuple[int, int]]:
+    """Все регионы сетки в порядке (rx, ry)."""
+    regions_x, regions_y = region_grid_size()
+    return [(rx, ry) for rx in range(regions_x) for ry in range(regions_y)]
+
+
+def owned_regions(spec: str = "", shard_index: int = 0, shard_count: int = 1) -> list[tuple[int, int]]:
+    """
+    Определяет регионы, которые обслуживает экземпляр сервиса подбора.
+
+    Args:
+        spec: Явный список регионов вида "0:0,0:1,1:0". Пустая строка — использовать шарды.
+        shard_index: Номер шарда экземпляра (0..shard_count-1).
+        shard_count: Общее число шардов; регионы распределяются по номеру региона по модулю.
+
+    Returns:
+        Список регионов (rx, ry).
+    """
+    regions = all_regions()
+    if spec.strip():
+        requested = set()
+        for item in spec.split(","):
+            rx_str, ry_str = item.strip().split(":")
+            requested.add((int(rx_str), int(ry_str)))
+        unknown = requested - set(regions)
+        if unknown:
+            raise ValueError(f"Регионы вне сетки: {sorted(unknown)}")
+        return [r for r in regions if r in requested]
+
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Некорректный номер шарда {shard_index} при числе шардов {shard_count}")
+    return [r for number, r in enumerate(regions) if number % shard_count == shard_index]
+
+
+def owned_stream_keys() -> list[str]:
+    """Ключи стримов заказов, которые обслуживает текущий экземпляр согласно настройкам."""
+    regions = owned_regions(
+        settings.MATCHING_REGIONS,
+        settings.MATCHING_SHARD_INDEX,
+        settings.MATCHING_SHARD_COUNT,
+    )
+    return [region_stream_key(r) for r in regions]
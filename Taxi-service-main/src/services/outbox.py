@@ -0,0 +1,230 @@
+"""
+Transactional outbox для событий поездок.
+
+Сервис поездок не публикует события в Redis на пути запроса: enqueue_* добавляет
+строку outbox_events в текущую транзакцию, и событие фиксируется атомарно
+с изменением поездки. OutboxRelay пачками переносит неотправленные строки
+в стримы через общий StreamPublisher процесса (пачки XADD одним pipeline, ограниченная
+очередь) и отмечает отправленными доставленные строки. Для DriverAssigned релей
+в той же пачке снимает состояние подбора принятого заказа в Redis, поэтому сбой
+Redis не оставляет таймаут предложения, который отправил бы заказ на повторный поиск.
+
+Доставка — «хотя бы один раз»: если релей упадет между XADD и фиксацией sent_at,
+пачка будет опубликована повторно. Отправленные строки хранятся OUTBOX_RETENTION_SECONDS
+(для разбора инцидентов), после чего релей удаляет их, чтобы таблица не росла.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Mapping, Optional, Sequence, Union
+
+from redis.asyncio import Redis
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import func
+
+from src.core.config import settings
+from src.core.db import async_session_maker
+from src.models.outbox import OutboxEvent
+from src.services.redis_publisher import StreamPublisher, queue_clear_matching_state, route_event
+
+logger = logging.getLogger(__name__)
+
+# Сигнал релею своего процесса: после фиксации транзакции с событием его не нужно ждать до следующего опроса
+_outbox_signal = asyncio.Event()
+
+
+def enqueue_event(
+    db: AsyncSession, event_name: str, payload: Mapping[str, Any], stream: Optional[str] = None
+) -> OutboxEvent:
+    """
+    Добавляет событие в outbox текущей транзакции (без обращения к Redis).
+    Без явного `stream` стрим выбирается по таблице маршрутизации redis_publisher.
+    """
+    outbox_event = OutboxEvent(
+        stream=stream or route_event(event_name, payload),
+        event=event_name,
+        payload=json.dumps(payload, ensure_ascii=False),
+    )
+    db.add(outbox_event)
+    return outbox_event
+
+
+def enqueue_order_created(db: AsyncSession, payload: Mapping[str, Any]) -> OutboxEvent:
+    return enqueue_event(db, "OrderCreated", payload)
+
+
+def enqueue_driver_assigned(db: AsyncSession, payload: Mapping[str, Any]) -> OutboxEvent:
+    return enqueue_event(db, "DriverAssigned", payload)
+
+
+def enqueue_ride_completed(db: AsyncSession, payload: Mapping[str, Any]) -> OutboxEvent:
+    return enqueue_event(db, "RideCompleted", payload)
+
+
+def notify_outbox() -> None:
+    """Будит релей процесса; вызывается после фиксации транзакции с событиями."""
+    _outbox_signal.set()
+
+
+class OutboxRelay:
+    """
+    Переносит события из outbox_events в Redis Streams пачками до `batch_size`.
+
+    Несколько релеев (например, в разных процессах API) могут работать одновременно:
+    строки выбираются с FOR UPDATE SKIP LOCKED, и каждая пачка достается одному релею.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        session_factory: Callable[[], AsyncSession] = async_session_maker,
+        publisher: Optional[StreamPublisher] = None,
+    ):
+        self.redis = redis
+        self.session_factory = session_factory
+        # В процессе API релей публикует через общий издатель (get_publisher)
+        self.publisher = publisher or StreamPublisher(redis)
+        self.batch_size = settings.OUTBOX_BATCH_SIZE
+        self.poll_interval = settings.OUTBOX_POLL_INTERVAL
+        self.retention_seconds = settings.OUTBOX_RETENTION_SECONDS
+        self.purge_interval = settings.OUTBOX_PURGE_INTERVAL
+        self._next_purge = 0.0
+        self._running = False
+
+    async def publish_batch(self, events: Sequence[OutboxEvent]) -> list[Union[str, BaseException]]:
+        """
+        Публикует события через StreamPublisher в формате event_schema.
+
+        Returns:
+            Для каждого события — ID записи стрима или ошибка публикации.
+        """
+        return await asyncio.gather(
+            *(
+                self.publisher.publish(outbox_event.event, json.loads(outbox_event.payload), stream=outbox_event.stream)
+                for outbox_event in events
+            ),
+            return_exceptions=True,
+        )
+
+    async def clear_matching_state(self, events: Sequence[OutboxEvent]) -> None:
+        """
+        Снимает состояние подбора для принятых заказов (события DriverAssigned) одним pipeline.
+        Ошибка откатывает пачку, и снятие повторяется вместе с ее повторной публикацией.
+        """
+        assigned = [json.loads(outbox_event.payload) for outbox_event in events if outbox_event.event == "DriverAssigned"]
+        if not assigned:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for payload in assigned:
+            queue_clear_matching_state(pipe, payload["ride_id"], payload["driver_user_id"])
+        await pipe.execute()
+
+    async def relay_once(self) -> int:
+        """
+        Публикует одну пачку неотправленных событий и отмечает отправленными доставленные.
+        Недоставленные события и следующие за ними события того же заказа остаются
+        в outbox до следующего прохода.
+
+        Returns:
+            Число опубликованных событий.
+
+        Raises:
+            Exception: Не доставлено ни одно событие пачки (например, Redis недоступен);
+                транзакция откатывается.
+        """
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(OutboxEvent)
+                .where(OutboxEvent.sent_at.is_(None))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            events = result.scalars().all()
+            if not events:
+                return 0
+
+            results = await self.publish_batch(events)
+            delivered, errors = [], []
+            # Заказы, событие которых не опубликовано: их более поздние события пачки тоже
+            # остаются неотправленными, чтобы после повтора порядок событий заказа сохранился
+            # (иначе DriverAssigned был бы отмечен раньше неопубликованного OrderCreated)
+            failed_rides = set()
+            for outbox_event, result in zip(events, results):
+                ride_id = json.loads(outbox_event.payload).get("ride_id")
+                if isinstance(result, BaseException):
+                    errors.append(result)
+                    failed_rides.add(ride_id)
+                elif ride_id not in failed_rides:
+                    delivered.append(outbox_event)
+            if not delivered:
+                raise errors[0]
+            if errors:
+                logger.error(f"Не опубликовано {len(errors)} событий из outbox, повтор в следующем проходе: {errors[0]}")
+
+            await self.clear_matching_state(delivered)
+            await db.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_([outbox_event.id for outbox_event in delivered]))
+                .values(sent_at=func.now())
+            )
+            await db.commit()
+        return len(delivered)
+
+    async def purge_sent(self, now: Optional[datetime] = None) -> int:
+        """
+        Удаляет отправленные события старше окна хранения. Неотправленные строки не затрагиваются.
+
+        Returns:
+            Число удаленных строк.
+        """
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(seconds=self.retention_seconds)
+        async with self.session_factory() as db:
+            result = await db.execute(delete(OutboxEvent).where(OutboxEvent.sent_at < cutoff))
+            await db.commit()
+        if result.rowcount:
+            logger.info(f"Из outbox удалено {result.rowcount} отправленных событий старше {cutoff.isoformat()}.")
+        return result.rowcount
+
+    async def _purge_if_due(self):
+        """Очистка outbox раз в `purge_interval`; ошибка не останавливает публикацию."""
+        if self.purge_interval <= 0 or time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + self.purge_interval
+        try:
+            await self.purge_sent()
+        except Exception as e:
+            logger.error(f"Ошибка очистки outbox: {e}")
+
+    async def run(self):
+        """Фоновый цикл: публикует пачки подряд, пока outbox не опустеет, затем ждет сигнала или опроса."""
+        self._running = True
+        logger.info(f"Релей outbox запущен (пачка до {self.batch_size}, опрос каждые {self.poll_interval} сек.).")
+        while self._running:
+            # Сигнал сбрасывается до выборки: событие, зафиксированное во время публикации, разбудит следующий цикл
+            _outbox_signal.clear()
+            try:
+                published = await self.relay_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка публикации событий из outbox: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if published >= self.batch_size:
+                continue
+            await self._purge_if_due()
+
+            try:
+                await asyncio.wait_for(_outbox_signal.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        """Останавливает цикл релея."""
+        self._running = False
+        _outbox_signal.set()
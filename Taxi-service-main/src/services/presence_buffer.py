@@ -0,0 +1,174 @@
+"""
+Буфер heartbeat'ов водителей в процессе API.
+
+Водитель в пробке присылает много heartbeat'ов подряд, и каждый стоит вызова
+UPDATE_DRIVER_PRESENCE в Redis. PresenceBuffer хранит только последнее обновление
+каждого водителя и раз в PRESENCE_BUFFER_FLUSH_MS (или после PRESENCE_BUFFER_MAX_UPDATES
+обновлений) записывает всех «грязных» водителей одним pipeline.
+
+Смена статуса (выход на линию, 'offline', 'busy') буфер обходит и пишется сразу,
+чтобы подбор не предлагал заказы ушедшему водителю и сразу видел вышедшего. Запись
+смены статуса ждет окончания идущего сброса: иначе 'offline' мог бы попасть в Redis
+раньше сбрасываемого heartbeat'а, и тот вернул бы водителя на карту.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from src.core.config import settings
+from src.core.metrics import MetricsRegistry
+from src.schemas.driver import DriverPresenceSchema, DriverStatus
+from src.services.driver_locator import DriverLocator
+from src.services.driver_profile_service import DriverProfileService
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин для числа водителей в одной записи буфера
+FLUSH_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PresenceBuffer:
+    """
+    Объединяет heartbeat'ы онлайн-водителей и периодически записывает их в Redis.
+
+    Статус водителей процесс знает только по тем heartbeat'ам, что прошли через него:
+    первый 'online' от водителя всегда пишется сразу, последующие — через буфер.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        locator: Optional[DriverLocator] = None,
+        flush_ms: Optional[int] = None,
+        max_updates: Optional[int] = None,
+    ):
+        self.profile_service = DriverProfileService(redis, locator)
+        self.flush_ms = settings.PRESENCE_BUFFER_FLUSH_MS if flush_ms is None else flush_ms
+        self.max_updates = settings.PRESENCE_BUFFER_MAX_UPDATES if max_updates is None else max_updates
+        # Последнее необработанное обновление каждого водителя: {driver_id: (x, y)}
+        self._pending: dict[int, tuple[int, int]] = {}
+        self._updates_since_flush = 0
+        # Водители, чей выход на линию уже записан этим процессом
+        self._online: set[int] = set()
+        self._flush_needed = asyncio.Event()
+        # Сброс и запись смены статуса не идут одновременно
+        self._write_lock = asyncio.Lock()
+        self._running = False
+
+        self.metrics = MetricsRegistry()
+        r = self.metrics
+        self.buffered_updates = r.counter(
+            "presence_buffer_updates_total", "Число heartbeat'ов, принятых в буфер"
+        )
+        self.bypassed_updates = r.counter(
+            "presence_buffer_bypassed_total", "Число обновлений со сменой статуса, записанных мимо буфера"
+        )
+        self.written_updates = r.counter(
+            "presence_buffer_writes_total", "Число обновлений, записанных в Redis при сбросе буфера"
+        )
+        self.coalescing_ratio = r.gauge(
+            "presence_buffer_coalescing_ratio", "Сколько принятых heartbeat'ов приходится на одну запись в Redis"
+        )
+        self.flush_duration = r.histogram(
+            "presence_buffer_flush_duration_seconds", "Длительность записи буфера в Redis одним pipeline"
+        )
+        self.flush_size = r.histogram(
+            "presence_buffer_flush_size", "Число водителей в одной записи буфера", buckets=FLUSH_SIZE_BUCKETS
+        )
+
+    async def submit(self, driver_id: int, presence_data: DriverPresenceSchema) -> Optional[bool]:
+        """
+        Принимает heartbeat водителя.
+
+        Returns:
+            Результат DriverProfileService.update_presence, если обновление записано сразу,
+            или None, если оно отложено в буфер.
+        """
+        status = presence_data.status
+        if status != DriverStatus.ONLINE or driver_id not in self._online:
+            return await self._write_through(driver_id, presence_data)
+
+        location = presence_data.location
+        self._pending[driver_id] = (location.x, location.y)
+        self._updates_since_flush += 1
+        self.buffered_updates.inc()
+        if self._updates_since_flush >= self.max_updates:
+            self._flush_needed.set()
+        return None
+
+    async def _write_through(self, driver_id: int, presence_data: DriverPresenceSchema) -> bool:
+        """
+        Записывает смену статуса сразу после идущего сброса (если он есть);
+        отложенный heartbeat водителя при этом отбрасывается.
+        """
+        async with self._write_lock:
+            self._pending.pop(driver_id, None)
+            self.bypassed_updates.inc()
+            changed = await self.profile_service.update_presence(driver_id, presence_data)
+            if presence_data.status == DriverStatus.ONLINE:
+                self._online.add(driver_id)
+            else:
+                self._online.discard(driver_id)
+        return changed
+
+    async def flush(self) -> int:
+        """
+        Записывает все отложенные обновления одним pipeline.
+
+        Returns:
+            Число записанных водителей.
+        """
+        self._flush_needed.clear()
+        self._updates_since_flush = 0
+        if not self._pending:
+            return 0
+
+        async with self._write_lock:
+            # Пока ждали записи смены статуса, она могла забрать последние heartbeat'ы
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            started = time.perf_counter()
+            try:
+                await self.profile_service.update_presence_batch(
+                    [(driver_id, DriverStatus.ONLINE, x, y, None) for driver_id, (x, y) in batch.items()],
+                    source="presence_buffer",
+                )
+            except Exception:
+                # Возвращаем обновления в буфер, не затирая пришедшие за время записи;
+                # водителей, ушедших с линии, не возвращаем — иначе следующий сброс снова поставит их на карту
+                for driver_id, location in batch.items():
+                    if driver_id in self._online:
+                        self._pending.setdefault(driver_id, location)
+                raise
+
+        self.flush_duration.observe(time.perf_counter() - started)
+        self.flush_size.observe(len(batch))
+        self.written_updates.inc(len(batch))
+        self.coalescing_ratio.set(self.buffered_updates.value() / self.written_updates.value())
+        return len(batch)
+
+    async def run(self):
+        """Фоновый цикл: сброс буфера раз в `flush_ms` или по достижении `max_updates` обновлений."""
+        self._running = True
+        logger.info(f"Буфер heartbeat'ов запущен (сброс каждые {self.flush_ms} мс или {self.max_updates} обновлений).")
+        while self._running:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=self.flush_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи буфера heartbeat'ов: {e}")
+                await asyncio.sleep(self.flush_ms / 1000)
+
+    async def stop(self):
+        """Останавливает цикл и записывает оставшиеся обновления."""
+        self._running = False
+        self._flush_needed.set()
+        await self.flush()
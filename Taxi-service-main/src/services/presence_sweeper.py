@@ -0,0 +1,94 @@
+"""
+Вытеснение водителей, переставших присылать heartbeat.
+
+DriverProfileService записывает время каждого heartbeat онлайн-водителя в ZSET
+`driver_last_seen`. Если водитель пропал, не отправив 'offline' (разрядился телефон,
+пропала связь), он остается в индексе и сервис подбора предлагает ему заказы,
+каждый раз теряя PROPOSAL_TIMEOUT. StaleDriverSweeper периодически снимает
+с карты водителей, чей последний heartbeat старше PRESENCE_STALE_AFTER.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from src.core.config import settings
+from src.core.metrics import Counter
+from src.services.driver_locations import DriverLocationStore
+from src.services.driver_locator import DriverLocator
+from src.services.driver_profile_service import DriverProfileService
+from src.services.redis_scripts import EVICT_STALE_DRIVERS
+
+logger = logging.getLogger(__name__)
+
+
+class StaleDriverSweeper:
+    """Пачками вытесняет водителей без heartbeat (см. EVICT_STALE_DRIVERS)."""
+
+    def __init__(
+        self,
+        redis: Redis,
+        locator: DriverLocator,
+        evicted_counter: Optional[Counter] = None,
+    ):
+        self.redis = redis
+        self.locator = locator
+        self.locations = DriverLocationStore(redis)
+        self.stale_after = settings.PRESENCE_STALE_AFTER
+        self.interval = settings.PRESENCE_SWEEP_INTERVAL
+        self.batch_size = settings.PRESENCE_SWEEP_BATCH
+        self.evicted_counter = evicted_counter
+        self._evict_script = redis.register_script(EVICT_STALE_DRIVERS)
+        self._running = False
+
+    async def sweep(self, now: Optional[float] = None) -> list[int]:
+        """
+        Вытесняет всех водителей с heartbeat старше `stale_after` секунд (пачками по `batch_size`).
+
+        Returns:
+            ID вытесненных водителей.
+        """
+        cutoff = (time.time() if now is None else now) - self.stale_after
+        evicted: list[int] = []
+        while True:
+            batch = await self._evict_script(
+                keys=[
+                    DriverProfileService.LAST_SEEN_KEY,
+                    DriverProfileService.PRESENCE_STREAM_KEY,
+                    DriverProfileService.PRESENCE_TS_KEY,
+                ],
+                args=[
+                    cutoff,
+                    self.batch_size,
+                    DriverProfileService.PRESENCE_STREAM_MAXLEN,
+                    *self.locations.script_args(),
+                    *self.locator.presence_script_args(),
+                ],
+            )
+            evicted.extend(int(driver_id) for driver_id in batch)
+            if len(batch) < self.batch_size:
+                break
+
+        if evicted:
+            if self.evicted_counter is not None:
+                self.evicted_counter.inc(len(evicted))
+            logger.warning(f"Вытеснено {len(evicted)} водителей без heartbeat дольше {self.stale_after} сек.")
+        return evicted
+
+    async def run(self):
+        """Фоновый цикл вытеснения с периодом `interval`."""
+        self._running = True
+        logger.info("Воркер вытеснения пропавших водителей запущен.")
+        while self._running:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка при вытеснении пропавших водителей: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stop(self):
+        """Останавливает цикл вытеснения."""
+        self._running = False
@@ -1,43 +1,228 @@
 """
 Публикация событий в Redis Streams.
+
+Каждый процесс держит один StreamPublisher (get_publisher) поверх общего пула соединений:
+события из одновременных запросов собираются в пачки и отправляются одним pipeline XADD
+(не больше PUBLISHER_MAX_BATCH, не дольше PUBLISHER_LINGER_MS ожидания). Очередь ограничена
+PUBLISHER_MAX_PENDING: когда Redis не успевает, publish ждет места, а publish_nowait
+сразу отказывает (PublisherOverloadedError).
 """
 
-from typing import Mapping, Any
-import json
+from typing import Callable, Mapping, Any, Optional
 import asyncio
+import logging
 
 from redis.asyncio import Redis
+from src.core.config import settings
 from src.core.redis import redis_pool
+from src.services.event_schema import encode_event
+from src.services.order_regions import order_stream_key
+from src.services.redis_scripts import DECLINE_PROPOSAL
+
+logger = logging.getLogger(__name__)
 
 STREAM_ORDERS = "order_events"
+STREAM_RIDE_LIFECYCLE = "ride_lifecycle_events"
+PROPOSAL_TIMEOUTS_KEY = "proposal_timeouts"
+RETRY_STREAM_KEY = "retry_search_events"
 
+# Таблица маршрутизации: тип события -> функция выбора стрима по нагрузке.
+# Сервис подбора читает только стримы заказов, поэтому события жизненного цикла поездки
+# идут в отдельный стрим и не занимают его цикл чтением и XACK.
+EVENT_ROUTES: dict[str, Callable[[Mapping[str, Any]], str]] = {
+    # Заказ уходит в стрим региона точки подачи (см. order_regions)
+    "OrderCreated": lambda payload: order_stream_key(int(payload["start_x"]), int(payload["start_y"])),
+    "DriverAssigned": lambda payload: STREAM_RIDE_LIFECYCLE,
+    "RideCompleted": lambda payload: STREAM_RIDE_LIFECYCLE,
+}
 
-async def _get_redis_client() -> Redis:
-    return Redis(connection_pool=redis_pool)
-
-
-async def publish_event(event_name: str, payload: Mapping[str, Any]) -> str:
-    client = await _get_redis_client()
-    try:
-        data = {
-            "event": event_name,
-            "data": json.dumps(payload, ensure_ascii=False),
-        }
-        return await client.xadd(STREAM_ORDERS, data)
-    finally:
+# Колбэк доставки: (ID записи стрима, None) при успехе или (None, ошибка)
+DeliveryCallback = Callable[[Optional[str], Optional[BaseException]], None]
+
+# Общий клиент процесса поверх пула соединений
+_redis_client = Redis(connection_pool=redis_pool)
+_publisher: Optional["StreamPublisher"] = None
+
+
+class PublisherOverloadedError(Exception):
+    """Очередь публикации заполнена: Redis не успевает принимать события."""
+
+
+def route_event(event_name: str, payload: Mapping[str, Any]) -> str:
+    """
+    Возвращает стрим события по таблице EVENT_ROUTES.
+
+    Raises:
+        ValueError: Для типа события нет маршрута.
+    """
+    route = EVENT_ROUTES.get(event_name)
+    if route is None:
+        raise ValueError(f"Нет маршрута для события {event_name}")
+    return route(payload)
+
+
+class StreamPublisher:
+    """Долгоживущий издатель событий: пачки XADD одним pipeline из фоновой задачи."""
+
+    def __init__(
+        self,
+        redis: Redis,
+        max_batch: Optional[int] = None,
+        linger_ms: Optional[float] = None,
+        max_pending: Optional[int] = None,
+    ):
+        self.redis = redis
+        self.max_batch = max_batch or settings.PUBLISHER_MAX_BATCH
+        self.linger_ms = settings.PUBLISHER_LINGER_MS if linger_ms is None else linger_ms
+        self.max_pending = max_pending or settings.PUBLISHER_MAX_PENDING
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending)
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0  # Число отправленных pipeline
+        self.published = 0  # Число успешно опубликованных событий
+
+    def _ensure_started(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    async def publish(self, event_name: str, payload: Mapping[str, Any], stream: Optional[str] = None) -> str:
+        """
+        Публикует событие и возвращает ID записи стрима; при заполненной очереди ждет места.
+        Без явного `stream` стрим выбирается по route_event.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        stream = stream or route_event(event_name, payload)
+        await self._queue.put((stream, encode_event(event_name, payload), future))
+        return await future
+
+    def publish_nowait(
+        self,
+        event_name: str,
+        payload: Mapping[str, Any],
+        stream: Optional[str] = None,
+        on_delivery: Optional[DeliveryCallback] = None,
+    ) -> asyncio.Future:
+        """
+        Ставит событие в очередь, не дожидаясь публикации.
+
+        Args:
+            stream: Стрим события; по умолчанию — по route_event.
+            on_delivery: Вызывается после отправки пачки с ID записи или ошибкой.
+
+        Raises:
+            PublisherOverloadedError: Очередь заполнена.
+        """
+        self._ensure_started()
+        stream = stream or route_event(event_name, payload)
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda done: self._deliver(done, event_name, on_delivery))
+        try:
+            self._queue.put_nowait((stream, encode_event(event_name, payload), future))
+        except asyncio.QueueFull:
+            future.cancel()
+            raise PublisherOverloadedError(f"Очередь публикации заполнена ({self.max_pending} событий)")
+        return future
+
+    @staticmethod
+    def _deliver(future: asyncio.Future, event_name: str, on_delivery: Optional[DeliveryCallback]) -> None:
+        if future.cancelled():
+            return
+        error = future.exception()
+        if on_delivery is not None:
+            on_delivery(None if error else future.result(), error)
+        elif error is not None:
+            logger.error(f"Не удалось опубликовать событие {event_name}: {error}")
+
+    async def _run(self):
+        """Фоновая задача: собирает пачку до max_batch событий или linger_ms и отправляет ее."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.linger_ms / 1000
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch: list) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        for stream, fields, _ in batch:
+            pipe.xadd(stream, fields)
+        try:
+            results = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            results = [e] * len(batch)
+        self.flushes += 1
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+                    self.published += 1
+            self._queue.task_done()
+
+    async def close(self) -> None:
+        """Дожидается отправки всех событий из очереди и останавливает фоновую задачу."""
+        if self._flusher is None:
+            return
+        await self._queue.join()
+        self._flusher.cancel()
         try:
-            await client.close()
-        except Exception:
-            await asyncio.sleep(0)
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+        self._flusher = None
+
+
+def get_publisher() -> StreamPublisher:
+    """Издатель событий процесса (создается при первом обращении)."""
+    global _publisher
+    if _publisher is None:
+        _publisher = StreamPublisher(_redis_client)
+    return _publisher
+
+
+async def close_publisher() -> None:
+    """Отправляет оставшиеся события; вызывается при остановке процесса."""
+    if _publisher is not None:
+        await _publisher.close()
+
+
+async def _get_redis_client() -> Redis:
+    return _redis_client
 
 
-async def publish_order_created(payload: Mapping[str, Any]) -> str:
-    return await publish_event("OrderCreated", payload)
+def queue_clear_matching_state(pipe, ride_id: str, driver_user_id: int) -> None:
+    """
+    Добавляет в pipeline снятие состояния подбора для принятого заказа: таймаут предложения
+    (чтобы принятый заказ не ушел в повторный поиск) и сохраненные параметры заказа.
+    """
+    pipe.zrem(PROPOSAL_TIMEOUTS_KEY, f"{ride_id}:{driver_user_id}")
+    pipe.delete(f"ride_order:{ride_id}", f"ride_excluded:{ride_id}")
 
 
-async def publish_driver_assigned(payload: Mapping[str, Any]) -> str:
-    return await publish_event("DriverAssigned", payload)
+async def decline_proposal(ride_id: str, driver_user_id: int, client: Optional[Redis] = None) -> bool:
+    """
+    Отклоняет предложение водителю: снимает его блокировку и сразу отправляет заказ
+    на повторный поиск без этого водителя (см. DECLINE_PROPOSAL).
 
+    Args:
+        client: Клиент Redis вызывающего (например, WebSocket-соединения); по умолчанию — общий клиент процесса.
 
-async def publish_ride_completed(payload: Mapping[str, Any]) -> str:
-    return await publish_event("RideCompleted", payload)
+    Returns:
+        True, если предложение было активно и отклонено.
+    """
+    client = client or await _get_redis_client()
+    script = client.register_script(DECLINE_PROPOSAL)
+    declined = await script(keys=[PROPOSAL_TIMEOUTS_KEY, RETRY_STREAM_KEY], args=[ride_id, driver_user_id])
+    return bool(declined)
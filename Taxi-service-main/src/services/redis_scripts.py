@@ -0,0 +1,550 @@
+"""
+Lua-скрипты, выполняемые на стороне Redis.
+
+Скрипты регистрируются через `Redis.register_script` и вызываются по EVALSHA,
+поэтому тело скрипта передается на сервер только один раз.
+"""
+
+# Поиск ближайшего свободного водителя и его блокировка за один вызов.
+#
+# Обходит кольца-периметры квадрата вокруг точки заказа (как и Python-реализация
+# в DriverMatchingService), внутри кольца сортирует кандидатов по ID и пытается
+# поставить `driver_lock:{id}` через SET NX. Ячейки за пределами сетки пропускаются.
+#
+# Ключи ячеек вычисляются внутри скрипта, поэтому скрипт рассчитан на
+# одиночный инстанс Redis (не Redis Cluster).
+#
+# ARGV: start_x, start_y, max_radius, grid_n, grid_m, ride_id, lock_ttl, min_last_seen, [excluded_driver_id...]
+# Исключенные водители (например, отклонившие этот заказ) пропускаются без попытки блокировки.
+# Если min_last_seen > 0, пропускаются и водители, чей последний heartbeat в `driver_last_seen` старее.
+# Возвращает: {ID заблокированного водителя или 0, просмотрено колец, запрошено ячеек, попыток блокировки}.
+FIND_AND_LOCK_NEAREST_DRIVER = """
+local sx = tonumber(ARGV[1])
+local sy = tonumber(ARGV[2])
+local max_radius = tonumber(ARGV[3])
+local grid_n = tonumber(ARGV[4])
+local grid_m = tonumber(ARGV[5])
+local ride_id = ARGV[6]
+local lock_ttl = tonumber(ARGV[7])
+local min_last_seen = tonumber(ARGV[8])
+
+local rings, cells, attempts = 0, 0, 0
+
+local excluded = {}
+for i = 9, #ARGV do
+    excluded[tonumber(ARGV[i])] = true
+end
+
+local function is_fresh(id)
+    if min_last_seen <= 0 then
+        return true
+    end
+    local seen = redis.call('ZSCORE', 'driver_last_seen', id)
+    return seen and tonumber(seen) >= min_last_seen
+end
+
+local function collect(x, y, out)
+    if x < 0 or y < 0 or x >= grid_n or y >= grid_m then
+        return
+    end
+    cells = cells + 1
+    local ids = redis.call('HKEYS', 'cell:' .. x .. ':' .. y)
+    for _, id in ipairs(ids) do
+        local driver_id = tonumber(id)
+        if not excluded[driver_id] then
+            out[#out + 1] = driver_id
+        end
+    end
+end
+
+local function try_lock(candidates)
+    table.sort(candidates)
+    for _, id in ipairs(candidates) do
+        if is_fresh(id) then
+            attempts = attempts + 1
+            if redis.call('SET', 'driver_lock:' .. id, ride_id, 'EX', lock_ttl, 'NX') then
+                return id
+            end
+        end
+    end
+    return nil
+end
+
+for radius = 0, max_radius do
+    rings = rings + 1
+    local candidates = {}
+    if radius == 0 then
+        collect(sx, sy, candidates)
+    else
+        for i = -radius, radius do
+            collect(sx + i, sy + radius, candidates)
+            collect(sx + i, sy - radius, candidates)
+            if math.abs(i) ~= radius then
+                collect(sx + radius, sy + i, candidates)
+                collect(sx - radius, sy + i, candidates)
+            end
+        end
+    end
+    local driver_id = try_lock(candidates)
+    if driver_id then
+        return {driver_id, rings, cells, attempts}
+    end
+end
+
+return {0, rings, cells, attempts}
+"""
+
+
+# Точный поиск ближайшего по манхэттенскому расстоянию свободного водителя.
+#
+# Обходит L1-ромбы радиуса 0, 1, 2, ...: все ячейки ромба r находятся на расстоянии
+# ровно r, поэтому кандидаты упорядочены по (расстояние, ID), и первый удачный
+# SET NX — ближайший свободный водитель. Ромбы обрезаются по сетке, обход
+# прекращается на самом дальнем углу сетки или на max_radius.
+#
+# Если use_bitmap = 1, занятость ячеек берется из битовых карт строк `cell_row:{x}`
+# (см. occupancy_bitmap): байты окна поиска читаются GETRANGE один раз на строку,
+# а HKEYS выполняется только для занятых ячеек.
+#
+# ARGV: start_x, start_y, max_radius, grid_n, grid_m, ride_id, lock_ttl, use_bitmap, min_last_seen,
+#       [excluded_driver_id...]
+# max_radius задает манхэттенский радиус. min_last_seen и возвращаемое значение —
+# как у FIND_AND_LOCK_NEAREST_DRIVER.
+FIND_AND_LOCK_NEAREST_DRIVER_L1 = """
+local sx = tonumber(ARGV[1])
+local sy = tonumber(ARGV[2])
+local max_radius = tonumber(ARGV[3])
+local grid_n = tonumber(ARGV[4])
+local grid_m = tonumber(ARGV[5])
+local ride_id = ARGV[6]
+local lock_ttl = tonumber(ARGV[7])
+local use_bitmap = ARGV[8] == '1'
+local min_last_seen = tonumber(ARGV[9])
+
+local rings, cells, attempts = 0, 0, 0
+
+local excluded = {}
+for i = 10, #ARGV do
+    excluded[tonumber(ARGV[i])] = true
+end
+
+local function is_fresh(id)
+    if min_last_seen <= 0 then
+        return true
+    end
+    local seen = redis.call('ZSCORE', 'driver_last_seen', id)
+    return seen and tonumber(seen) >= min_last_seen
+end
+
+-- Байты битовых карт строк в пределах окна поиска по y
+local first_byte = math.floor(math.max(sy - max_radius, 0) / 8)
+local last_byte = math.floor(math.min(sy + max_radius, grid_m - 1) / 8)
+local row_bytes = {}
+
+local function occupied(x, y)
+    local bytes = row_bytes[x]
+    if bytes == nil then
+        bytes = redis.call('GETRANGE', 'cell_row:' .. x, first_byte, last_byte)
+        row_bytes[x] = bytes
+    end
+    local byte = string.byte(bytes, math.floor(y / 8) - first_byte + 1) or 0
+    return math.floor(byte / 2 ^ (7 - y % 8)) % 2 == 1
+end
+
+local function collect(x, y, out)
+    if y < 0 or y >= grid_m then
+        return
+    end
+    if use_bitmap and not occupied(x, y) then
+        return
+    end
+    cells = cells + 1
+    local ids = redis.call('HKEYS', 'cell:' .. x .. ':' .. y)
+    for _, id in ipairs(ids) do
+        local driver_id = tonumber(id)
+        if not excluded[driver_id] then
+            out[#out + 1] = driver_id
+        end
+    end
+end
+
+local farthest = math.max(sx, grid_n - 1 - sx) + math.max(sy, grid_m - 1 - sy)
+local last_radius = math.min(max_radius, farthest)
+
+for radius = 0, last_radius do
+    rings = rings + 1
+    local candidates = {}
+    if radius == 0 then
+        if sx >= 0 and sx < grid_n then
+            collect(sx, sy, candidates)
+        end
+    else
+        for dx = math.max(-radius, -sx), math.min(radius, grid_n - 1 - sx) do
+            local dy = radius - math.abs(dx)
+            collect(sx + dx, sy + dy, candidates)
+            if dy ~= 0 then
+                collect(sx + dx, sy - dy, candidates)
+            end
+        end
+    end
+    table.sort(candidates)
+    for _, id in ipairs(candidates) do
+        if is_fresh(id) then
+            attempts = attempts + 1
+            if redis.call('SET', 'driver_lock:' .. id, ride_id, 'EX', lock_ttl, 'NX') then
+                return {id, rings, cells, attempts}
+            end
+        end
+    end
+end
+
+return {0, rings, cells, attempts}
+"""
+
+
+# Атомарная обработка истекших предложений водителям.
+#
+# Забирает из ZSET таймаутов до `limit` предложений со сроком <= now и удаляет их.
+# Для каждого предложения "ride_id:driver_id" снимает `driver_lock:{driver_id}`,
+# только если блокировка все еще принадлежит этому заказу, и публикует событие
+# повторного поиска. Так как все шаги выполняются одним скриптом, одно предложение
+# не может быть обработано дважды несколькими экземплярами сервиса.
+#
+# KEYS: timeouts_zset, retry_stream
+# ARGV: now, limit
+# Возвращает: {число забранных предложений, срок ближайшего оставшегося ("" если нет),
+#              снятые предложения...}
+POP_DUE_PROPOSAL_TIMEOUTS = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+local result = {#due, ''}
+
+for _, member in ipairs(due) do
+    redis.call('ZREM', KEYS[1], member)
+    local ride_id, driver_id = string.match(member, '^(.*):(%d+)$')
+    if ride_id then
+        local lock_key = 'driver_lock:' .. driver_id
+        if redis.call('GET', lock_key) == ride_id then
+            redis.call('DEL', lock_key)
+            redis.call('XADD', KEYS[2], '*', 'ride_id', ride_id, 'exclude_driver_id', driver_id)
+            result[#result + 1] = member
+        end
+    end
+end
+
+local next_due = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if next_due[2] then
+    result[2] = next_due[2]
+end
+return result
+"""
+
+
+# Отказ водителя от предложения.
+#
+# Снимает таймаут предложения "ride_id:driver_id" и, если водитель все еще заблокирован
+# этим заказом, снимает блокировку и публикует событие повторного поиска с исключением
+# водителя — так же, как при таймауте, но без ожидания PROPOSAL_TIMEOUT. Если предложение
+# уже истекло или принято, скрипт ничего не делает.
+#
+# KEYS: timeouts_zset, retry_stream
+# ARGV: ride_id, driver_id
+# Возвращает: 1, если предложение отклонено, иначе 0.
+DECLINE_PROPOSAL = """
+if redis.call('ZREM', KEYS[1], ARGV[1] .. ':' .. ARGV[2]) == 0 then
+    return 0
+end
+local lock_key = 'driver_lock:' .. ARGV[2]
+if redis.call('GET', lock_key) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', lock_key)
+redis.call('XADD', KEYS[2], '*', 'ride_id', ARGV[1], 'exclude_driver_id', ARGV[2])
+return 1
+"""
+
+
+# Атомарное извлечение наступивших элементов отложенной очереди (ZSET по времени).
+#
+# Забирает и удаляет до `limit` элементов со сроком <= now, поэтому каждый элемент
+# достается ровно одному экземпляру сервиса.
+#
+# KEYS: zset
+# ARGV: now, limit
+# Возвращает: {срок ближайшего оставшегося элемента ("" если нет), элементы...}
+POP_DUE_MEMBERS = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+
+local result = {''}
+local next_due = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if next_due[2] then
+    result[1] = next_due[2]
+end
+for _, member in ipairs(due) do
+    result[#result + 1] = member
+end
+return result
+"""
+
+
+# Синхронизация бита занятости ячейки с ее хэшем.
+#
+# Бит y строки `cell_row:{x}` выставляется в 1, если в `cell:x:y` есть водители, иначе в 0.
+# Проверка и запись выполняются атомарно, поэтому бит не может обнулиться у непустой ячейки.
+#
+# KEYS: cell_key, row_key
+# ARGV: y
+# Возвращает: новое значение бита.
+SYNC_CELL_OCCUPANCY = """
+local bit = 0
+if redis.call('HLEN', KEYS[1]) > 0 then
+    bit = 1
+end
+redis.call('SETBIT', KEYS[2], tonumber(ARGV[1]), bit)
+return bit
+"""
+
+
+# Добавление/удаление водителя в хэше ячейки с обновлением счетчиков блоков всех уровней.
+#
+# Счетчики меняются, только если хэш ячейки действительно изменился (HSET/HDEL вернули 1),
+# поэтому повторная отправка той же клетки не завышает их. Обнулившиеся счетчики удаляются,
+# и в хэшах блоков остаются только непустые блоки.
+#
+# KEYS: cell_key, block_key_1, ..., block_key_L
+# ARGV: "add" или "del", driver_id, значение для HSET, поле блока уровня 1, ..., поле блока уровня L
+# Возвращает: 1, если хэш ячейки изменился, иначе 0.
+UPDATE_CELL_MEMBER = """
+local changed
+if ARGV[1] == 'add' then
+    changed = redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+else
+    changed = redis.call('HDEL', KEYS[1], ARGV[2])
+end
+if changed == 0 then
+    return 0
+end
+
+local delta = 1
+if ARGV[1] ~= 'add' then
+    delta = -1
+end
+for i = 2, #KEYS do
+    local field = ARGV[i + 2]
+    if redis.call('HINCRBY', KEYS[i], field, delta) <= 0 then
+        redis.call('HDEL', KEYS[i], field)
+    end
+end
+return 1
+"""
+
+
+# Общие функции скриптов присутствия: изменение пространственного индекса водителей.
+#
+# Параметры индекса передаются в ARGV начиная с позиции `params`:
+#   ARGV[params] = "cells": далее стороны блоков BlockCountIndex (пусто, если индекс блоков выключен);
+#     меняются `cell:X:Y`, биты `cell_row:X` и счетчики `cell_blocks:{сторона}` (как UPDATE_CELL_MEMBER).
+#   ARGV[params] = "geo": далее geo_key и размер клетки в градусах; меняется geo-набор.
+_PRESENCE_INDEX_FUNCTIONS = """
+local function adjust_blocks(params, x, y, delta)
+    for i = params + 1, #ARGV do
+        local size = tonumber(ARGV[i])
+        local key = 'cell_blocks:' .. size
+        local field = math.floor(x / size) .. ':' .. math.floor(y / size)
+        if redis.call('HINCRBY', key, field, delta) <= 0 then
+            redis.call('HDEL', key, field)
+        end
+    end
+end
+
+local function remove_from_index(params, driver_id, x, y)
+    if ARGV[params] ~= 'cells' then
+        redis.call('ZREM', ARGV[params + 1], driver_id)
+        return
+    end
+    local cell_key = 'cell:' .. x .. ':' .. y
+    if redis.call('HDEL', cell_key, driver_id) == 1 then
+        adjust_blocks(params, x, y, -1)
+    end
+    local bit = 0
+    if redis.call('HLEN', cell_key) > 0 then
+        bit = 1
+    end
+    redis.call('SETBIT', 'cell_row:' .. x, y, bit)
+end
+
+local function add_to_index(params, driver_id, x, y)
+    if ARGV[params] ~= 'cells' then
+        local degrees = tonumber(ARGV[params + 2])
+        redis.call('GEOADD', ARGV[params + 1], x * degrees, y * degrees, driver_id)
+        return
+    end
+    if redis.call('HSET', 'cell:' .. x .. ':' .. y, driver_id, 'online') == 1 then
+        adjust_blocks(params, x, y, 1)
+    end
+    redis.call('SETBIT', 'cell_row:' .. x, y, 1)
+end
+"""
+
+
+# Общие функции скриптов присутствия: локация водителя в хэше `driver_locations:{bucket}`
+# (см. DriverLocationStore) в виде упакованного целого x * pack_base + y.
+#
+# Пока не выполнена миграция (MIGRATE_DRIVER_LOCATIONS), локация может лежать в старом
+# ключе `driver_location:{id}` ("x:y"): он читается как запасной и удаляется при записи.
+_DRIVER_LOCATION_FUNCTIONS = """
+local function read_location(key, driver_id, pack_base)
+    local packed = redis.call('HGET', key, driver_id)
+    if packed then
+        return tonumber(packed)
+    end
+    local legacy = redis.call('GET', 'driver_location:' .. driver_id)
+    if not legacy then
+        return nil
+    end
+    local sep = string.find(legacy, ':')
+    return tonumber(string.sub(legacy, 1, sep - 1)) * pack_base + tonumber(string.sub(legacy, sep + 1))
+end
+
+local function delete_location(key, driver_id)
+    redis.call('HDEL', key, driver_id)
+    redis.call('DEL', 'driver_location:' .. driver_id)
+end
+"""
+
+
+# Атомарное обновление присутствия водителя за один round trip.
+#
+# Старая клетка читается из хэша локаций внутри скрипта, поэтому два одновременных
+# обновления одного водителя не могут оставить его в двух ячейках. Если водитель остался
+# в той же клетке (или уже снят с карты), индекс и стрим не меняются — обновляется только
+# время последнего heartbeat в `driver_last_seen` (по нему вытесняются пропавшие водители).
+#
+# Если передана метка времени источника (ts, мс), обновление старше последнего
+# примененного для этого водителя отбрасывается — так переупорядоченные в пути
+# обновления шлюзов не возвращают водителя в прошлую клетку. Уход с линии удаляет
+# сохраненную метку, поэтому ошибочная метка из будущего не блокирует водителя навсегда.
+#
+# KEYS: driver_locations_bucket_key, presence_stream, presence_ts_hash, last_seen_zset
+# ARGV: driver_id, status, x, y, stream_maxlen, ts ("" — без проверки порядка), now, pack_base,
+#       параметры индекса...
+# Возвращает: 1, если присутствие изменилось, 0 — если не изменилось, -1 — если обновление устарело.
+UPDATE_DRIVER_PRESENCE = _PRESENCE_INDEX_FUNCTIONS + _DRIVER_LOCATION_FUNCTIONS + """
+local driver_id = ARGV[1]
+local online = ARGV[2] == 'online'
+local pack_base = tonumber(ARGV[8])
+local new_x, new_y = tonumber(ARGV[3]), tonumber(ARGV[4])
+local new_packed = new_x * pack_base + new_y
+
+if ARGV[6] ~= '' then
+    local last_ts = redis.call('HGET', KEYS[3], driver_id)
+    if last_ts and tonumber(last_ts) >= tonumber(ARGV[6]) then
+        return -1
+    end
+    if online then
+        redis.call('HSET', KEYS[3], driver_id, ARGV[6])
+    end
+end
+
+if online then
+    redis.call('ZADD', KEYS[4], ARGV[7], driver_id)
+else
+    redis.call('ZREM', KEYS[4], driver_id)
+    redis.call('HDEL', KEYS[3], driver_id)
+end
+
+local old_packed = read_location(KEYS[1], driver_id, pack_base)
+if (online and old_packed == new_packed) or (not online and not old_packed) then
+    return 0
+end
+
+if old_packed then
+    remove_from_index(9, driver_id, math.floor(old_packed / pack_base), old_packed % pack_base)
+end
+
+local event_cell = ''
+if online then
+    add_to_index(9, driver_id, new_x, new_y)
+    redis.call('HSET', KEYS[1], driver_id, new_packed)
+    redis.call('DEL', 'driver_location:' .. driver_id)
+    event_cell = new_x .. ':' .. new_y
+else
+    delete_location(KEYS[1], driver_id)
+end
+
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[5], '*', 'driver_id', driver_id, 'cell', event_cell)
+return 1
+"""
+
+
+# Вытеснение водителей, которые перестали присылать heartbeat, не уйдя offline.
+#
+# Забирает из `driver_last_seen` до `limit` водителей со временем последнего heartbeat <= cutoff
+# и снимает каждого с карты так же, как обновление со статусом offline (в том числе удаляет
+# метку времени последнего обновления). Проверка и удаление выполняются одним скриптом,
+# поэтому водитель, приславший heartbeat, вытеснен не будет.
+#
+# KEYS: last_seen_zset, presence_stream, presence_ts_hash
+# ARGV: cutoff, limit, stream_maxlen, число хэшей локаций, pack_base, параметры индекса...
+# Возвращает: ID вытесненных водителей.
+EVICT_STALE_DRIVERS = _PRESENCE_INDEX_FUNCTIONS + _DRIVER_LOCATION_FUNCTIONS + """
+local buckets, pack_base = tonumber(ARGV[4]), tonumber(ARGV[5])
+local stale = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, driver_id in ipairs(stale) do
+    redis.call('ZREM', KEYS[1], driver_id)
+    redis.call('HDEL', KEYS[3], driver_id)
+    local location_key = 'driver_locations:' .. (tonumber(driver_id) % buckets)
+    local packed = read_location(location_key, driver_id, pack_base)
+    if packed then
+        remove_from_index(6, driver_id, math.floor(packed / pack_base), packed % pack_base)
+        delete_location(location_key, driver_id)
+        redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*', 'driver_id', driver_id, 'cell', '')
+    end
+end
+return stale
+"""
+
+
+# Перенос старых ключей `driver_location:{id}` ("x:y") в хэши `driver_locations:{bucket}`.
+#
+# Каждый ключ переносится атомарно: HSETNX не затирает локацию, уже записанную скриптом
+# присутствия, а ключ, удаленный между SCAN и вызовом скрипта, просто пропускается.
+#
+# KEYS: старые ключи driver_location:{id}
+# ARGV: число хэшей локаций, pack_base
+# Возвращает: число перенесенных водителей.
+MIGRATE_DRIVER_LOCATIONS = """
+local buckets, pack_base = tonumber(ARGV[1]), tonumber(ARGV[2])
+local migrated = 0
+for _, key in ipairs(KEYS) do
+    local value = redis.call('GET', key)
+    if value then
+        local driver_id = string.sub(key, string.len('driver_location:') + 1)
+        local sep = string.find(value, ':')
+        local packed = tonumber(string.sub(value, 1, sep - 1)) * pack_base + tonumber(string.sub(value, sep + 1))
+        redis.call('HSETNX', 'driver_locations:' .. (tonumber(driver_id) % buckets), driver_id, packed)
+        redis.call('DEL', key)
+        migrated = migrated + 1
+    end
+end
+return migrated
+"""
+
+
+# Блокировка водителя, только если он недавно присылал heartbeat.
+#
+# KEYS: driver_lock_key, last_seen_zset
+# ARGV: driver_id, ride_id, lock_ttl, min_last_seen
+# Возвращает: 1, если блокировка установлена, иначе 0.
+LOCK_DRIVER_IF_FRESH = """
+local seen = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not seen or tonumber(seen) < tonumber(ARGV[4]) then
+    return 0
+end
+if redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]), 'NX') then
+    return 1
+end
+return 0
+"""
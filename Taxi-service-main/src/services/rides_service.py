@@ -2,13 +2,16 @@
 Сервис для управления поездками (Rides).
 - создание поездки
 - назначение водителя
+- отказ водителя от предложения
 - обновление статуса
 - история поездок
-- публикация событий OrderCreated / DriverAssigned / RideCompleted
+- публикация событий OrderCreated / DriverAssigned / RideCompleted через outbox
+  (событие фиксируется в той же транзакции, в Redis его переносит OutboxRelay)
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from fastapi import HTTPException, status
+from redis.asyncio import Redis
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -18,12 +21,14 @@ from src.schemas.ride import (
     RideCreateSchema,
     RideResponseSchema,
 )
-from src.services.pricing_service import calculate_price_and_eta
-from src.services.redis_publisher import (
-    publish_order_created,
-    publish_driver_assigned,
-    publish_ride_completed,
+from src.services.outbox import (
+    enqueue_order_created,
+    enqueue_driver_assigned,
+    enqueue_ride_completed,
+    notify_outbox,
 )
+from src.services.pricing_service import calculate_price_and_eta
+from src.services.redis_publisher import decline_proposal
 
 
 def _build_ride_response(ride: Ride) -> RideResponseSchema:
@@ -45,7 +50,7 @@ async def create_ride(
     passenger_user_id: int,
     db: AsyncSession
 ) -> RideResponseSchema:
-    """Создает новую поездку и публикует событие OrderCreated."""
+    """Создает новую поездку и в той же транзакции ставит в outbox событие OrderCreated."""
 
     pricing = calculate_price_and_eta(
         start_x=ride_data.start_x,
@@ -64,10 +69,11 @@ async def create_ride(
         price=pricing["price"],
     )
     db.add(new_ride)
-    await db.commit()
+    # flush выдает id и created_at поездки, не фиксируя транзакцию
+    await db.flush()
     await db.refresh(new_ride)
 
-    # Публикация OrderCreated
+    # OrderCreated
     payload: Dict[str, Any] = {
         "ride_id": str(new_ride.id),
         "passenger_user_id": str(new_ride.passenger_user_id),
@@ -80,11 +86,9 @@ async def create_ride(
         "status": new_ride.status,
         "created_at": new_ride.created_at.isoformat() if new_ride.created_at else None
     }
-
-    try:
-        await publish_order_created(payload)
-    except Exception:
-        pass
+    enqueue_order_created(db, payload)
+    await db.commit()
+    notify_outbox()
 
     return _build_ride_response(new_ride)
 
@@ -94,7 +98,7 @@ async def assign_driver(
     driver_user_id: int,
     db: AsyncSession
 ) -> RideResponseSchema:
-    """Назначает водителя на поездку и публикует событие DriverAssigned."""
+    """Назначает водителя на поездку и в той же транзакции ставит в outbox событие DriverAssigned."""
 
     ride = await db.get(Ride, int(ride_id))
     if not ride:
@@ -111,29 +115,40 @@ async def assign_driver(
     ride.status = RideStatusEnum.DRIVER_ASSIGNED.value
     ride.version += 1
 
-    await db.commit()
-    await db.refresh(ride)
-
-    # Публикуем DriverAssigned
+    # DriverAssigned
     payload = {
         "ride_id": str(ride.id),
         "driver_user_id": str(driver_user_id),
         "status": ride.status
     }
-    try:
-        await publish_driver_assigned(payload)
-    except Exception:
-        pass
+    enqueue_driver_assigned(db, payload)
+
+    await db.commit()
+    await db.refresh(ride)
+    # Состояние подбора снимает OutboxRelay при публикации DriverAssigned (с повтором при ошибке Redis)
+    notify_outbox()
 
     return _build_ride_response(ride)
 
 
+async def decline_ride(ride_id: str, driver_user_id: int, redis: Optional[Redis] = None) -> None:
+    """
+    Водитель отказывается от предложенного заказа: заказ сразу уходит на повторный поиск
+    без этого водителя, не дожидаясь таймаута предложения.
+    """
+    if not await decline_proposal(ride_id, driver_user_id, client=redis):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Предложение по этому заказу уже неактивно",
+        )
+
+
 async def update_ride_status(
     ride_id: str,
     new_status: str,
     db: AsyncSession
 ) -> RideResponseSchema:
-    """Обновляет статус поездки и публикует событие RideCompleted, если применимо."""
+    """Обновляет статус поездки и ставит в outbox событие RideCompleted, если поездка завершена."""
 
     ride = await db.get(Ride, int(ride_id))
     if not ride:
@@ -141,19 +156,20 @@ async def update_ride_status(
 
     ride.status = new_status
     ride.version += 1
-    await db.commit()
-    await db.refresh(ride)
 
-    # Если поездка завершена → публикуем RideCompleted
-    if new_status == RideStatusEnum.COMPLETED.value:
+    # Если поездка завершена → RideCompleted
+    completed = new_status == RideStatusEnum.COMPLETED.value
+    if completed:
         payload = {
             "ride_id": str(ride.id),
             "status": ride.status
         }
-        try:
-            await publish_ride_completed(payload)
-        except Exception:
-            pass
+        enqueue_ride_completed(db, payload)
+
+    await db.commit()
+    await db.refresh(ride)
+    if completed:
+        notify_outbox()
 
     return _build_ride_response(ride)
 
@@ -0,0 +1,251 @@
+"""
+Хранение и архивация стримов событий.
+
+Стримы заказов (`order_events` или стримы регионов), `retry_search_events`
+и `ride_lifecycle_events` растут с каждым заказом. StreamArchiver периодически
+выгружает записи старше STREAM_RETENTION_SECONDS в сжатые сегменты в PostgreSQL
+(таблица stream_archive_segments) и только после этого обрезает стрим (XTRIM MINID ~),
+поэтому память Redis ограничена окном хранения, а история для повторного проигрывания
+и отладки не теряется. Записи, которые группа потребителей еще не прочитала
+или не подтвердила, не архивируются и не обрезаются. Архивация включается
+настройкой STREAM_ARCHIVE_INTERVAL и требует PostgreSQL.
+
+Архив общий для всех экземпляров сервиса подбора: стрим в проходе может выгрузить
+любой из них, а read_archived_range читает всю историю с любого узла. Последний
+выгруженный ID стрима — конец его последнего сегмента; сегмент и эта отметка
+фиксируются одной вставкой, поэтому записи, оставшиеся в стриме после
+приблизительной обрезки или сбоя перед ней, повторно не выгружаются.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import time
+from typing import Callable, Iterable, Optional
+
+from redis.asyncio import Redis
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import settings
+from src.core.db import async_session_maker
+from src.core.metrics import Counter
+from src.models.stream_archive import StreamArchiveSegment
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY_PREFIX = "stream_archive_lock:"  # Один проход архивации стрима за интервал на все экземпляры
+
+StreamId = tuple[int, int]
+StreamEntry = tuple[str, dict]
+
+
+def parse_stream_id(entry_id: str) -> StreamId:
+    """Разбирает ID записи стрима "ms-seq" в кортеж для сравнения."""
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def format_stream_id(stream_id: StreamId) -> str:
+    return f"{stream_id[0]}-{stream_id[1]}"
+
+
+def encode_segment(entries: list[StreamEntry]) -> bytes:
+    """Сжимает записи сегмента в gzip JSON Lines: {"id": ..., "fields": {...}} на строку."""
+    lines = "".join(
+        json.dumps({"id": entry_id, "fields": fields}, ensure_ascii=False) + "\n" for entry_id, fields in entries
+    )
+    return gzip.compress(lines.encode("utf-8"))
+
+
+def decode_segment(data: bytes) -> list[StreamEntry]:
+    records = (json.loads(line) for line in gzip.decompress(data).decode("utf-8").splitlines())
+    return [(record["id"], record["fields"]) for record in records]
+
+
+class ArchiveSegmentStore:
+    """Сегменты архива в таблице stream_archive_segments."""
+
+    def __init__(self, session_factory: Callable[[], AsyncSession] = async_session_maker):
+        self.session_factory = session_factory
+
+    async def last_archived_id(self, stream_key: str) -> Optional[StreamId]:
+        """ID последней выгруженной записи стрима или None, если архив стрима пуст."""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(StreamArchiveSegment.last_ms, StreamArchiveSegment.last_seq)
+                .where(StreamArchiveSegment.stream == stream_key)
+                .order_by(StreamArchiveSegment.last_ms.desc(), StreamArchiveSegment.last_seq.desc())
+                .limit(1)
+            )
+            row = result.first()
+        return None if row is None else (row[0], row[1])
+
+    async def save_segment(self, stream_key: str, entries: list[StreamEntry]) -> None:
+        """Сохраняет подряд идущие записи стрима одним сегментом."""
+        data = await asyncio.to_thread(encode_segment, entries)
+        first_ms, first_seq = parse_stream_id(entries[0][0])
+        last_ms, last_seq = parse_stream_id(entries[-1][0])
+        async with self.session_factory() as db:
+            db.add(StreamArchiveSegment(
+                stream=stream_key,
+                first_ms=first_ms,
+                first_seq=first_seq,
+                last_ms=last_ms,
+                last_seq=last_seq,
+                entry_count=len(entries),
+                entries=data,
+            ))
+            await db.commit()
+
+    async def load_segments(self, stream_key: str, start: StreamId, end: Optional[StreamId]) -> list[bytes]:
+        """Сжатые сегменты стрима, пересекающиеся с диапазоном [start, end], по порядку ID."""
+        query = select(StreamArchiveSegment.entries).where(
+            StreamArchiveSegment.stream == stream_key,
+            tuple_(StreamArchiveSegment.last_ms, StreamArchiveSegment.last_seq) >= start,
+        )
+        if end is not None:
+            query = query.where(tuple_(StreamArchiveSegment.first_ms, StreamArchiveSegment.first_seq) <= end)
+        async with self.session_factory() as db:
+            result = await db.execute(
+                query.order_by(StreamArchiveSegment.first_ms, StreamArchiveSegment.first_seq)
+            )
+            return list(result.scalars().all())
+
+
+async def read_archived_range(
+    stream_key: str,
+    start_id: str = "-",
+    end_id: str = "+",
+    store: Optional[ArchiveSegmentStore] = None,
+) -> list[StreamEntry]:
+    """
+    Читает выгруженные записи стрима с ID в диапазоне [start_id, end_id] (как XRANGE).
+
+    Загружаются только сегменты, пересекающиеся с диапазоном.
+    """
+    store = store or ArchiveSegmentStore()
+    start = (0, 0) if start_id == "-" else parse_stream_id(start_id)
+    end = None if end_id == "+" else parse_stream_id(end_id)
+
+    entries: list[StreamEntry] = []
+    for data in await store.load_segments(stream_key, start, end):
+        for entry_id, fields in decode_segment(data):
+            parsed_id = parse_stream_id(entry_id)
+            if parsed_id >= start and (end is None or parsed_id <= end):
+                entries.append((entry_id, fields))
+    return entries
+
+
+class StreamArchiver:
+    """Выгружает старые записи стримов в сегменты и обрезает стримы."""
+
+    def __init__(
+        self,
+        redis: Redis,
+        stream_keys: Iterable[str],
+        archived_counter: Optional[Counter] = None,
+        store: Optional[ArchiveSegmentStore] = None,
+        retention_seconds: Optional[float] = None,
+        segment_size: Optional[int] = None,
+    ):
+        self.redis = redis
+        self.stream_keys = list(stream_keys)
+        self.archived_counter = archived_counter
+        self.store = store or ArchiveSegmentStore()
+        self.retention_seconds = settings.STREAM_RETENTION_SECONDS if retention_seconds is None else retention_seconds
+        self.segment_size = segment_size or settings.STREAM_ARCHIVE_SEGMENT_SIZE
+        self.interval = settings.STREAM_ARCHIVE_INTERVAL
+        # XTRIM ~ удаляет только целые узлы стрима: дешево, а остаток уже выгружен и отсечен водяной отметкой
+        self.approximate_trim = True
+        self._running = False
+
+    async def _safe_cutoff(self, stream_key: str, now: float) -> Optional[StreamId]:
+        """
+        Граница архивации: записи с меньшим ID старше окна хранения и уже обработаны
+        всеми группами (выданы и подтверждены). None — стрима нет.
+        """
+        try:
+            groups = await self.redis.xinfo_groups(stream_key)
+        except Exception as e:
+            if "no such key" in str(e).lower():
+                return None
+            raise
+
+        cutoff = (int((now - self.retention_seconds) * 1000), 0)
+        for group in groups:
+            last_delivered = parse_stream_id(group["last-delivered-id"])
+            cutoff = min(cutoff, (last_delivered[0], last_delivered[1] + 1))
+            if group.get("pending"):
+                pending = await self.redis.xpending(stream_key, group["name"])
+                cutoff = min(cutoff, parse_stream_id(pending["min"]))
+        return cutoff
+
+    async def archive_stream(self, stream_key: str, now: Optional[float] = None) -> int:
+        """
+        Выгружает записи стрима до безопасной границы сегментами по `segment_size`
+        и обрезает стрим до последней выгруженной записи.
+
+        Returns:
+            Число выгруженных записей.
+        """
+        cutoff = await self._safe_cutoff(stream_key, time.time() if now is None else now)
+        if cutoff is None:
+            return 0
+
+        watermark = await self.store.last_archived_id(stream_key)
+        archived = 0
+        while True:
+            entries = await self.redis.xrange(
+                stream_key, f"({format_stream_id(watermark)}" if watermark else "-", "+", count=self.segment_size
+            )
+            due = [(entry_id, fields) for entry_id, fields in entries if parse_stream_id(entry_id) < cutoff]
+            if not due:
+                break
+            # Сегмент (и с ним отметка) фиксируется до обрезки: при сбое перед XTRIM записи остаются
+            # в стриме, но повторно не выгружаются
+            await self.store.save_segment(stream_key, due)
+            watermark = parse_stream_id(due[-1][0])
+            archived += len(due)
+            if len(due) < len(entries) or len(entries) < self.segment_size:
+                break
+
+        if watermark:
+            await self.redis.xtrim(
+                stream_key, minid=format_stream_id((watermark[0], watermark[1] + 1)), approximate=self.approximate_trim
+            )
+        if archived:
+            if self.archived_counter is not None:
+                self.archived_counter.inc(archived, stream=stream_key)
+            logger.info(f"Стрим {stream_key}: выгружено в архив {archived} записей до {format_stream_id(watermark)}.")
+        return archived
+
+    async def archive_all(self, now: Optional[float] = None) -> int:
+        """
+        Архивирует все стримы, за которые в этом интервале еще не взялся другой экземпляр.
+        Блокировка не снимается и истекает через `interval`.
+        """
+        archived = 0
+        for stream_key in self.stream_keys:
+            acquired = await self.redis.set(
+                f"{LOCK_KEY_PREFIX}{stream_key}", "1", nx=True, px=max(int(self.interval * 1000), 1)
+            )
+            if acquired:
+                archived += await self.archive_stream(stream_key, now)
+        return archived
+
+    async def run(self):
+        """Фоновый цикл архивации с периодом `interval`."""
+        self._running = True
+        logger.info(f"Архивация стримов запущена (хранение {self.retention_seconds} сек.).")
+        while self._running:
+            try:
+                await self.archive_all()
+            except Exception as e:
+                logger.error(f"Ошибка архивации стримов: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stop(self):
+        """Останавливает цикл архивации."""
+        self._running = False
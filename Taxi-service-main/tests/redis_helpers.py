@@ -0,0 +1,48 @@
+"""
+Вспомогательные средства тестов для работы с Redis.
+Бенчмарки (scripts/bench_utils) используют тот же счетчик команд.
+"""
+
+
+class RedisCommandCounter:
+    """
+    Считает round trip'ы и команды, которые клиент отправляет в Redis.
+
+    Pipeline считается одним round trip'ом, но всеми своими командами.
+    Команды, выполняемые внутри Lua-скрипта, видны как одна команда EVALSHA.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.round_trips = 0
+        self.commands = 0
+        self._install()
+
+    def _install(self):
+        original_execute_command = self.client.execute_command
+        original_pipeline = self.client.pipeline
+
+        async def execute_command(*args, **kwargs):
+            self.round_trips += 1
+            self.commands += 1
+            return await original_execute_command(*args, **kwargs)
+
+        def pipeline(*args, **kwargs):
+            pipe = original_pipeline(*args, **kwargs)
+            original_execute = pipe.execute
+
+            async def execute(*e_args, **e_kwargs):
+                if pipe.command_stack:
+                    self.round_trips += 1
+                    self.commands += len(pipe.command_stack)
+                return await original_execute(*e_args, **e_kwargs)
+
+            pipe.execute = execute
+            return pipe
+
+        self.client.execute_command = execute_command
+        self.client.pipeline = pipeline
+
+    def reset(self):
+        self.round_trips = 0
+        self.commands = 0
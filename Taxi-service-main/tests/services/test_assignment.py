@@ -0,0 +1,51 @@
+"""Unit-тесты для алгоритмов пакетного назначения."""
+
+import itertools
+import random
+
+from src.services.assignment import INF, assignment_cost, greedy_assignment, solve_min_cost_assignment
+
+
+def _brute_force(cost):
+    """Перебирает все назначения: максимум назначенных строк, затем минимум стоимости."""
+    n, m = len(cost), len(cost[0])
+    best = (0, 0.0)
+    columns = list(range(m)) + [None] * n
+    for perm in set(itertools.permutations(columns, n)):
+        pairs = [(i, j) for i, j in enumerate(perm) if j is not None and cost[i][j] != INF]
+        key = (len(pairs), sum(cost[i][j] for i, j in pairs))
+        if key[0] > best[0] or (key[0] == best[0] and key[1] < best[1]):
+            best = key
+    return best
+
+
+def test_min_cost_assignment_beats_greedy():
+    """
+    Тест-кейс: Жадный выбор отдает первому заказу водителя, нужного второму.
+
+    Ожидаемый результат: оптимальное назначение дает меньшую суммарную дистанцию.
+    """
+    cost = [
+        [1, 2],
+        [1, 10],
+    ]
+    assignment = solve_min_cost_assignment(cost)
+    assert assignment == [1, 0]
+    assert assignment_cost(cost, assignment) == (2, 3)
+    assert assignment_cost(cost, greedy_assignment(cost)) == (2, 11)
+
+
+def test_min_cost_assignment_matches_brute_force_on_random_matrices():
+    """Тест-кейс: На случайных матрицах (в том числе с недопустимыми парами) результат совпадает с перебором."""
+    rng = random.Random(7)
+    for _ in range(200):
+        n, m = rng.randint(1, 4), rng.randint(1, 4)
+        cost = [
+            [INF if rng.random() < 0.3 else rng.randint(0, 20) for _ in range(m)]
+            for _ in range(n)
+        ]
+        assignment = solve_min_cost_assignment(cost)
+        used = [j for j in assignment if j is not None]
+        assert len(used) == len(set(used))
+        assert all(cost[i][j] != INF for i, j in enumerate(assignment) if j is not None)
+        assert assignment_cost(cost, assignment) == _brute_force(cost)
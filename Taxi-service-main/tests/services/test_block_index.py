@@ -0,0 +1,122 @@
+"""Unit-тесты для иерархического индекса блоков."""
+
+import random
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from tests.redis_helpers import RedisCommandCounter
+from src.schemas.driver import DriverPresenceSchema, DriverLocationSchema, DriverStatus
+from src.services.block_index import BlockCountIndex
+from src.services.driver_locator import CellHashLocator
+from src.services.driver_profile_service import DriverProfileService
+from src.services.matching_service import DriverMatchingService
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+GRID_N = GRID_M = 300
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+@pytest.fixture
+def block_index(redis_client: FakeRedis) -> BlockCountIndex:
+    """Фикстура: три уровня блоков со сторонами 4, 16 и 64 клетки."""
+    return BlockCountIndex(redis_client, GRID_N, GRID_M, block_size=4, levels=3)
+
+
+def location(x: int, y: int) -> DriverLocationSchema:
+    # Схема проверяет координаты по CITY_GRID_N/M настроек, а тестовая сетка больше
+    return DriverLocationSchema.model_construct(x=x, y=y)
+
+
+def online(x: int, y: int) -> DriverPresenceSchema:
+    return DriverPresenceSchema(status=DriverStatus.ONLINE, location=location(x, y))
+
+
+async def test_nearest_and_counts_match_brute_force(redis_client: FakeRedis, block_index: BlockCountIndex):
+    """
+    Тест-кейс: 80 водителей выходят на линию, часть переезжает, часть уходит offline.
+
+    Ожидаемый результат:
+    1. nearest совпадает с полным перебором по (манхэттенское расстояние, ID) с учетом исключенных.
+    2. Счетчики блоков совпадают с пересчетом (rebuild), пустых блоков в хэшах нет.
+    """
+    locator = CellHashLocator(redis_client, GRID_N, GRID_M, block_index=block_index)
+    service = DriverProfileService(redis=redis_client, locator=locator)
+    rng = random.Random(5)
+    locations = {}
+    for step in range(140):
+        driver_id = rng.randint(1, 80) if step >= 80 else step + 1
+        if step >= 120 and driver_id in locations:
+            x, y = locations.pop(driver_id)
+            offline = DriverPresenceSchema(status=DriverStatus.OFFLINE, location=location(x, y))
+            await service.update_presence(driver_id, offline)
+            continue
+        x, y = rng.randint(0, GRID_N - 1), rng.randint(0, GRID_M - 1)
+        locations[driver_id] = (x, y)
+        await service.update_presence(driver_id, online(x, y))
+
+    excluded = frozenset({4, 9})
+    for _ in range(30):
+        x, y = rng.randint(0, GRID_N - 1), rng.randint(0, GRID_M - 1)
+        expected = sorted(
+            (abs(dx - x) + abs(dy - y), driver_id)
+            for driver_id, (dx, dy) in locations.items()
+            if driver_id not in excluded and abs(dx - x) + abs(dy - y) <= 120
+        )[:4]
+        result = await locator.nearest(x, y, 4, 120, excluded)
+        assert result == [(driver_id, distance) for distance, driver_id in expected]
+
+    counts = [await redis_client.hgetall(block_index.block_key(level)) for level in range(3)]
+    assert all(int(count) > 0 for level_counts in counts for count in level_counts.values())
+    assert sum(int(count) for count in counts[2].values()) == len(locations)
+    assert await block_index.rebuild() == len(locations)
+    assert [await redis_client.hgetall(block_index.block_key(level)) for level in range(3)] == counts
+
+
+async def test_repeated_presence_does_not_inflate_counts(redis_client: FakeRedis, block_index: BlockCountIndex):
+    """
+    Тест-кейс: Водитель дважды присылает одну и ту же клетку, затем уходит offline.
+
+    Ожидаемый результат: Счетчик блока равен 1, а после ухода хэши блоков пусты.
+    """
+    locator = CellHashLocator(redis_client, GRID_N, GRID_M, block_index=block_index)
+    service = DriverProfileService(redis=redis_client, locator=locator)
+    await service.update_presence(7, online(10, 10))
+    await service.update_presence(7, online(10, 10))
+    assert await redis_client.hgetall(block_index.block_key(0)) == {"2:2": "1"}
+
+    offline = DriverPresenceSchema(status=DriverStatus.OFFLINE, location=location(10, 10))
+    await service.update_presence(7, offline)
+    assert await redis_client.keys("cell_blocks:*") == []
+
+
+async def test_matching_skips_empty_blocks(redis_client: FakeRedis, block_index: BlockCountIndex):
+    """
+    Тест-кейс: Единственный свободный водитель в 150 клетках от заказа, ближайший к заказу занят.
+
+    Ожидаемый результат: Заблокирован свободный водитель, а поиск сделал лишь несколько round trip'ов
+    (вместо тысяч ячеек при обходе 150 колец).
+    """
+    locator = CellHashLocator(redis_client, GRID_N, GRID_M, block_index=block_index)
+    profiles = DriverProfileService(redis=redis_client, locator=locator)
+    await profiles.update_presence(1, online(100, 100))
+    await profiles.update_presence(2, online(180, 170))
+    await redis_client.set("driver_lock:1", "other")
+
+    matching_service = DriverMatchingService(
+        redis=redis_client, stream_keys=[DriverMatchingService.STREAM_KEY], locator=locator
+    )
+    matching_service.MAX_SEARCH_RADIUS = 200
+    counter = RedisCommandCounter(redis_client)
+    assert await matching_service._find_and_lock_nearest_driver(100, 90, "3") == 2
+    assert counter.round_trips < 20
+    assert matching_service.metrics.search_duration.count(mode="blocks") == 1
@@ -0,0 +1,79 @@
+"""Unit-тесты для обработки входящих WebSocket-кадров водителя."""
+
+import json
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from src.services.driver_frames import DriverFrameHandler
+from src.services.matching_service import DriverMatchingService
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+@pytest.fixture
+def frame_handler(redis_client: FakeRedis) -> DriverFrameHandler:
+    """Фикстура: обработчик кадров соединения водителя 7."""
+    return DriverFrameHandler(7, redis_client)
+
+
+async def test_presence_frame_updates_location(frame_handler: DriverFrameHandler, redis_client: FakeRedis):
+    """
+    Тест-кейс: Водитель присылает heartbeat по WebSocket дважды из одной клетки.
+
+    Ожидаемый результат: Водитель в ячейке; первый ответ — changed=True, второй — changed=False.
+    """
+    frame = json.dumps({"type": "presence", "status": "online", "location": {"x": 3, "y": 4}})
+
+    assert await frame_handler.handle(frame) == {"type": "presence_ack", "changed": True}
+    assert await frame_handler.handle(frame) == {"type": "presence_ack", "changed": False}
+    assert await redis_client.hgetall("cell:3:4") == {"7": "online"}
+
+
+async def test_invalid_frame_returns_error(frame_handler: DriverFrameHandler):
+    """
+    Тест-кейс: Кадр неизвестного типа и кадр с координатами вне сетки.
+
+    Ожидаемый результат: Ответы с типом "error", соединение продолжает работать.
+    """
+    unknown = await frame_handler.handle(json.dumps({"type": "teleport"}))
+    outside = await frame_handler.handle(
+        json.dumps({"type": "presence", "status": "online", "location": {"x": -1, "y": 0}})
+    )
+
+    assert unknown["type"] == "error" and outside["type"] == "error"
+
+
+async def test_decline_frame_releases_driver_and_requeues_ride(
+    frame_handler: DriverFrameHandler,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Водитель 7 отказывается от предложения по заказу 55, затем повторяет отказ.
+
+    Ожидаемый результат:
+    1. Блокировка и таймаут предложения сняты, заказ отправлен на повторный поиск без водителя 7.
+    2. Повторный отказ возвращает ошибку 409.
+    """
+    await redis_client.set("driver_lock:7", "55")
+    await redis_client.zadd(DriverMatchingService.TIMEOUT_ZSET_KEY, {"55:7": 1e12})
+
+    assert await frame_handler.handle(json.dumps({"type": "decline", "ride_id": 55})) == {
+        "type": "decline_ack", "ride_id": 55
+    }
+    assert await redis_client.get("driver_lock:7") is None
+    assert await redis_client.zcard(DriverMatchingService.TIMEOUT_ZSET_KEY) == 0
+    events = await redis_client.xrange(DriverMatchingService.RETRY_STREAM_KEY)
+    assert [fields for _, fields in events] == [{"ride_id": "55", "exclude_driver_id": "7"}]
+
+    repeated = await frame_handler.handle(json.dumps({"type": "decline", "ride_id": 55}))
+    assert repeated["type"] == "error" and repeated["status"] == 409
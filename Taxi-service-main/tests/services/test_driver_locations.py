@@ -0,0 +1,68 @@
+"""Unit-тесты для хранилища локаций водителей в хэшах `driver_locations:{bucket}`."""
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from tests.redis_helpers import RedisCommandCounter
+from src.schemas.driver import DriverPresenceSchema, DriverLocationSchema, DriverStatus
+from src.services.driver_locations import DriverLocationStore
+from src.services.driver_profile_service import DriverProfileService
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+def online(x: int, y: int) -> DriverPresenceSchema:
+    return DriverPresenceSchema(status=DriverStatus.ONLINE, location=DriverLocationSchema(x=x, y=y))
+
+
+async def test_get_many_reads_all_buckets_in_one_round_trip(redis_client: FakeRedis):
+    """
+    Тест-кейс: 50 водителей на линии распределены по хэшам; запрашиваются они и один водитель не на линии.
+
+    Ожидаемый результат:
+    1. Клетки всех водителей на линии возвращаются за один round trip.
+    2. Водителя не на линии в ответе нет; значения в хэшах — упакованные целые.
+    """
+    service = DriverProfileService(redis_client)
+    for driver_id in range(1, 51):
+        await service.update_presence(driver_id, online(driver_id, 99 - driver_id))
+
+    store = DriverLocationStore(redis_client)
+    counter = RedisCommandCounter(redis_client)
+    locations = await store.get_many(range(1, 52))
+
+    assert counter.round_trips == 1
+    assert locations == {driver_id: (driver_id, 99 - driver_id) for driver_id in range(1, 51)}
+    assert await redis_client.hget(store.bucket_key(7), "7") == str(store.pack(7, 92))
+
+
+async def test_migrate_legacy_keys_keeps_newer_locations(redis_client: FakeRedis):
+    """
+    Тест-кейс: Водители 1 и 2 записаны старыми ключами `driver_location:{id}`; водитель 2
+    переезжает до миграции.
+
+    Ожидаемый результат:
+    1. Переезд читает старый ключ: водитель 2 убран из старой ячейки, старый ключ удален.
+    2. Миграция переносит только водителя 1; старых ключей не остается.
+    """
+    for driver_id, (x, y) in {1: (3, 4), 2: (5, 6)}.items():
+        await redis_client.hset(f"cell:{x}:{y}", str(driver_id), "online")
+        await redis_client.set(f"driver_location:{driver_id}", f"{x}:{y}")
+
+    await DriverProfileService(redis_client).update_presence(2, online(7, 7))
+    assert await redis_client.exists("cell:5:6", "driver_location:2") == 0
+
+    store = DriverLocationStore(redis_client)
+    assert await store.migrate_legacy_keys(batch_size=1) == 1
+
+    assert await redis_client.keys("driver_location:*") == []
+    assert await store.get_many([1, 2]) == {1: (3, 4), 2: (7, 7)}
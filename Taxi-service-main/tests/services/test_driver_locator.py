@@ -0,0 +1,125 @@
+"""Unit-тесты для реализаций DriverLocator."""
+
+import random
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from src.schemas.driver import DriverPresenceSchema, DriverLocationSchema, DriverStatus
+from src.services.driver_locator import CellHashLocator, RedisGeoLocator, create_driver_locator
+from src.services.driver_profile_service import DriverProfileService
+from src.services.matching_service import DriverMatchingService
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+GRID_N = GRID_M = 100
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+def make_locator(redis_client: FakeRedis, backend: str):
+    if backend == "geo":
+        return RedisGeoLocator(redis_client, GRID_N, GRID_M)
+    return CellHashLocator(redis_client, GRID_N, GRID_M, use_bitmap=backend == "cells+bitmap")
+
+
+@pytest.mark.parametrize("backend", ["cells", "cells+bitmap", "geo"])
+async def test_nearest_matches_brute_force(redis_client: FakeRedis, backend: str):
+    """
+    Тест-кейс: 60 водителей размещены через DriverProfileService, часть из них затем
+    переехала; nearest запрашивается из случайных точек с исключенными водителями.
+
+    Ожидаемый результат: Ответ совпадает с полным перебором по (манхэттенское расстояние, ID).
+    """
+    locator = make_locator(redis_client, backend)
+    service = DriverProfileService(redis=redis_client, locator=locator)
+    rng = random.Random(12)
+    locations = {}
+    for step in range(90):
+        driver_id = rng.randint(1, 60) if step >= 60 else step + 1
+        x, y = rng.randint(0, GRID_N - 1), rng.randint(0, GRID_M - 1)
+        locations[driver_id] = (x, y)
+        presence = DriverPresenceSchema(status=DriverStatus.ONLINE, location=DriverLocationSchema(x=x, y=y))
+        await service.update_presence(driver_id, presence)
+
+    excluded = frozenset({3, 17})
+    for _ in range(30):
+        x, y = rng.randint(0, GRID_N - 1), rng.randint(0, GRID_M - 1)
+        expected = sorted(
+            (abs(dx - x) + abs(dy - y), driver_id)
+            for driver_id, (dx, dy) in locations.items()
+            if driver_id not in excluded and abs(dx - x) + abs(dy - y) <= 30
+        )[:5]
+        result = await locator.nearest(x, y, 5, 30, excluded)
+        assert result == [(driver_id, distance) for distance, driver_id in expected]
+
+
+@pytest.mark.parametrize("backend", ["cells", "cells+bitmap", "geo"])
+async def test_offline_driver_is_removed(redis_client: FakeRedis, backend: str):
+    """
+    Тест-кейс: Водитель выходит на линию, затем уходит offline.
+
+    Ожидаемый результат: nearest больше его не возвращает.
+    """
+    locator = make_locator(redis_client, backend)
+    service = DriverProfileService(redis=redis_client, locator=locator)
+    location = DriverLocationSchema(x=40, y=40)
+    await service.update_presence(5, DriverPresenceSchema(status=DriverStatus.ONLINE, location=location))
+    assert await locator.nearest(41, 40, 1, 10) == [(5, 1)]
+
+    await service.update_presence(5, DriverPresenceSchema(status=DriverStatus.OFFLINE, location=location))
+    assert await locator.nearest(41, 40, 1, 10) == []
+
+
+async def test_count_in_box_cells(redis_client: FakeRedis):
+    """
+    Тест-кейс: Водители внутри и на границе прямоугольника, а также вне его.
+
+    Ожидаемый результат: Учитываются только водители в клетках прямоугольника (границы включительно).
+    """
+    locator = CellHashLocator(redis_client, GRID_N, GRID_M, use_bitmap=True)
+    pipe = redis_client.pipeline()
+    for driver_id, (x, y) in {1: (10, 10), 2: (12, 15), 3: (15, 15), 4: (16, 15), 5: (9, 12)}.items():
+        await locator.upsert(pipe, driver_id, x, y, None)
+    await pipe.execute()
+
+    assert await locator.count_in_box(10, 10, 15, 15) == 3
+
+
+async def test_unknown_backend_is_rejected(redis_client: FakeRedis):
+    """
+    Тест-кейс: В настройке указан неизвестный индекс.
+
+    Ожидаемый результат: ValueError.
+    """
+    with pytest.raises(ValueError):
+        create_driver_locator(redis_client, "quadtree")
+
+
+async def test_matching_with_geo_locator_skips_locked_driver(redis_client: FakeRedis):
+    """
+    Тест-кейс: Сервис подбора работает с Redis GEO; ближайший водитель уже заблокирован.
+
+    Ожидаемый результат: Заблокирован следующий по расстоянию водитель, ячейки `cell:*` не используются.
+    """
+    locator = RedisGeoLocator(redis_client, GRID_N, GRID_M)
+    profiles = DriverProfileService(redis=redis_client, locator=locator)
+    for driver_id, (x, y) in {1: (20, 21), 2: (20, 24), 3: (50, 50)}.items():
+        presence = DriverPresenceSchema(status=DriverStatus.ONLINE, location=DriverLocationSchema(x=x, y=y))
+        await profiles.update_presence(driver_id, presence)
+    await redis_client.set("driver_lock:1", "other")
+
+    matching_service = DriverMatchingService(
+        redis=redis_client, stream_keys=[DriverMatchingService.STREAM_KEY], locator=locator
+    )
+    assert await matching_service._find_and_lock_nearest_driver(20, 20, "9") == 2
+    assert await redis_client.get("driver_lock:2") == "9"
+    assert await redis_client.keys("cell:*") == []
+    assert matching_service.metrics.search_duration.count(mode="locator_geo") == 1
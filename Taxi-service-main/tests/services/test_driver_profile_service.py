@@ -1,10 +1,17 @@
 """Unit-тесты для DriverProfileService."""
 
+import asyncio
+import time
+
 import pytest
 from fakeredis.aioredis import FakeRedis
 
-from src.schemas.driver import DriverPresenceSchema, DriverLocationSchema, DriverStatus
+from tests.redis_helpers import RedisCommandCounter
+
+from src.schemas.driver import DriverPresenceSchema, DriverLocationSchema, DriverStatus, PresenceUpdateResult
+from src.services.driver_locations import DriverLocationStore
 from src.services.driver_profile_service import DriverProfileService
+from src.services.occupancy_bitmap import read_occupancy_window, sync_occupancy_bitmap
 
 # Помечаем все тесты в этом модуле как асинхронные
 pytestmark = pytest.mark.asyncio
@@ -33,7 +40,7 @@ async def test_update_presence_new_driver_goes_online(
 
     Ожидаемый результат:
     1. Геоиндекс `cell:X:Y` содержит ID водителя.
-    2. Местоположение водителя сохранено в ключе `driver_location:{id}`.
+    2. Местоположение водителя сохранено в хэше `driver_locations:{bucket}`.
     """
     # Arrange: Готовим тестовые данные
     driver_id = 101
@@ -47,15 +54,14 @@ async def test_update_presence_new_driver_goes_online(
 
     # Assert: Проверяем состояние Redis
     cell_key = "cell:15:20"
-    location_key = f"driver_location:{driver_id}"
 
     # Проверяем, что водитель появился в нужной ячейке
     drivers_in_cell = await redis_client.hgetall(cell_key)
     assert drivers_in_cell == {str(driver_id): "online"}
 
     # Проверяем, что его текущая локация сохранена
-    saved_location = await redis_client.get(location_key)
-    assert saved_location == "15:20"
+    saved_location = await DriverLocationStore(redis_client).get(driver_id)
+    assert saved_location == (15, 20)
 
 
 async def test_update_presence_driver_moves_to_new_location(
@@ -68,7 +74,8 @@ async def test_update_presence_driver_moves_to_new_location(
     Ожидаемый результат:
     1. ID водителя удален из старой ячейки `cell:X_old:Y_old`.
     2. ID водителя добавлен в новую ячейку `cell:X_new:Y_new`.
-    3. Ключ `driver_location:{id}` обновлен.
+    3. Локация в хэше `driver_locations:{bucket}` обновлена, а старый ключ `driver_location:{id}`,
+       с которого водитель начинал (до миграции), удален.
     """
     # Arrange: Готовим начальное состояние
     driver_id = 102
@@ -98,8 +105,9 @@ async def test_update_presence_driver_moves_to_new_location(
     assert drivers_in_new_cell == {str(driver_id): "online"}
 
     # Проверяем, что локация обновлена
-    saved_location = await redis_client.get(location_key)
-    assert saved_location == "10:12"
+    saved_location = await DriverLocationStore(redis_client).get(driver_id)
+    assert saved_location == (10, 12)
+    assert await redis_client.get(location_key) is None
 
 
 async def test_update_presence_driver_goes_offline(
@@ -111,7 +119,7 @@ async def test_update_presence_driver_goes_offline(
 
     Ожидаемый результат:
     1. ID водителя удален из ячейки, где он был.
-    2. Ключ `driver_location:{id}` удален.
+    2. Старый ключ `driver_location:{id}` удален, в хэше локаций водителя нет.
     """
     # Arrange: Готовим начальное состояние
     driver_id = 103
@@ -136,4 +144,182 @@ async def test_update_presence_driver_goes_offline(
 
     # Проверяем, что ключ с локацией удален
     location_exists = await redis_client.exists(location_key)
-    assert not location_exists
\ No newline at end of file
+    assert not location_exists
+    assert await DriverLocationStore(redis_client).get(driver_id) is None
+
+async def test_update_presence_maintains_occupancy_bitmap(
+    driver_profile_service: DriverProfileService,
+    redis_client: FakeRedis
+):
+    """
+    Тест-кейс: Два водителя в одной ячейке; один уезжает, затем второй уходит с линии.
+
+    Ожидаемый результат:
+    1. Бит ячейки остается выставленным, пока в ней есть хотя бы один водитель.
+    2. Бит новой ячейки выставляется, бит опустевшей ячейки сбрасывается.
+    """
+    online = lambda x, y: DriverPresenceSchema(status=DriverStatus.ONLINE, location=DriverLocationSchema(x=x, y=y))
+    await driver_profile_service.update_presence(1, online(3, 40))
+    await driver_profile_service.update_presence(2, online(3, 40))
+
+    await driver_profile_service.update_presence(1, online(4, 41))
+    window = await read_occupancy_window(redis_client, 0, 9, 0, 99)
+    assert window.is_occupied(3, 40) and window.is_occupied(4, 41)
+
+    await driver_profile_service.update_presence(
+        2, DriverPresenceSchema(status=DriverStatus.OFFLINE, location=DriverLocationSchema(x=3, y=40))
+    )
+    window = await read_occupancy_window(redis_client, 0, 9, 0, 99)
+    occupied = {(x, y) for x in range(10) for y in range(100) if window.is_occupied(x, y)}
+    assert occupied == {(4, 41)}
+
+
+async def test_sync_occupancy_bitmap_marks_existing_cells(redis_client: FakeRedis):
+    """Тест-кейс: Геоиндекс заполнен до появления битовых карт — синхронизация выставляет биты."""
+    await redis_client.hset("cell:0:0", "1", "online")
+    await redis_client.hset("cell:7:63", "2", "online")
+
+    assert await sync_occupancy_bitmap(redis_client) == 2
+
+    window = await read_occupancy_window(redis_client, 0, 7, 0, 63)
+    occupied = {(x, y) for x in range(8) for y in range(64) if window.is_occupied(x, y)}
+    assert occupied == {(0, 0), (7, 63)}
+
+
+async def test_concurrent_moves_leave_driver_in_one_cell(
+    driver_profile_service: DriverProfileService,
+    redis_client: FakeRedis
+):
+    """
+    Тест-кейс: Два обновления одного водителя из разных клеток приходят одновременно.
+
+    Ожидаемый результат: Водитель находится ровно в одной ячейке — той, что записана в хэше локаций.
+    """
+    online = lambda x, y: DriverPresenceSchema(status=DriverStatus.ONLINE, location=DriverLocationSchema(x=x, y=y))
+    await driver_profile_service.update_presence(9, online(1, 1))
+
+    await asyncio.gather(
+        driver_profile_service.update_presence(9, online(2, 2)),
+        driver_profile_service.update_presence(9, online(3, 3)),
+    )
+
+    cells = [key for key in await redis_client.keys("cell:*") if await redis_client.hexists(key, "9")]
+    x, y = await DriverLocationStore(redis_client).get(9)
+    assert cells == [f"cell:{x}:{y}"]
+
+
+async def test_update_presence_same_cell_is_one_round_trip_without_writes(
+    driver_profile_service: DriverProfileService,
+    redis_client: FakeRedis
+):
+    """
+    Тест-кейс: Водитель присылает heartbeat из той же клетки.
+
+    Ожидаемый результат:
+    1. Обновление занимает один round trip (EVALSHA).
+    2. Индекс и стрим не менялись: метод возвращает False, новых событий в стриме присутствия нет.
+    """
+    presence = DriverPresenceSchema(status=DriverStatus.ONLINE, location=DriverLocationSchema(x=7, y=8))
+    assert await driver_profile_service.update_presence(4, presence) is True
+    events_before = await redis_client.xlen(DriverProfileService.PRESENCE_STREAM_KEY)
+
+    counter = RedisCommandCounter(redis_client)
+    assert await driver_profile_service.update_presence(4, presence) is False
+    assert counter.round_trips == 1
+    assert await redis_client.xlen(DriverProfileService.PRESENCE_STREAM_KEY) == events_before
+
+
+async def test_update_presence_batch_drops_out_of_order_updates(
+    driver_profile_service: DriverProfileService,
+    redis_client: FakeRedis
+):
+    """
+    Тест-кейс: Шлюз присылает пакет, где позиция водителя 1 пришла раньше более старой,
+    водитель 2 повторяет клетку, у водителя 3 координаты вне сетки; затем приходит
+    пакет со старым обновлением водителя 1.
+
+    Ожидаемый результат:
+    1. Результаты возвращаются по элементам: applied / stale / applied / unchanged / invalid.
+    2. Водитель 1 остается в клетке самого нового обновления.
+    """
+    results = await driver_profile_service.update_presence_batch([
+        (1, DriverStatus.ONLINE, 10, 10, 2000),
+        (1, DriverStatus.ONLINE, 5, 5, 1000),
+        (2, DriverStatus.ONLINE, 20, 20, 1000),
+        (2, DriverStatus.ONLINE, 20, 20, 1500),
+        (3, DriverStatus.ONLINE, 10_000, 0, 1000),
+    ])
+    assert results == [
+        PresenceUpdateResult.APPLIED,
+        PresenceUpdateResult.STALE,
+        PresenceUpdateResult.APPLIED,
+        PresenceUpdateResult.UNCHANGED,
+        PresenceUpdateResult.INVALID,
+    ]
+
+    assert await driver_profile_service.update_presence_batch([(1, DriverStatus.OFFLINE, 10, 10, 1999)]) == [
+        PresenceUpdateResult.STALE
+    ]
+    assert await DriverLocationStore(redis_client).get(1) == (10, 10)
+    assert await redis_client.hgetall("cell:10:10") == {"1": "online"}
+    assert await redis_client.keys("cell:5:5") == []
+
+
+async def test_update_presence_batch_rejects_drivers_of_another_fleet(
+    driver_profile_service: DriverProfileService,
+    redis_client: FakeRedis
+):
+    """
+    Тест-кейс: За шлюзом fleet-a закреплен водитель 1, за fleet-b — водитель 2;
+    fleet-a присылает пакет с обоими водителями.
+
+    Ожидаемый результат:
+    1. Обновление водителя 1 применяется, водителя 2 — отклоняется как FORBIDDEN.
+    2. Водитель 2 остается в своей клетке; после снятия водителя 1 со шлюза его обновления тоже отклоняются.
+    """
+    await driver_profile_service.add_fleet_drivers("fleet-a", [1])
+    await driver_profile_service.add_fleet_drivers("fleet-b", [2])
+    await driver_profile_service.update_presence_batch([(2, DriverStatus.ONLINE, 3, 3, 1000)], gateway_id="fleet-b")
+
+    results = await driver_profile_service.update_presence_batch([
+        (1, DriverStatus.ONLINE, 10, 10, 1000),
+        (2, DriverStatus.OFFLINE, 3, 3, 2000),
+    ], gateway_id="fleet-a")
+
+    assert results == [PresenceUpdateResult.APPLIED, PresenceUpdateResult.FORBIDDEN]
+    assert await DriverLocationStore(redis_client).get(2) == (3, 3)
+
+    await driver_profile_service.remove_fleet_drivers("fleet-a", [1])
+    assert await driver_profile_service.update_presence_batch(
+        [(1, DriverStatus.OFFLINE, 10, 10, 3000)], gateway_id="fleet-a"
+    ) == [PresenceUpdateResult.FORBIDDEN]
+    assert await DriverLocationStore(redis_client).get(1) == (10, 10)
+
+
+async def test_update_presence_batch_rejects_far_future_ts_and_offline_clears_ts(
+    driver_profile_service: DriverProfileService,
+    redis_client: FakeRedis
+):
+    """
+    Тест-кейс: Шлюз присылает обновление с ts на сутки вперед (сбой часов), затем обычные
+    обновления; после ухода водителя в 'offline' приходит обновление с меньшим ts.
+
+    Ожидаемый результат:
+    1. Обновление из будущего отклоняется как INVALID и не блокирует следующие обновления.
+    2. Уход с линии удаляет сохраненную метку, поэтому следующий выход на линию применяется.
+    """
+    now_ms = int(time.time() * 1000)
+
+    assert await driver_profile_service.update_presence_batch([
+        (1, DriverStatus.ONLINE, 10, 10, now_ms + 86_400_000),
+        (1, DriverStatus.ONLINE, 11, 11, now_ms),
+    ]) == [PresenceUpdateResult.INVALID, PresenceUpdateResult.APPLIED]
+    assert await DriverLocationStore(redis_client).get(1) == (11, 11)
+
+    assert await driver_profile_service.update_presence_batch([(1, DriverStatus.OFFLINE, 11, 11, now_ms + 1)]) == [
+        PresenceUpdateResult.APPLIED
+    ]
+    assert await redis_client.hexists(DriverProfileService.PRESENCE_TS_KEY, "1") == 0
+    assert await driver_profile_service.update_presence_batch([(1, DriverStatus.ONLINE, 12, 12, 1000)]) == [
+        PresenceUpdateResult.APPLIED
+    ]
@@ -0,0 +1,87 @@
+"""Unit-тесты для схемы событий в Redis Streams."""
+
+import json
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from src.services.event_schema import (
+    UnsupportedEventVersion,
+    decode_event,
+    decode_order_created,
+    encode_event,
+)
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+ORDER = {
+    "ride_id": "42",
+    "passenger_user_id": "5",
+    "start_x": 3,
+    "start_y": 4,
+    "end_x": 9,
+    "end_y": 9,
+    "price": 80.5,
+    "created_at": None,
+}
+EXPECTED_ORDER = {
+    "ride_id": "42", "start_x": 3, "start_y": 4, "end_x": 9, "end_y": 9, "price": 80.5, "passenger_user_id": "5",
+}
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+async def test_flat_fields_round_trip_through_stream(redis_client: FakeRedis):
+    """
+    Тест-кейс: OrderCreated записывается в стрим в версии 2 и читается обратно.
+
+    Ожидаемый результат:
+    1. Нагрузка лежит плоскими строковыми полями рядом с `v` и `event`; None не записывается.
+    2. decode_event и decode_order_created восстанавливают событие и поля заказа.
+    """
+    await redis_client.xadd("order_events", encode_event("OrderCreated", ORDER, version=2))
+    [(_, fields)] = await redis_client.xrange("order_events")
+
+    assert fields == {
+        "v": "2", "event": "OrderCreated", "ride_id": "42", "passenger_user_id": "5",
+        "start_x": "3", "start_y": "4", "end_x": "9", "end_y": "9", "price": "80.5",
+    }
+    event_name, payload = decode_event(fields)
+    assert event_name == "OrderCreated" and payload["start_x"] == "3"
+    assert decode_order_created(fields) == EXPECTED_ORDER
+
+
+async def test_legacy_json_entries_are_still_readable():
+    """
+    Тест-кейс: Записи версии 1 — JSON в поле `data`, в том числе с типом только внутри нагрузки.
+
+    Ожидаемый результат: Тип события и поля заказа те же, что и в версии 2.
+    """
+    legacy = encode_event("OrderCreated", ORDER, version=1)
+    oldest = {"data": json.dumps({**ORDER, "event": "OrderCreated"})}
+
+    assert legacy == {"event": "OrderCreated", "data": json.dumps(ORDER)}
+    assert decode_event(legacy) == ("OrderCreated", ORDER)
+    assert decode_event(oldest)[0] == "OrderCreated"
+    assert decode_order_created(legacy) == decode_order_created(oldest) == EXPECTED_ORDER
+
+
+async def test_invalid_events_are_rejected():
+    """
+    Тест-кейс: Служебное имя поля или вложенное значение в нагрузке; запись неизвестной версии.
+
+    Ожидаемый результат: ValueError/TypeError при записи, UnsupportedEventVersion при чтении.
+    """
+    with pytest.raises(ValueError):
+        encode_event("OrderCreated", {"v": "3"}, version=2)
+    with pytest.raises(TypeError):
+        encode_event("OrderCreated", {"route": [1, 2]}, version=2)
+    with pytest.raises(UnsupportedEventVersion):
+        decode_event({"v": "3", "event": "OrderCreated", "ride_id": "1"})
@@ -0,0 +1,98 @@
+"""Unit-тесты для локального индекса занятости GridOccupancyIndex."""
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from src.schemas.driver import DriverPresenceSchema, DriverLocationSchema, DriverStatus
+from src.services.driver_profile_service import DriverProfileService
+from src.services.grid_index import GridOccupancyIndex
+from src.services.matching_service import DriverMatchingService
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+@pytest.fixture
+def grid_index(redis_client: FakeRedis) -> GridOccupancyIndex:
+    """Фикстура для создания индекса на сетке 20x20."""
+    return GridOccupancyIndex(redis_client, grid_n=20, grid_m=20)
+
+
+async def _presence(service: DriverProfileService, driver_id: int, status: DriverStatus, x: int, y: int):
+    await service.update_presence(
+        driver_id, DriverPresenceSchema(status=status, location=DriverLocationSchema(x=x, y=y))
+    )
+
+
+async def test_rebuild_and_follow_presence_events(
+    grid_index: GridOccupancyIndex,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Индекс строится из `cell:*` и догоняет последующие изменения присутствия.
+
+    Ожидаемый результат:
+    1. После rebuild индекс содержит водителей, уже стоящих на карте.
+    2. Перемещение и уход водителя offline отражаются после poll_events.
+    3. Сверка с Redis проходит успешно.
+    """
+    profile_service = DriverProfileService(redis_client)
+    await _presence(profile_service, 1, DriverStatus.ONLINE, 3, 3)
+
+    await grid_index.rebuild()
+    assert grid_index.drivers_in_cell(3, 3) == {1}
+    assert grid_index.is_fresh
+
+    await _presence(profile_service, 1, DriverStatus.ONLINE, 4, 3)
+    await _presence(profile_service, 2, DriverStatus.ONLINE, 5, 5)
+    await _presence(profile_service, 2, DriverStatus.OFFLINE, 5, 5)
+    await grid_index.poll_events()
+
+    assert grid_index.drivers_in_cell(3, 3) == set()
+    assert grid_index.drivers_in_cell(4, 3) == {1}
+    assert grid_index.drivers_in_cell(5, 5) == set()
+    assert await grid_index.check_consistency() is True
+
+
+async def test_consistency_check_detects_divergence(
+    grid_index: GridOccupancyIndex,
+    redis_client: FakeRedis,
+):
+    """Тест-кейс: Ячейка изменена в обход стрима событий — сверка сообщает о расхождении."""
+    await redis_client.hset("cell:1:1", "7", "online")
+    await grid_index.rebuild()
+
+    await redis_client.hdel("cell:1:1", "7")
+
+    assert await grid_index.check_consistency(sample_size=400) is False
+
+
+async def test_matcher_uses_fresh_index_and_falls_back_when_stale(redis_client: FakeRedis):
+    """
+    Тест-кейс: Сервис подбора использует локальный индекс, пока тот актуален.
+
+    Ожидаемый результат:
+    1. С актуальным индексом блокируется водитель из зеркала.
+    2. Устаревший индекс игнорируется, поиск идет по Redis.
+    """
+    service = DriverMatchingService(redis=redis_client)
+    service.grid_index = GridOccupancyIndex(redis_client, grid_n=20, grid_m=20)
+    await redis_client.hset("cell:2:2", "5", "online")
+    await service.grid_index.rebuild()
+
+    # Водитель 5 есть только в зеркале, водитель 6 — только в Redis
+    await redis_client.delete("cell:2:2")
+    await redis_client.hset("cell:2:3", "6", "online")
+
+    assert await service._find_and_lock_nearest_driver(2, 2, "r1") == 5
+
+    service.grid_index.mark_stale()
+    assert await service._find_and_lock_nearest_driver(2, 2, "r2") == 6
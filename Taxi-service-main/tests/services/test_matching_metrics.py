@@ -0,0 +1,91 @@
+"""Unit-тесты для метрик сервиса подбора."""
+
+import asyncio
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from src.core.metrics import start_metrics_server
+from src.services.matching_service import DriverMatchingService
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+@pytest.fixture
+def matching_service(redis_client: FakeRedis) -> DriverMatchingService:
+    """Фикстура для создания экземпляра DriverMatchingService."""
+    return DriverMatchingService(redis=redis_client, stream_keys=[DriverMatchingService.STREAM_KEY])
+
+
+@pytest.mark.parametrize("search_mode", ["script", "python"])
+async def test_search_records_rings_cells_and_lock_attempts(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+    search_mode: str,
+):
+    """
+    Тест-кейс: Ближайший водитель на радиусе 2 уже заблокирован, второй свободен на том же кольце.
+
+    Ожидаемый результат: Поиск просмотрел 3 кольца (0..2), 1 + 8 + 16 ячеек и сделал 2 попытки блокировки.
+    """
+    matching_service.search_mode = search_mode
+    await redis_client.hset("cell:12:10", "1", "online")
+    await redis_client.hset("cell:8:10", "2", "online")
+    await redis_client.set("driver_lock:1", "other")
+
+    assert await matching_service._find_and_lock_nearest_driver(10, 10, "5") == 2
+
+    metrics = matching_service.metrics
+    assert metrics.search_duration.count(mode=search_mode) == 1
+    assert metrics.rings_scanned.sum() == 3
+    assert metrics.cells_queried.sum() == 25
+    assert metrics.lock_attempts.sum() == 2
+    assert metrics.search_results.value(result="found") == 1
+
+
+async def test_metrics_endpoint_reports_histograms_and_group_lag(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Заказ обработан, еще два ждут в стриме; Prometheus запрашивает /metrics.
+
+    Ожидаемый результат:
+    1. В ответе есть гистограммы ожидания XREADGROUP, публикации и времени до предложения.
+    2. Отставание группы по стриму заказов равно 2.
+    """
+    await redis_client.hset("cell:1:1", "7", "online")
+    await matching_service._ensure_consumer_group()
+    for ride_id in ("1", "2", "3"):
+        await redis_client.xadd(
+            DriverMatchingService.STREAM_KEY,
+            {"event": "OrderCreated", "data": f'{{"ride_id": "{ride_id}", "start_x": 1, "start_y": 1}}'},
+        )
+    for stream_key, message_id, raw_data in await matching_service._read_orders(1, 100):
+        await matching_service._process_order_message(stream_key, message_id, raw_data)
+
+    server = await start_metrics_server(
+        matching_service.metrics.registry, "127.0.0.1", 0, before_scrape=matching_service._collect_group_lag
+    )
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = (await reader.read()).decode()
+    writer.close()
+    server.close()
+
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert "matching_xreadgroup_wait_seconds_count 1" in response
+    assert "matching_publish_duration_seconds_count 1" in response
+    assert "matching_order_to_proposal_seconds_count 1" in response
+    assert 'matching_consumer_group_lag{stream="order_events"} 2' in response
+    assert 'matching_consumer_group_pending{stream="order_events"} 0' in response
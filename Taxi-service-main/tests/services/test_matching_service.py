@@ -0,0 +1,735 @@
+"""Unit-тесты для DriverMatchingService."""
+
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from src.core.config import settings
+from src.models.ride import RideStatusEnum
+from src.services.driver_locations import DriverLocationStore
+from src.services.driver_profile_service import DriverProfileService
+from src.services.event_schema import encode_event
+from src.services.grid_geometry import diamond_ring_cells
+from src.services.matching_service import DriverMatchingService
+from src.services.occupancy_bitmap import sync_occupancy_bitmap
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+class _RideStatusSession:
+    """Сессия БД, отдающая поездки со статусами из словаря (по умолчанию — pending)."""
+
+    def __init__(self, statuses: dict[int, str]):
+        self.statuses = statuses
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def get(self, model, ride_id: int):
+        return SimpleNamespace(id=ride_id, status=self.statuses.get(ride_id, RideStatusEnum.PENDING.value))
+
+
+@pytest.fixture
+def ride_statuses() -> dict[int, str]:
+    """Статусы поездок в БД, которые видит повторный поиск."""
+    return {}
+
+
+@pytest.fixture
+def matching_service(redis_client: FakeRedis, ride_statuses: dict[int, str]) -> DriverMatchingService:
+    """Фикстура для создания экземпляра DriverMatchingService."""
+    return DriverMatchingService(redis=redis_client, session_factory=lambda: _RideStatusSession(ride_statuses))
+
+
+async def _place_driver(redis_client: FakeRedis, driver_id: int, x: int, y: int) -> None:
+    """Размещает водителя в геоиндексе так же, как это делает DriverProfileService."""
+    await redis_client.hset(f"cell:{x}:{y}", str(driver_id), "online")
+    locations = DriverLocationStore(redis_client)
+    await redis_client.hset(locations.bucket_key(driver_id), str(driver_id), locations.pack(x, y))
+
+
+@pytest.mark.parametrize("search_mode", ["script", "python"])
+async def test_find_and_lock_picks_nearest_ring_and_lowest_id(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+    search_mode: str,
+):
+    """
+    Тест-кейс: Водители находятся в разных кольцах вокруг точки заказа.
+
+    Ожидаемый результат:
+    1. Выбирается водитель из ближайшего кольца с наименьшим ID.
+    2. На него ставится блокировка `driver_lock:{id}` с ID заказа.
+    """
+    matching_service.search_mode = search_mode
+    await _place_driver(redis_client, 7, 12, 10)   # кольцо 2
+    await _place_driver(redis_client, 5, 11, 11)   # кольцо 1
+    await _place_driver(redis_client, 3, 9, 10)    # кольцо 1
+
+    driver_id = await matching_service._find_and_lock_nearest_driver(10, 10, "42")
+
+    assert driver_id == 3
+    assert await redis_client.get("driver_lock:3") == "42"
+
+
+@pytest.mark.parametrize("search_mode", ["script", "python"])
+async def test_find_and_lock_skips_locked_driver(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+    search_mode: str,
+):
+    """
+    Тест-кейс: Ближайший водитель уже заблокирован другим заказом.
+
+    Ожидаемый результат: блокируется следующий по порядку водитель.
+    """
+    matching_service.search_mode = search_mode
+    await _place_driver(redis_client, 1, 0, 0)
+    await _place_driver(redis_client, 2, 1, 0)
+    await redis_client.set("driver_lock:1", "other")
+
+    driver_id = await matching_service._find_and_lock_nearest_driver(0, 0, "43")
+
+    assert driver_id == 2
+    assert await redis_client.get("driver_lock:1") == "other"
+
+
+@pytest.mark.parametrize("search_mode", ["script", "python"])
+async def test_find_and_lock_returns_none_without_drivers(
+    matching_service: DriverMatchingService,
+    search_mode: str,
+):
+    """Тест-кейс: В радиусе поиска нет водителей — возвращается None."""
+    matching_service.search_mode = search_mode
+    matching_service.MAX_SEARCH_RADIUS = 3
+
+    assert await matching_service._find_and_lock_nearest_driver(50, 50, "44") is None
+
+
+async def test_script_search_runs_without_fallback(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """Тест-кейс: Lua-скрипт выполняется сам, без перехода на Python-поиск."""
+    await _place_driver(redis_client, 9, 3, 4)
+
+    driver_id = await matching_service._find_and_lock_nearest_driver_script(0, 0, "45")
+
+    assert driver_id == 9
+    assert await redis_client.get("driver_lock:9") == "45"
+
+
+async def _publish_order(redis_client: FakeRedis, ride_id: str, x: int, y: int) -> str:
+    """Публикует событие OrderCreated в формате event_schema."""
+    payload = {"ride_id": ride_id, "start_x": x, "start_y": y, "end_x": 0, "end_y": 0, "price": 100.0}
+    return await redis_client.xadd(DriverMatchingService.STREAM_KEY, encode_event("OrderCreated", payload))
+
+
+async def test_recover_pending_entries_claims_stale_orders(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Другой потребитель прочитал заказ и упал, не сделав XACK.
+
+    Ожидаемый результат:
+    1. Запись заявляется через XAUTOCLAIM и обрабатывается заново.
+    2. Водитель заблокирован, запись подтверждена (pending пуст).
+    """
+    await _place_driver(redis_client, 11, 1, 1)
+    await matching_service._ensure_consumer_group()
+    await _publish_order(redis_client, "50", 1, 1)
+    await redis_client.xreadgroup(
+        groupname=DriverMatchingService.CONSUMER_GROUP,
+        consumername="crashed-consumer",
+        streams={DriverMatchingService.STREAM_KEY: ">"},
+        count=10,
+    )
+    matching_service.pending_idle_ms = 0
+
+    claimed = await matching_service._recover_pending_entries()
+    await asyncio.gather(*matching_service._in_flight)
+
+    assert claimed == 1
+    assert await redis_client.get("driver_lock:11") == "50"
+    pending = await redis_client.xpending(DriverMatchingService.STREAM_KEY, DriverMatchingService.CONSUMER_GROUP)
+    assert pending["pending"] == 0
+
+
+async def test_lifecycle_event_left_in_order_stream_is_acked_without_decoding(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: В стриме заказов осталась запись DriverAssigned (опубликована до маршрутизации по типам).
+
+    Ожидаемый результат: Запись подтверждена по полю `event`, нагрузка не разбирается.
+    """
+    await matching_service._ensure_consumer_group()
+    message_id = await redis_client.xadd(
+        DriverMatchingService.STREAM_KEY, {"event": "DriverAssigned", "data": "не JSON"}
+    )
+    await redis_client.xreadgroup(
+        groupname=DriverMatchingService.CONSUMER_GROUP,
+        consumername=matching_service.consumer_name,
+        streams={DriverMatchingService.STREAM_KEY: ">"},
+    )
+
+    order = await matching_service._parse_order_message(
+        DriverMatchingService.STREAM_KEY, message_id, {"event": "DriverAssigned", "data": "не JSON"}
+    )
+
+    assert order is None
+    pending = await redis_client.xpending(DriverMatchingService.STREAM_KEY, DriverMatchingService.CONSUMER_GROUP)
+    assert pending["pending"] == 0
+
+
+async def test_parse_order_reads_both_schema_versions_and_keeps_unknown_pending(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: В стриме заказ в версии 2, тот же заказ в версии 1 (JSON) и заказ от более нового издателя.
+
+    Ожидаемый результат:
+    1. Заказы версий 1 и 2 разбираются одинаково.
+    2. Запись неизвестной версии не разбирается и остается в pending для обновленного экземпляра.
+    """
+    payload = {"ride_id": "70", "start_x": 2, "start_y": 3, "end_x": 4, "end_y": 5, "price": 90.0}
+    await matching_service._ensure_consumer_group()
+    for fields in (
+        encode_event("OrderCreated", payload, version=2),
+        encode_event("OrderCreated", payload, version=1),
+        {"v": "3", "event": "OrderCreated", "ride_id": "71"},
+    ):
+        await redis_client.xadd(DriverMatchingService.STREAM_KEY, fields)
+    response = await redis_client.xreadgroup(
+        groupname=DriverMatchingService.CONSUMER_GROUP,
+        consumername=matching_service.consumer_name,
+        streams={DriverMatchingService.STREAM_KEY: ">"},
+    )
+
+    orders = [
+        await matching_service._parse_order_message(DriverMatchingService.STREAM_KEY, message_id, fields)
+        for message_id, fields in response[0][1]
+    ]
+
+    strip = lambda order: {k: v for k, v in order.items() if k not in ("message_id", "created_ms")}
+    assert strip(orders[0]) == strip(orders[1])
+    assert (orders[0]["start_x"], orders[0]["price"]) == (2, 90.0)
+    assert orders[2] is None
+    pending = await redis_client.xpending(DriverMatchingService.STREAM_KEY, DriverMatchingService.CONSUMER_GROUP)
+    assert pending["pending"] == 3
+
+
+async def test_recover_pending_entries_claims_stale_retries(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Другой потребитель прочитал событие повторного поиска и упал, не сделав XACK.
+
+    Ожидаемый результат: Событие заявляется, заказ предлагается следующему водителю, pending пуст.
+    """
+    await _place_driver(redis_client, 2, 7, 5)
+    await _store_ride_state(redis_client, "93", 5, 5)
+    await matching_service._ensure_consumer_group()
+    await matching_service._ensure_retry_consumer_group()
+    await redis_client.xadd(DriverMatchingService.RETRY_STREAM_KEY, {"ride_id": "93", "exclude_driver_id": "1"})
+    await redis_client.xreadgroup(
+        groupname=DriverMatchingService.CONSUMER_GROUP,
+        consumername="crashed-consumer",
+        streams={DriverMatchingService.RETRY_STREAM_KEY: ">"},
+    )
+    matching_service.pending_idle_ms = 0
+
+    claimed = await matching_service._recover_pending_entries()
+
+    assert claimed == 1
+    assert await redis_client.get("driver_lock:2") == "93"
+    pending = await redis_client.xpending(DriverMatchingService.RETRY_STREAM_KEY, DriverMatchingService.CONSUMER_GROUP)
+    assert pending["pending"] == 0
+
+
+async def test_dispatch_processes_orders_concurrently(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """Тест-кейс: Несколько заказов обрабатываются параллельно и получают разных водителей."""
+    for driver_id in (21, 22, 23):
+        await _place_driver(redis_client, driver_id, 5, 5)
+    await matching_service._ensure_consumer_group()
+    for ride_id in ("61", "62", "63"):
+        await _publish_order(redis_client, ride_id, 5, 5)
+    response = await redis_client.xreadgroup(
+        groupname=DriverMatchingService.CONSUMER_GROUP,
+        consumername=matching_service.consumer_name,
+        streams={DriverMatchingService.STREAM_KEY: ">"},
+        count=10,
+    )
+
+    for message_id, raw_data in response[0][1]:
+        await matching_service._dispatch_order(DriverMatchingService.STREAM_KEY, message_id, raw_data)
+    await asyncio.gather(*matching_service._in_flight)
+
+    locks = {await redis_client.get(f"driver_lock:{d}") for d in (21, 22, 23)}
+    assert locks == {"61", "62", "63"}
+
+
+async def test_process_order_batch_minimizes_total_pickup_distance(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Два заказа подряд, жадный подбор отдал бы первому заказу водителя,
+    который единственный рядом со вторым.
+
+    Ожидаемый результат:
+    1. Пакетный режим назначает водителей с минимальной суммарной дистанцией подачи.
+    2. Оба сообщения подтверждены, оба предложения поставлены в очередь таймаутов.
+    """
+    await _place_driver(redis_client, 1, 10, 10)   # рядом с обоими заказами
+    await _place_driver(redis_client, 2, 7, 10)    # в 2 клетках от первого заказа, в 4 — от второго
+    await matching_service._ensure_consumer_group()
+    await _publish_order(redis_client, "71", 9, 10)
+    await _publish_order(redis_client, "72", 11, 10)
+    messages = await matching_service._read_orders(10, 100)
+
+    stats = await matching_service._process_order_batch(messages)
+
+    assert await redis_client.get("driver_lock:2") == "71"
+    assert await redis_client.get("driver_lock:1") == "72"
+    assert stats["matched"] == 2
+    assert stats["avg_pickup_distance"] == 1.5
+    assert stats["greedy_avg_pickup_distance"] == 2.5
+    pending = await redis_client.xpending(DriverMatchingService.STREAM_KEY, DriverMatchingService.CONSUMER_GROUP)
+    assert pending["pending"] == 0
+    assert await redis_client.zcard(DriverMatchingService.TIMEOUT_ZSET_KEY) == 2
+
+
+async def test_process_order_batch_skips_stale_driver_with_freshness_filter(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Фильтр по свежести включен; ближайший к заказу водитель давно не присылал heartbeat.
+
+    Ожидаемый результат: Пакетный режим не блокирует «призрака», заказ получает
+    более дальний водитель с живым heartbeat.
+    """
+    matching_service.freshness_filter_enabled = True
+    await _place_driver(redis_client, 1, 10, 10)
+    await _place_driver(redis_client, 2, 13, 10)
+    await redis_client.zadd(DriverProfileService.LAST_SEEN_KEY, {
+        "1": time.time() - matching_service.stale_after - 5,
+        "2": time.time(),
+    })
+    await matching_service._ensure_consumer_group()
+    await _publish_order(redis_client, "73", 10, 10)
+    messages = await matching_service._read_orders(10, 100)
+
+    await matching_service._process_order_batch(messages)
+
+    assert await redis_client.get("driver_lock:1") is None
+    assert await redis_client.get("driver_lock:2") == "73"
+
+
+async def test_pop_due_timeouts_releases_lock_once(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Истекли два предложения; одно из них уже неактуально (водителя перехватил другой заказ).
+
+    Ожидаемый результат:
+    1. Блокировка снимается только для актуального предложения, событие повторного поиска одно.
+    2. Будущее предложение остается в очереди, возвращается его срок.
+    3. Повторный вызов (как из другого экземпляра) ничего не обрабатывает.
+    """
+    now = 1_000.0
+    await redis_client.set("driver_lock:1", "81")
+    await redis_client.set("driver_lock:2", "other")
+    await redis_client.zadd(
+        DriverMatchingService.TIMEOUT_ZSET_KEY,
+        {"81:1": now - 1, "82:2": now - 0.5, "83:3": now + 25.5},
+    )
+
+    popped, next_due, released = await matching_service._pop_due_timeouts(now)
+
+    assert (popped, next_due, released) == (2, now + 25.5, ["81:1"])
+    assert await redis_client.get("driver_lock:1") is None
+    assert await redis_client.get("driver_lock:2") == "other"
+    retries = await redis_client.xrange(DriverMatchingService.RETRY_STREAM_KEY)
+    assert [fields for _, fields in retries] == [{"ride_id": "81", "exclude_driver_id": "1"}]
+
+    assert await matching_service._pop_due_timeouts(now) == (0, now + 25.5, [])
+
+
+async def _store_ride_state(redis_client: FakeRedis, ride_id: str, x: int, y: int) -> None:
+    """Сохраняет параметры заказа так же, как это делает _queue_proposal."""
+    await redis_client.hset(
+        f"ride_order:{ride_id}",
+        mapping={
+            "ride_id": ride_id, "start_x": x, "start_y": y,
+            "end_x": 0, "end_y": 0, "price": 100, "passenger_user_id": "7",
+        },
+    )
+
+
+async def test_retry_ride_excludes_driver_who_timed_out(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Ближайший водитель не ответил на предложение, рядом есть второй.
+
+    Ожидаемый результат:
+    1. Повторный поиск пропускает не ответившего водителя и предлагает заказ второму.
+    2. Исключенный водитель запоминается для следующих попыток.
+    """
+    await _place_driver(redis_client, 1, 5, 5)
+    await _place_driver(redis_client, 2, 7, 5)
+    await _store_ride_state(redis_client, "91", 5, 5)
+
+    driver_id = await matching_service._retry_ride("91", exclude_driver_id=1)
+
+    assert driver_id == 2
+    assert await redis_client.get("driver_lock:1") is None
+    assert await redis_client.get("driver_lock:2") == "91"
+    assert await redis_client.smembers("ride_excluded:91") == {"1"}
+    assert await redis_client.zscore(DriverMatchingService.TIMEOUT_ZSET_KEY, "91:2") is not None
+
+
+async def test_retry_ride_skips_ride_accepted_before_state_was_cleared(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+    ride_statuses: dict[int, str],
+):
+    """
+    Тест-кейс: Водитель принял заказ, но состояние подбора в Redis еще не снято, и пришел повторный поиск.
+
+    Ожидаемый результат: Заказ не предлагается другому водителю, состояние заказа удалено.
+    """
+    await _place_driver(redis_client, 2, 7, 5)
+    await _store_ride_state(redis_client, "92", 5, 5)
+    ride_statuses[92] = RideStatusEnum.DRIVER_ASSIGNED.value
+
+    driver_id = await matching_service._retry_ride("92", exclude_driver_id=1)
+
+    assert driver_id is None
+    assert await redis_client.get("driver_lock:2") is None
+    assert await redis_client.exists("ride_order:92", "ride_excluded:92") == 0
+
+
+async def test_retry_ride_backs_off_and_gives_up(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Единственный водитель рядом уже отклонил заказ.
+
+    Ожидаемый результат:
+    1. Пока попытки не исчерпаны, заказ ставится в отложенную очередь с растущей задержкой.
+    2. После последней попытки состояние заказа удаляется, и пассажир получает уведомление.
+    """
+    matching_service.retry_max_attempts = 2
+    await _place_driver(redis_client, 1, 5, 5)
+    await _store_ride_state(redis_client, "92", 5, 5)
+    pubsub = redis_client.pubsub()
+    await pubsub.subscribe(DriverMatchingService.PASSENGER_NOTIFICATION_CHANNEL)
+    await pubsub.get_message(timeout=1)
+
+    assert await matching_service._retry_ride("92", exclude_driver_id=1) is None
+    first_due = await redis_client.zscore(DriverMatchingService.RETRY_SCHEDULE_KEY, "92")
+    assert await matching_service._retry_ride("92") is None
+    second_due = await redis_client.zscore(DriverMatchingService.RETRY_SCHEDULE_KEY, "92")
+    assert second_due - first_due >= 0.9  # задержка растет: 1 с, затем 2 с
+
+    await redis_client.zrem(DriverMatchingService.RETRY_SCHEDULE_KEY, "92")
+    assert await matching_service._retry_ride("92") is None
+
+    assert not await redis_client.exists("ride_order:92", "ride_excluded:92")
+    assert await redis_client.zcard(DriverMatchingService.RETRY_SCHEDULE_KEY) == 0
+    message = await pubsub.get_message(timeout=1)
+    assert json.loads(message["data"]) == {
+        "type": "NO_DRIVERS_AVAILABLE", "recipient_user_id": "7", "data": {"ride_id": "92"},
+    }
+    await pubsub.aclose()
+
+
+async def test_retry_ride_skips_accepted_ride(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Событие повторного поиска пришло для заказа, который уже принят (состояние удалено).
+
+    Ожидаемый результат: Водитель не блокируется, в очереди ничего не появляется.
+    """
+    await _place_driver(redis_client, 2, 5, 5)
+
+    assert await matching_service._retry_ride("93", exclude_driver_id=1) is None
+    assert await redis_client.get("driver_lock:2") is None
+    assert not await redis_client.exists("ride_order:93", "ride_excluded:93")
+    assert await redis_client.zcard(DriverMatchingService.RETRY_SCHEDULE_KEY) == 0
+
+
+class _UnavailableSession:
+    """Сессия БД, которая не может подключиться."""
+
+    async def __aenter__(self):
+        raise ConnectionRefusedError("postgres недоступен")
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+async def test_retried_proposal_has_same_field_types_as_first_proposal(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Повторный поиск находит водителя по параметрам из хэша `ride_order:{id}` (строки).
+
+    Ожидаемый результат: Координаты в предложении — числа, цена — float, как в первом предложении.
+    """
+    await _place_driver(redis_client, 2, 7, 5)
+    await _store_ride_state(redis_client, "94", 5, 5)
+    pubsub = redis_client.pubsub()
+    await pubsub.subscribe(DriverMatchingService.NOTIFICATION_CHANNEL)
+    await pubsub.get_message(timeout=1)
+
+    assert await matching_service._retry_ride("94", exclude_driver_id=1) == 2
+
+    message = await pubsub.get_message(timeout=1)
+    assert json.loads(message["data"])["data"] == {
+        "ride_id": "94", "start_x": 5, "start_y": 5, "end_x": 0, "end_y": 0, "price": 100.0,
+    }
+    await pubsub.aclose()
+
+
+async def test_retry_ride_drops_order_with_non_numeric_id(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Повторный поиск для заказа нагрузочного теста с ID `load_test_ride_1`.
+
+    Ожидаемый результат: Ошибки нет; заказа нет в БД, поэтому он не предлагается и его состояние удаляется.
+    """
+    await _place_driver(redis_client, 2, 5, 5)
+    await _store_ride_state(redis_client, "load_test_ride_1", 5, 5)
+
+    assert await matching_service._retry_ride("load_test_ride_1") is None
+    assert await redis_client.get("driver_lock:2") is None
+    assert not await redis_client.exists("ride_order:load_test_ride_1")
+
+
+async def test_retry_ride_keeps_order_when_database_is_unavailable(redis_client: FakeRedis):
+    """
+    Тест-кейс: Во время повторного поиска БД недоступна.
+
+    Ожидаемый результат: Заказ не предлагается, но остается в отложенной очереди
+    с прежним числом попыток и сохраненным состоянием.
+    """
+    matching_service = DriverMatchingService(redis=redis_client, session_factory=_UnavailableSession)
+    await _place_driver(redis_client, 2, 5, 5)
+    await _store_ride_state(redis_client, "95", 5, 5)
+
+    assert await matching_service._retry_ride("95") is None
+
+    assert await redis_client.get("driver_lock:2") is None
+    assert await redis_client.zscore(DriverMatchingService.RETRY_SCHEDULE_KEY, "95") is not None
+    assert await redis_client.hget("ride_order:95", "attempts") == "0"
+
+
+async def test_failed_scheduled_retry_is_rescheduled(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Из отложенной очереди забраны два заказа; поиск первого падает с ошибкой.
+
+    Ожидаемый результат: Ошибка не прерывает обработку второго заказа,
+    упавший заказ возвращается в отложенную очередь.
+    """
+    await redis_client.zadd(DriverMatchingService.RETRY_SCHEDULE_KEY, {"96": 1.0, "97": 2.0})
+    retried = []
+
+    async def retry_ride(ride_id, exclude_driver_id=None):
+        retried.append(ride_id)
+        if ride_id == "96":
+            raise ConnectionError("redis недоступен")
+        return None
+
+    matching_service._retry_ride = retry_ride
+    _, ride_ids = await matching_service._retry_due_rides()
+
+    assert sorted(ride_ids) == sorted(retried) == ["96", "97"]
+    assert await redis_client.zrange(DriverMatchingService.RETRY_SCHEDULE_KEY, 0, -1) == ["96"]
+    assert await redis_client.zscore(DriverMatchingService.RETRY_SCHEDULE_KEY, "96") > 2.0
+
+
+async def test_unmatched_order_is_deferred_without_stalling(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Для первого заказа водителей нет, для второго есть.
+
+    Ожидаемый результат:
+    1. Первый заказ подтверждается (XACK) и переносится в отложенную очередь с параметрами заказа.
+    2. Второй заказ обрабатывается сразу, слушатель не ждет.
+    3. Когда водитель появляется, воркер отложенной очереди предлагает ему первый заказ.
+    """
+    await _place_driver(redis_client, 31, 60, 60)
+    await matching_service._ensure_consumer_group()
+    await _publish_order(redis_client, "71", 0, 0)
+    await _publish_order(redis_client, "72", 60, 60)
+    messages = await matching_service._read_orders(10, 100)
+
+    started = asyncio.get_running_loop().time()
+    for stream_key, message_id, raw_data in messages:
+        await matching_service._process_order_message(stream_key, message_id, raw_data)
+    assert asyncio.get_running_loop().time() - started < 0.5
+
+    pending = await redis_client.xpending(DriverMatchingService.STREAM_KEY, DriverMatchingService.CONSUMER_GROUP)
+    assert pending["pending"] == 0
+    assert await redis_client.get("driver_lock:31") == "72"
+    assert await redis_client.zscore(DriverMatchingService.RETRY_SCHEDULE_KEY, "71") is not None
+    assert await redis_client.hget("ride_order:71", "start_x") == "0"
+
+    await _place_driver(redis_client, 32, 1, 0)
+    next_due, due = await matching_service._pop_due_members(
+        DriverMatchingService.RETRY_SCHEDULE_KEY, float("inf"), 10
+    )
+    assert (next_due, due) == (None, ["71"])
+    assert await matching_service._retry_ride("71") == 32
+
+
+async def test_diamond_ring_cells_are_exactly_at_distance_and_clipped():
+    """Тест-кейс: L1-ромб у края сетки содержит ровно ячейки сетки на заданном расстоянии."""
+    grid_n, grid_m = 6, 4
+    for start in [(0, 0), (5, 3), (2, 1)]:
+        for radius in range(0, 10):
+            expected = {
+                (x, y) for x in range(grid_n) for y in range(grid_m)
+                if abs(x - start[0]) + abs(y - start[1]) == radius
+            }
+            cells = list(diamond_ring_cells(*start, radius, grid_n, grid_m))
+            assert len(cells) == len(set(cells))
+            assert set(cells) == expected
+
+
+async def test_diamond_search_prefers_true_manhattan_distance(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Водитель 1 на квадратном кольце 2 (расстояние 4), водитель 2 на кольце 3 (расстояние 3).
+
+    Ожидаемый результат: Квадратный поиск выбирает водителя 1, поиск по ромбам — водителя 2.
+    """
+    await _place_driver(redis_client, 1, 12, 12)
+    await _place_driver(redis_client, 2, 13, 10)
+
+    matching_service.search_mode = "script"
+    assert await matching_service._find_and_lock_nearest_driver(10, 10, "101") == 1
+    await redis_client.delete("driver_lock:1")
+
+    matching_service.search_mode = "diamond"
+    assert await matching_service._find_and_lock_nearest_driver(10, 10, "102") == 2
+
+
+@pytest.mark.parametrize("use_bitmap", [False, True])
+@pytest.mark.parametrize("use_script", [True, False])
+async def test_diamond_search_matches_brute_force(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+    monkeypatch: pytest.MonkeyPatch,
+    use_script: bool,
+    use_bitmap: bool,
+):
+    """
+    Тест-кейс: Случайные сетки с водителями, часть из которых заблокирована или исключена.
+
+    Ожидаемый результат: Поиск по ромбам (Lua и Python) выбирает того же водителя, что и полный
+    перебор по (манхэттенское расстояние, ID) в пределах радиуса.
+    """
+    rng = random.Random(7)
+    matching_service.search_mode = "diamond"
+    matching_service.occupancy_bitmap_enabled = use_bitmap
+    search = (
+        matching_service._find_and_lock_nearest_driver_script
+        if use_script else matching_service._find_and_lock_nearest_driver_diamond
+    )
+
+    for trial in range(40):
+        await redis_client.flushall()
+        grid_n, grid_m = rng.randint(1, 15), rng.randint(1, 15)
+        monkeypatch.setattr(settings, "CITY_GRID_N", grid_n)
+        monkeypatch.setattr(settings, "CITY_GRID_M", grid_m)
+        matching_service.MAX_SEARCH_RADIUS = rng.randint(0, 12)
+
+        drivers = {}
+        for driver_id in range(1, rng.randint(0, 12) + 1):
+            drivers[driver_id] = (rng.randrange(grid_n), rng.randrange(grid_m))
+            await _place_driver(redis_client, driver_id, *drivers[driver_id])
+        await sync_occupancy_bitmap(redis_client)
+        locked = {d for d in drivers if rng.random() < 0.3}
+        for driver_id in locked:
+            await redis_client.set(f"driver_lock:{driver_id}", "other")
+        excluded = frozenset(d for d in drivers if rng.random() < 0.2)
+
+        sx, sy = rng.randrange(grid_n), rng.randrange(grid_m)
+        reachable = [
+            (abs(x - sx) + abs(y - sy), driver_id)
+            for driver_id, (x, y) in drivers.items()
+            if driver_id not in locked and driver_id not in excluded
+            and abs(x - sx) + abs(y - sy) <= matching_service.MAX_SEARCH_RADIUS
+        ]
+        expected = min(reachable)[1] if reachable else None
+
+        assert await search(sx, sy, f"r{trial}", excluded) == expected, trial
+
+
+@pytest.mark.parametrize("search_mode", ["diamond", "diamond_python"])
+async def test_occupancy_bitmap_skips_empty_cells(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+    search_mode: str,
+):
+    """
+    Тест-кейс: Вокруг заказа занята одна ячейка на расстоянии 5, остальные пусты.
+
+    Ожидаемый результат: С битовыми картами HKEYS выполняется только для занятой ячейки.
+    """
+    await _place_driver(redis_client, 1, 13, 12)
+    await sync_occupancy_bitmap(redis_client)
+    matching_service.search_mode = "diamond"
+    matching_service.occupancy_bitmap_enabled = True
+    stats = {"rings": 0, "cells": 0, "lock_attempts": 0}
+    search = (
+        matching_service._find_and_lock_nearest_driver_script
+        if search_mode == "diamond" else matching_service._find_and_lock_nearest_driver_diamond
+    )
+
+    assert await search(10, 10, "103", frozenset(), stats) == 1
+    assert stats == {"rings": 6, "cells": 1, "lock_attempts": 1}
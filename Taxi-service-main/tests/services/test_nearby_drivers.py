@@ -0,0 +1,72 @@
+"""Unit-тесты для снимков водителей рядом с точкой (GET /drivers/nearby)."""
+
+import asyncio
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from tests.redis_helpers import RedisCommandCounter
+from src.schemas.driver import DriverPresenceSchema, DriverLocationSchema, DriverStatus
+from src.services.driver_profile_service import DriverProfileService
+from src.services.nearby_drivers import NearbyDriversCache
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+async def _go_online(redis_client: FakeRedis, driver_id: int, x: int, y: int) -> None:
+    presence = DriverPresenceSchema(status=DriverStatus.ONLINE, location=DriverLocationSchema(x=x, y=y))
+    await DriverProfileService(redis_client).update_presence(driver_id, presence)
+
+
+async def test_nearby_filters_by_manhattan_radius_across_tiles(redis_client: FakeRedis):
+    """
+    Тест-кейс: Водители по обе стороны границы тайлов, один — за пределами радиуса, один — не на линии.
+
+    Ожидаемый результат: Возвращаются позиции водителей на линии с расстоянием <= радиуса из всех тайлов.
+    """
+    await _go_online(redis_client, 1, 9, 10)   # Тайл (0, 1), расстояние 1
+    await _go_online(redis_client, 2, 12, 11)  # Тайл (1, 1), расстояние 3
+    await _go_online(redis_client, 3, 13, 12)  # Расстояние 5 — за радиусом
+    await _go_online(redis_client, 4, 10, 9)
+    await DriverProfileService(redis_client).update_presence(
+        4, DriverPresenceSchema(status=DriverStatus.BUSY, location=DriverLocationSchema(x=10, y=9))
+    )
+
+    cache = NearbyDriversCache(redis_client, tile_size=10, ttl_ms=1000)
+
+    assert await cache.nearby(10, 10, 4) == [(9, 10), (12, 11)]
+
+
+async def test_concurrent_requests_share_one_tile_read(redis_client: FakeRedis):
+    """
+    Тест-кейс: 100 пассажиров одновременно запрашивают один тайл, затем водитель переезжает.
+
+    Ожидаемый результат:
+    1. Индекс прочитан один раз (один round trip) на всех.
+    2. До истечения TTL отдается прежний снимок; после — новый.
+    """
+    await _go_online(redis_client, 1, 5, 5)
+    cache = NearbyDriversCache(redis_client, tile_size=10, ttl_ms=60_000)
+
+    counter = RedisCommandCounter(redis_client)
+    results = await asyncio.gather(*(cache.nearby(5, 5, 3) for _ in range(100)))
+
+    assert results == [[(5, 5)]] * 100
+    assert cache.index_reads == 1
+    assert counter.round_trips == 1
+
+    await _go_online(redis_client, 1, 6, 6)
+    assert await cache.nearby(5, 5, 3) == [(5, 5)]
+
+    cache.ttl_ms = 0
+    assert await cache.nearby(5, 5, 3) == [(6, 6)]
+    assert cache.index_reads == 2
@@ -0,0 +1,79 @@
+"""Unit-тесты для шардирования потока заказов по регионам."""
+
+import json
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from src.core.config import settings
+from src.services import order_regions
+from src.services.matching_service import DriverMatchingService
+
+
+@pytest.fixture
+def region_size(monkeypatch) -> int:
+    """Фикстура: сетка 100x100, регионы 30x30 (4x4 региона, крайние неполные)."""
+    monkeypatch.setattr(settings, "CITY_GRID_N", 100)
+    monkeypatch.setattr(settings, "CITY_GRID_M", 100)
+    monkeypatch.setattr(settings, "ORDER_REGION_SIZE", 30)
+    return 30
+
+
+def test_order_stream_key_by_pickup_region(region_size: int):
+    """Тест-кейс: Заказ попадает в стрим региона точки подачи."""
+    assert order_regions.region_grid_size() == (4, 4)
+    assert order_regions.order_stream_key(0, 0) == "order_events:0:0"
+    assert order_regions.order_stream_key(29, 30) == "order_events:0:1"
+    assert order_regions.order_stream_key(99, 99) == "order_events:3:3"
+
+
+def test_order_stream_key_without_sharding(monkeypatch):
+    """Тест-кейс: При ORDER_REGION_SIZE = 0 используется общий стрим order_events."""
+    monkeypatch.setattr(settings, "ORDER_REGION_SIZE", 0)
+    assert order_regions.order_stream_key(42, 7) == "order_events"
+
+
+def test_owned_regions_split_between_shards(region_size: int):
+    """
+    Тест-кейс: Регионы распределяются по шардам.
+
+    Ожидаемый результат: шарды не пересекаются и вместе покрывают всю сетку.
+    """
+    shards = [order_regions.owned_regions("", i, 3) for i in range(3)]
+    all_owned = [r for shard in shards for r in shard]
+    assert sorted(all_owned) == order_regions.all_regions()
+    assert len(set(all_owned)) == len(all_owned)
+
+    assert order_regions.owned_regions("1:2, 0:0") == [(0, 0), (1, 2)]
+    with pytest.raises(ValueError):
+        order_regions.owned_regions("9:9")
+
+
+@pytest.mark.asyncio
+async def test_matcher_reads_own_region_and_finds_driver_across_border(region_size: int):
+    """
+    Тест-кейс: Заказ у границы региона, ближайший водитель — в соседнем регионе.
+
+    Ожидаемый результат:
+    1. Экземпляр читает только стрим своего региона.
+    2. Водитель за границей региона находится и блокируется.
+    """
+    redis_client = FakeRedis(decode_responses=True)
+    service = DriverMatchingService(redis=redis_client, stream_keys=["order_events:0:0"])
+    await service._ensure_consumer_group()
+    await redis_client.hset("cell:30:5", "8", "online")   # регион (1, 0)
+
+    for x in (29, 31):
+        payload = {"ride_id": f"r{x}", "start_x": x, "start_y": 5, "end_x": 0, "end_y": 0}
+        await redis_client.xadd(
+            order_regions.order_stream_key(x, 5),
+            {"event": "OrderCreated", "data": json.dumps(payload)},
+        )
+
+    messages = await service._read_orders(10, 100)
+    assert [(stream, data["event"]) for stream, _, data in messages] == [("order_events:0:0", "OrderCreated")]
+
+    stream_key, message_id, raw_data = messages[0]
+    await service._process_order_message(stream_key, message_id, raw_data)
+    assert await redis_client.get("driver_lock:8") == "r29"
+    await redis_client.aclose()
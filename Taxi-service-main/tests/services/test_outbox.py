@@ -0,0 +1,309 @@
+"""Unit-тесты для transactional outbox событий поездок."""
+
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from redis.exceptions import ConnectionError
+from sqlalchemy.sql import Delete, Select, Update
+
+from tests.redis_helpers import RedisCommandCounter
+from src.services.order_regions import order_stream_key
+from src.services.event_schema import decode_event
+from src.services.outbox import OutboxRelay, enqueue_driver_assigned, enqueue_order_created
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+class _RecordingSession:
+    """Сессия, которая только запоминает добавленные объекты (enqueue_* не обращаются к БД)."""
+
+    def __init__(self):
+        self.added = []
+
+    def add(self, obj):
+        self.added.append(obj)
+
+
+class _OutboxTable:
+    """Таблица outbox_events в памяти с блокировками строк, как у FOR UPDATE SKIP LOCKED."""
+
+    def __init__(self):
+        self.rows = {}
+        self.locked = set()
+
+    def insert(self, events):
+        for outbox_event in events:
+            outbox_event.id = len(self.rows) + 1
+            self.rows[outbox_event.id] = outbox_event
+
+
+class _OutboxSession:
+    """
+    Сессия над _OutboxTable для запросов OutboxRelay: выборка блокирует строки до конца
+    транзакции, UPDATE sent_at применяется только при commit (иначе — откат).
+    """
+
+    def __init__(self, table: _OutboxTable):
+        self.table = table
+        self.locked = []
+        self.sent_ids = []
+        self.commits = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.table.locked.difference_update(self.locked)
+
+    async def execute(self, statement):
+        if isinstance(statement, Select):
+            rows = [
+                row for row_id, row in sorted(self.table.rows.items())
+                if row.sent_at is None and row_id not in self.table.locked
+            ][: statement._limit]
+            self.locked = [row.id for row in rows]
+            self.table.locked.update(self.locked)
+            return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: rows))
+        if isinstance(statement, Update):
+            self.sent_ids = list(statement.whereclause.right.value)
+            return None
+        if isinstance(statement, Delete):
+            cutoff = statement.whereclause.right.value
+            purged = [row.id for row in self.table.rows.values() if row.sent_at is not None and row.sent_at < cutoff]
+            for row_id in purged:
+                del self.table.rows[row_id]
+            return SimpleNamespace(rowcount=len(purged))
+        raise AssertionError(f"Неожиданный запрос: {statement}")
+
+    async def commit(self):
+        self.commits += 1
+        for row_id in self.sent_ids:
+            self.table.rows[row_id].sent_at = datetime.now(timezone.utc)
+
+
+def _enqueue_assigned(table: _OutboxTable, *ride_ids: int) -> _OutboxTable:
+    """Добавляет в таблицу неотправленные DriverAssigned для заказов `ride_ids`."""
+    db = _RecordingSession()
+    for ride_id in ride_ids:
+        enqueue_driver_assigned(db, {"ride_id": str(ride_id), "driver_user_id": "7", "status": "driver_assigned"})
+    table.insert(db.added)
+    return table
+
+
+ORDER = {"ride_id": "42", "start_x": 3, "start_y": 4, "end_x": 9, "end_y": 9, "price": 80.0}
+
+
+async def test_enqueue_adds_events_to_session_without_redis():
+    """
+    Тест-кейс: Сервис поездок ставит в outbox OrderCreated и DriverAssigned.
+
+    Ожидаемый результат: В сессию добавлены строки outbox с нужным стримом, типом и JSON-нагрузкой.
+    """
+    db = _RecordingSession()
+
+    enqueue_order_created(db, ORDER)
+    enqueue_driver_assigned(db, {"ride_id": "42", "driver_user_id": "7", "status": "driver_assigned"})
+
+    order_event, assigned_event = db.added
+    assert (order_event.stream, order_event.event) == (order_stream_key(3, 4), "OrderCreated")
+    assert json.loads(order_event.payload) == ORDER
+    assert (assigned_event.stream, assigned_event.event) == ("ride_lifecycle_events", "DriverAssigned")
+    assert order_event.sent_at is None
+
+
+async def test_publish_batch_is_one_pipelined_round_trip(redis_client: FakeRedis):
+    """
+    Тест-кейс: Релей публикует пачку из 50 событий.
+
+    Ожидаемый результат: Один round trip; записи стримов в формате event_schema и в порядке outbox.
+    """
+    db = _RecordingSession()
+    for ride_id in range(50):
+        enqueue_driver_assigned(db, {"ride_id": str(ride_id), "driver_user_id": "7", "status": "driver_assigned"})
+
+    relay = OutboxRelay(redis_client)
+    counter = RedisCommandCounter(redis_client)
+    entry_ids = await relay.publish_batch(db.added)
+
+    assert counter.round_trips == 1
+    assert relay.publisher.flushes == 1
+    assert len(entry_ids) == 50
+    entries = await redis_client.xrange("ride_lifecycle_events")
+    assert [decode_event(fields)[1]["ride_id"] for _, fields in entries] == [str(i) for i in range(50)]
+    assert {fields["event"] for _, fields in entries} == {"DriverAssigned"}
+
+
+async def test_driver_assigned_clears_matching_state(redis_client: FakeRedis):
+    """
+    Тест-кейс: Релей обрабатывает пачку с DriverAssigned и OrderCreated другого заказа.
+
+    Ожидаемый результат: Таймаут предложения и параметры принятого заказа удалены; состояние другого заказа на месте.
+    """
+    await redis_client.zadd("proposal_timeouts", {"42:7": 100.0, "43:8": 100.0})
+    await redis_client.hset("ride_order:42", mapping={"ride_id": "42"})
+    await redis_client.hset("ride_order:43", mapping={"ride_id": "43"})
+    db = _RecordingSession()
+    enqueue_driver_assigned(db, {"ride_id": "42", "driver_user_id": "7", "status": "driver_assigned"})
+    enqueue_order_created(db, {**ORDER, "ride_id": "43"})
+
+    await OutboxRelay(redis_client).clear_matching_state(db.added)
+
+    assert await redis_client.zrange("proposal_timeouts", 0, -1) == ["43:8"]
+    assert await redis_client.exists("ride_order:42") == 0
+    assert await redis_client.exists("ride_order:43") == 1
+
+
+async def test_relay_once_marks_events_sent_after_publishing(redis_client: FakeRedis):
+    """
+    Тест-кейс: В outbox три неотправленных события; релей делает один проход, затем второй.
+
+    Ожидаемый результат:
+    1. Все события в стриме, у строк проставлен sent_at, транзакция зафиксирована один раз.
+    2. Второй проход ничего не публикует повторно.
+    """
+    table = _enqueue_assigned(_OutboxTable(), *range(3))
+    session = _OutboxSession(table)
+    relay = OutboxRelay(redis_client, session_factory=lambda: session)
+
+    assert await relay.relay_once() == 3
+
+    assert await redis_client.xlen("ride_lifecycle_events") == 3
+    assert all(row.sent_at is not None for row in table.rows.values())
+    assert session.commits == 1
+    assert await relay.relay_once() == 0
+    assert await redis_client.xlen("ride_lifecycle_events") == 3
+
+
+async def test_relay_once_keeps_events_unsent_when_redis_fails():
+    """
+    Тест-кейс: Redis недоступен во время публикации пачки.
+
+    Ожидаемый результат: relay_once поднимает ошибку, строки остаются неотправленными
+    и не заблокированными; после восстановления Redis пачка публикуется.
+    """
+    server = FakeServer()
+    redis_client = FakeRedis(server=server, decode_responses=True)
+    table = _enqueue_assigned(_OutboxTable(), 1, 2)
+    relay = OutboxRelay(redis_client, session_factory=lambda: _OutboxSession(table))
+
+    server.connected = False
+    with pytest.raises(ConnectionError):
+        await relay.relay_once()
+    assert all(row.sent_at is None for row in table.rows.values())
+    assert table.locked == set()
+
+    server.connected = True
+    assert await relay.relay_once() == 2
+    assert await redis_client.xlen("ride_lifecycle_events") == 2
+
+
+async def test_relay_once_leaves_only_undelivered_events_unsent(redis_client: FakeRedis):
+    """
+    Тест-кейс: В пачке заказ, стрим региона которого занят ключом другого типа (XADD падает),
+    и DriverAssigned другого заказа.
+
+    Ожидаемый результат: DriverAssigned опубликован и отмечен отправленным,
+    заказ остается в outbox для следующего прохода.
+    """
+    db = _RecordingSession()
+    enqueue_order_created(db, ORDER)
+    table = _OutboxTable()
+    table.insert(db.added)
+    _enqueue_assigned(table, 43)
+    await redis_client.set(order_stream_key(3, 4), "не стрим")
+    relay = OutboxRelay(redis_client, session_factory=lambda: _OutboxSession(table))
+
+    assert await relay.relay_once() == 1
+
+    assert [row.sent_at is not None for _, row in sorted(table.rows.items())] == [False, True]
+    assert await redis_client.xlen("ride_lifecycle_events") == 1
+
+
+async def test_relay_once_keeps_later_events_of_undelivered_ride_unsent(redis_client: FakeRedis):
+    """
+    Тест-кейс: OrderCreated заказа не опубликован (XADD в стрим региона падает),
+    а DriverAssigned того же заказа и другого заказа опубликованы.
+
+    Ожидаемый результат:
+    1. DriverAssigned заказа остается неотправленным вместе с его OrderCreated.
+    2. DriverAssigned другого заказа отмечен отправленным.
+    3. Следующий проход публикует DriverAssigned заказа повторно — уже после его OrderCreated.
+    """
+    db = _RecordingSession()
+    enqueue_order_created(db, ORDER)
+    table = _OutboxTable()
+    table.insert(db.added)
+    _enqueue_assigned(table, 42, 43)
+    await redis_client.set(order_stream_key(3, 4), "не стрим")
+    relay = OutboxRelay(redis_client, session_factory=lambda: _OutboxSession(table))
+
+    assert await relay.relay_once() == 1
+    assert [row.sent_at is not None for _, row in sorted(table.rows.items())] == [False, False, True]
+
+    await redis_client.delete(order_stream_key(3, 4))
+    assert await relay.relay_once() == 2
+    assert all(row.sent_at is not None for row in table.rows.values())
+    entries = await redis_client.xrange("ride_lifecycle_events")
+    assert [decode_event(fields)[1]["ride_id"] for _, fields in entries] == ["42", "43", "42"]
+
+
+async def test_concurrent_relays_do_not_publish_same_event_twice(redis_client: FakeRedis):
+    """
+    Тест-кейс: Два релея работают одновременно; первый выбрал пачку и еще публикует ее.
+
+    Ожидаемый результат: Второй релей пропускает заблокированные строки (SKIP LOCKED)
+    и берет только новые; каждое событие опубликовано ровно один раз.
+    """
+    table = _enqueue_assigned(_OutboxTable(), 1, 2)
+    first = OutboxRelay(redis_client, session_factory=lambda: _OutboxSession(table))
+    second = OutboxRelay(redis_client, session_factory=lambda: _OutboxSession(table))
+    publish_started, release_publish = asyncio.Event(), asyncio.Event()
+    publish_batch = first.publish_batch
+
+    async def slow_publish(events):
+        publish_started.set()
+        await release_publish.wait()
+        return await publish_batch(events)
+
+    first.publish_batch = slow_publish
+    first_pass = asyncio.create_task(first.relay_once())
+    await publish_started.wait()
+
+    assert await second.relay_once() == 0
+    _enqueue_assigned(table, 3)
+    assert await second.relay_once() == 1
+    release_publish.set()
+    assert await first_pass == 2
+
+    entries = await redis_client.xrange("ride_lifecycle_events")
+    assert sorted(decode_event(fields)[1]["ride_id"] for _, fields in entries) == ["1", "2", "3"]
+
+
+async def test_purge_sent_removes_only_old_sent_events(redis_client: FakeRedis):
+    """
+    Тест-кейс: В outbox отправленное давно событие, отправленное недавно и неотправленное.
+
+    Ожидаемый результат: Удаляется только событие, отправленное раньше окна хранения.
+    """
+    table = _enqueue_assigned(_OutboxTable(), 1, 2, 3)
+    now = datetime.now(timezone.utc)
+    relay = OutboxRelay(redis_client, session_factory=lambda: _OutboxSession(table))
+    table.rows[1].sent_at = now - timedelta(seconds=relay.retention_seconds + 60)
+    table.rows[2].sent_at = now - timedelta(seconds=60)
+
+    assert await relay.purge_sent(now) == 1
+    assert sorted(table.rows) == [2, 3]
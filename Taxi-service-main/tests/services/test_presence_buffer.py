@@ -0,0 +1,159 @@
+"""Unit-тесты для буфера heartbeat'ов в процессе API."""
+
+import asyncio
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from tests.redis_helpers import RedisCommandCounter
+from src.schemas.driver import DriverPresenceSchema, DriverLocationSchema, DriverStatus
+from src.services.driver_locations import DriverLocationStore
+from src.services.presence_buffer import PresenceBuffer
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+@pytest.fixture
+def presence_buffer(redis_client: FakeRedis) -> PresenceBuffer:
+    """Фикстура: буфер, который сбрасывается только явно (или после 100 обновлений)."""
+    return PresenceBuffer(redis_client, flush_ms=60_000, max_updates=100)
+
+
+def presence(status: DriverStatus, x: int = 0, y: int = 0) -> DriverPresenceSchema:
+    return DriverPresenceSchema(status=status, location=DriverLocationSchema(x=x, y=y))
+
+
+async def test_heartbeats_are_coalesced_per_driver(presence_buffer: PresenceBuffer, redis_client: FakeRedis):
+    """
+    Тест-кейс: Водитель выходит на линию и присылает три heartbeat'а из разных клеток.
+
+    Ожидаемый результат:
+    1. Выход на линию записан сразу, heartbeat'ы отложены до сброса.
+    2. Сброс записывает только последнюю позицию одним round trip'ом.
+    3. Коэффициент объединения равен 3.
+    """
+    assert await presence_buffer.submit(1, presence(DriverStatus.ONLINE, 1, 1)) is True
+    for x in (2, 3, 4):
+        assert await presence_buffer.submit(1, presence(DriverStatus.ONLINE, x, 1)) is None
+    assert await redis_client.hgetall("cell:1:1") == {"1": "online"}
+
+    counter = RedisCommandCounter(redis_client)
+    assert await presence_buffer.flush() == 1
+
+    assert counter.round_trips == 1
+    assert await redis_client.exists("cell:1:1", "cell:2:1", "cell:3:1") == 0
+    assert await redis_client.hgetall("cell:4:1") == {"1": "online"}
+    assert presence_buffer.coalescing_ratio.value() == 3
+    assert presence_buffer.flush_duration.count() == 1
+
+
+async def test_status_change_bypasses_buffer(presence_buffer: PresenceBuffer, redis_client: FakeRedis):
+    """
+    Тест-кейс: Водитель на линии присылает heartbeat, а затем уходит в 'offline' до сброса буфера.
+
+    Ожидаемый результат: Уход записан сразу, отложенный heartbeat отброшен и не возвращает водителя на карту.
+    """
+    await presence_buffer.submit(1, presence(DriverStatus.ONLINE, 1, 1))
+    await presence_buffer.submit(1, presence(DriverStatus.ONLINE, 2, 2))
+
+    assert await presence_buffer.submit(1, presence(DriverStatus.OFFLINE)) is True
+    assert await presence_buffer.flush() == 0
+
+    assert await redis_client.exists("cell:1:1", "cell:2:2") == 0
+    assert await DriverLocationStore(redis_client).get(1) is None
+    assert presence_buffer.bypassed_updates.value() == 2
+
+
+async def test_max_updates_requests_early_flush(redis_client: FakeRedis):
+    """
+    Тест-кейс: Число отложенных heartbeat'ов достигает max_updates.
+
+    Ожидаемый результат: Буфер просит фоновый цикл сбросить его досрочно.
+    """
+    presence_buffer = PresenceBuffer(redis_client, flush_ms=60_000, max_updates=2)
+    for driver_id in (1, 2):
+        await presence_buffer.submit(driver_id, presence(DriverStatus.ONLINE, driver_id, 0))
+        await presence_buffer.submit(driver_id, presence(DriverStatus.ONLINE, driver_id, 1))
+
+    assert presence_buffer._flush_needed.is_set()
+    assert await presence_buffer.flush() == 2
+    assert not presence_buffer._flush_needed.is_set()
+
+
+async def test_failed_flush_does_not_restore_driver_gone_offline(
+    presence_buffer: PresenceBuffer, redis_client: FakeRedis
+):
+    """
+    Тест-кейс: Во время записи буфера водитель 1 уходит в 'offline', а запись падает.
+
+    Ожидаемый результат:
+    1. В буфер возвращается только heartbeat водителя 2, оставшегося на линии.
+    2. Следующий сброс не возвращает водителя 1 на карту.
+    """
+    for driver_id in (1, 2):
+        await presence_buffer.submit(driver_id, presence(DriverStatus.ONLINE, driver_id, 1))
+        await presence_buffer.submit(driver_id, presence(DriverStatus.ONLINE, driver_id, 2))
+
+    write_batch = presence_buffer.profile_service.update_presence_batch
+    offline = None
+
+    async def failing_write(*args, **kwargs):
+        nonlocal offline
+        offline = asyncio.create_task(presence_buffer.submit(1, presence(DriverStatus.OFFLINE)))
+        await asyncio.sleep(0)
+        raise ConnectionError("redis недоступен")
+
+    presence_buffer.profile_service.update_presence_batch = failing_write
+    with pytest.raises(ConnectionError):
+        await presence_buffer.flush()
+    await offline
+    assert presence_buffer._pending == {2: (2, 2)}
+
+    presence_buffer.profile_service.update_presence_batch = write_batch
+    assert await presence_buffer.flush() == 1
+    assert await DriverLocationStore(redis_client).get(1) is None
+    assert await redis_client.exists("cell:1:1", "cell:1:2") == 0
+    assert await redis_client.hgetall("cell:2:2") == {"2": "online"}
+
+
+async def test_offline_during_flush_is_written_after_it(presence_buffer: PresenceBuffer, redis_client: FakeRedis):
+    """
+    Тест-кейс: Водитель уходит в 'offline', пока успешный сброс с его heartbeat'ом ждет ответа Redis.
+
+    Ожидаемый результат:
+    1. Запись 'offline' ждет окончания сброса и не обгоняет его.
+    2. После обоих водителя нет на карте: heartbeat не вернул его обратно.
+    """
+    await presence_buffer.submit(1, presence(DriverStatus.ONLINE, 1, 1))
+    await presence_buffer.submit(1, presence(DriverStatus.ONLINE, 2, 2))
+
+    write_batch = presence_buffer.profile_service.update_presence_batch
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_write(*args, **kwargs):
+        started.set()
+        await release.wait()
+        return await write_batch(*args, **kwargs)
+
+    presence_buffer.profile_service.update_presence_batch = slow_write
+    flush = asyncio.create_task(presence_buffer.flush())
+    await started.wait()
+    offline = asyncio.create_task(presence_buffer.submit(1, presence(DriverStatus.OFFLINE)))
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert not offline.done()
+
+    release.set()
+    assert await flush == 1
+    await offline
+    assert await DriverLocationStore(redis_client).get(1) is None
+    assert await redis_client.exists("cell:1:1", "cell:2:2") == 0
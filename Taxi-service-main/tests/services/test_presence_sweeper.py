@@ -0,0 +1,99 @@
+"""Unit-тесты для вытеснения водителей без heartbeat."""
+
+import time
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from src.schemas.driver import DriverPresenceSchema, DriverLocationSchema, DriverStatus
+from src.services.driver_locations import DriverLocationStore
+from src.services.driver_profile_service import DriverProfileService
+from src.services.matching_service import DriverMatchingService
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+@pytest.fixture
+def matching_service(redis_client: FakeRedis) -> DriverMatchingService:
+    """Фикстура для создания экземпляра DriverMatchingService."""
+    return DriverMatchingService(redis=redis_client, stream_keys=[DriverMatchingService.STREAM_KEY])
+
+
+async def _go_online(redis_client: FakeRedis, driver_id: int, x: int, y: int, seconds_ago: float = 0) -> None:
+    """Водитель выходит на линию; последний heartbeat сдвигается на `seconds_ago` секунд в прошлое."""
+    presence = DriverPresenceSchema(status=DriverStatus.ONLINE, location=DriverLocationSchema(x=x, y=y))
+    await DriverProfileService(redis=redis_client).update_presence(driver_id, presence)
+    if seconds_ago:
+        await redis_client.zadd(DriverProfileService.LAST_SEEN_KEY, {str(driver_id): time.time() - seconds_ago})
+
+
+async def test_sweep_evicts_only_stale_drivers(matching_service: DriverMatchingService, redis_client: FakeRedis):
+    """
+    Тест-кейс: Водитель 1 молчит дольше порога, водитель 2 присылает heartbeat; вытеснение идет пачками по 1.
+
+    Ожидаемый результат:
+    1. Водитель 1 снят с карты: ячейка, локация в хэше, запись в `driver_last_seen`
+       и метка времени последнего обновления удалены, опубликовано событие.
+    2. Водитель 2 остается на месте.
+    3. Счетчик вытесненных водителей равен 1.
+    """
+    sweeper = matching_service.presence_sweeper
+    sweeper.batch_size = 1
+    await _go_online(redis_client, 1, 10, 10, seconds_ago=sweeper.stale_after + 5)
+    await _go_online(redis_client, 2, 10, 10)
+    await redis_client.hset(DriverProfileService.PRESENCE_TS_KEY, mapping={"1": 1000, "2": 1000})
+
+    assert await sweeper.sweep() == [1]
+
+    assert await redis_client.hgetall("cell:10:10") == {"2": "online"}
+    assert await DriverLocationStore(redis_client).get(1) is None
+    assert await redis_client.zscore(DriverProfileService.LAST_SEEN_KEY, "1") is None
+    assert await redis_client.hgetall(DriverProfileService.PRESENCE_TS_KEY) == {"2": "1000"}
+    last_event = (await redis_client.xrevrange(DriverProfileService.PRESENCE_STREAM_KEY, count=1))[0][1]
+    assert last_event == {"driver_id": "1", "cell": ""}
+    assert matching_service.metrics.evicted_drivers.value() == 1
+
+
+@pytest.mark.parametrize("search_mode", ["script", "python", "diamond"])
+async def test_freshness_filter_skips_stale_candidates(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+    search_mode: str,
+):
+    """
+    Тест-кейс: Ближайший водитель давно не присылал heartbeat, но еще не вытеснен.
+
+    Ожидаемый результат: С фильтром по свежести блокируется более дальний водитель с живым heartbeat.
+    """
+    matching_service.search_mode = search_mode
+    matching_service.freshness_filter_enabled = True
+    await _go_online(redis_client, 1, 10, 11, seconds_ago=matching_service.stale_after + 5)
+    await _go_online(redis_client, 2, 10, 14)
+
+    assert await matching_service._find_and_lock_nearest_driver(10, 10, "5") == 2
+    assert await redis_client.get("driver_lock:1") is None
+
+
+async def test_timeouts_of_stale_drivers_count_as_ghost_proposals(
+    matching_service: DriverMatchingService,
+    redis_client: FakeRedis,
+):
+    """
+    Тест-кейс: Истекли предложения пропавшему водителю 1 и живому водителю 2.
+
+    Ожидаемый результат: Призрачным считается только предложение водителю 1.
+    """
+    await _go_online(redis_client, 1, 1, 1, seconds_ago=matching_service.stale_after + 5)
+    await _go_online(redis_client, 2, 2, 2)
+
+    assert await matching_service._count_ghost_proposals(["r1:1", "r2:2"]) == 1
+    assert matching_service.metrics.ghost_proposals.value() == 1
@@ -0,0 +1,105 @@
+"""Unit-тесты для долгоживущего издателя событий StreamPublisher."""
+
+import asyncio
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from tests.redis_helpers import RedisCommandCounter
+from src.services.event_schema import decode_event
+from src.services.redis_publisher import PublisherOverloadedError, StreamPublisher
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+async def test_concurrent_publishes_share_pipelines(redis_client: FakeRedis):
+    """
+    Тест-кейс: 300 запросов одновременно публикуют событие при пачке до 100.
+
+    Ожидаемый результат:
+    1. Каждый получает ID своей записи стрима.
+    2. События отправлены тремя pipeline, а не 300 отдельными XADD.
+    """
+    publisher = StreamPublisher(redis_client, max_batch=100, linger_ms=1)
+    counter = RedisCommandCounter(redis_client)
+
+    entry_ids = await asyncio.gather(
+        *(publisher.publish("OrderCreated", {"ride_id": str(i), "start_x": 3, "start_y": 4}) for i in range(300))
+    )
+    await publisher.close()
+    assert publisher.flushes == counter.round_trips == 3
+
+    entries = await redis_client.xrange("order_events")
+    assert [entry_id for entry_id, _ in entries] == list(entry_ids)
+    assert [decode_event(fields)[1]["ride_id"] for _, fields in entries] == [str(i) for i in range(300)]
+    assert publisher.published == 300
+
+
+async def test_publish_nowait_reports_delivery_and_errors(redis_client: FakeRedis):
+    """
+    Тест-кейс: Два события без ожидания в одной пачке; второе — в ключ неверного типа.
+
+    Ожидаемый результат: Колбэк первого получает ID записи в стриме жизненного цикла, второго — ошибку;
+    ошибка не мешает первому.
+    """
+    await redis_client.set("not_a_stream", "1")
+    publisher = StreamPublisher(redis_client, linger_ms=1)
+    deliveries = []
+
+    publisher.publish_nowait("DriverAssigned", {"ride_id": "1"}, on_delivery=lambda *result: deliveries.append(result))
+    publisher.publish_nowait(
+        "DriverAssigned", {"ride_id": "2"}, stream="not_a_stream", on_delivery=lambda *result: deliveries.append(result)
+    )
+    await publisher.close()
+
+    (first_id, first_error), (second_id, second_error) = deliveries
+    assert first_error is None and first_id == (await redis_client.xrange("ride_lifecycle_events"))[0][0]
+    assert second_id is None and second_error is not None
+    assert publisher.published == 1
+
+
+async def test_full_queue_rejects_fire_and_forget(redis_client: FakeRedis):
+    """
+    Тест-кейс: Очередь на одно событие, Redis еще не успел забрать первое.
+
+    Ожидаемый результат: Второе publish_nowait отклоняется PublisherOverloadedError, первое доставляется.
+    """
+    publisher = StreamPublisher(redis_client, max_pending=1)
+
+    publisher.publish_nowait("RideCompleted", {"ride_id": "1"})
+    with pytest.raises(PublisherOverloadedError):
+        publisher.publish_nowait("RideCompleted", {"ride_id": "2"})
+    await publisher.close()
+
+    assert await redis_client.xlen("ride_lifecycle_events") == 1
+
+
+async def test_events_are_routed_by_type(redis_client: FakeRedis):
+    """
+    Тест-кейс: Публикация OrderCreated, DriverAssigned и RideCompleted без явного стрима; событие без маршрута.
+
+    Ожидаемый результат:
+    1. Заказ попадает в стрим заказов, события жизненного цикла — в отдельный стрим.
+    2. Событие без маршрута отклоняется до постановки в очередь.
+    """
+    publisher = StreamPublisher(redis_client)
+
+    await publisher.publish("OrderCreated", {"ride_id": "1", "start_x": 3, "start_y": 4})
+    await publisher.publish("DriverAssigned", {"ride_id": "1", "driver_user_id": "7"})
+    await publisher.publish("RideCompleted", {"ride_id": "1"})
+    with pytest.raises(ValueError):
+        publisher.publish_nowait("RideCancelled", {"ride_id": "1"})
+    await publisher.close()
+
+    assert [fields["event"] for _, fields in await redis_client.xrange("order_events")] == ["OrderCreated"]
+    lifecycle = await redis_client.xrange("ride_lifecycle_events")
+    assert [fields["event"] for _, fields in lifecycle] == ["DriverAssigned", "RideCompleted"]
@@ -0,0 +1,100 @@
+"""Unit-тесты для сервиса поездок: события пишутся в outbox в транзакции изменения поездки."""
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from src.models.outbox import OutboxEvent
+from src.models.ride import Ride, RideStatusEnum
+from src.schemas.ride import RideCreateSchema
+from src.services import outbox
+from src.services.rides_service import assign_driver, create_ride
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+
+class _TransactionSession:
+    """
+    Сессия, которая ведет журнал операций: что добавлено в транзакцию до commit.
+    flush выдает новой поездке id и created_at, как это сделала бы БД.
+    """
+
+    def __init__(self, rides=None):
+        self.rides = rides or {}
+        self.log = []
+
+    def add(self, obj):
+        self.log.append(("add", obj))
+
+    async def flush(self):
+        for _, obj in self.log:
+            if isinstance(obj, Ride) and obj.id is None:
+                obj.id, obj.created_at = 101, datetime.now(timezone.utc)
+        self.log.append(("flush", None))
+
+    async def refresh(self, obj):
+        pass
+
+    async def get(self, model, ride_id):
+        return self.rides.get(ride_id)
+
+    async def commit(self):
+        self.log.append(("commit", None))
+
+    def added_before_commit(self) -> list:
+        """Объекты, добавленные до первой фиксации; проверяет, что фиксация была одна."""
+        assert [op for op, _ in self.log].count("commit") == 1
+        commit_at = self.log.index(("commit", None))
+        return [obj for op, obj in self.log[:commit_at] if op == "add"]
+
+
+@pytest.fixture(autouse=True)
+def outbox_signal():
+    """Фикстура: сбрасывает сигнал релею до и после теста."""
+    outbox._outbox_signal.clear()
+    yield outbox._outbox_signal
+    outbox._outbox_signal.clear()
+
+
+async def test_create_ride_writes_order_created_in_same_transaction(outbox_signal):
+    """
+    Тест-кейс: Пассажир создает поездку.
+
+    Ожидаемый результат:
+    1. Поездка и строка outbox с OrderCreated добавлены в одну транзакцию, фиксация одна.
+    2. Нагрузка события содержит выданный БД id поездки; релей разбужен после фиксации.
+    """
+    db = _TransactionSession()
+
+    response = await create_ride(RideCreateSchema(start_x=1, start_y=2, end_x=5, end_y=6), 7, db)
+
+    ride, outbox_event = db.added_before_commit()
+    assert isinstance(ride, Ride) and isinstance(outbox_event, OutboxEvent)
+    assert outbox_event.event == "OrderCreated"
+    assert json.loads(outbox_event.payload)["ride_id"] == response.ride_id == "101"
+    assert outbox_signal.is_set()
+
+
+async def test_assign_driver_writes_driver_assigned_in_same_transaction(outbox_signal):
+    """
+    Тест-кейс: Водитель принимает ожидающий заказ.
+
+    Ожидаемый результат: Смена статуса поездки и строка outbox с DriverAssigned
+    фиксируются одной транзакцией; релей разбужен после фиксации.
+    """
+    ride = Ride(
+        id=5, passenger_user_id=7, start_x=1, start_y=2, end_x=5, end_y=6,
+        status=RideStatusEnum.PENDING.value, price=40.0, version=1,
+    )
+    db = _TransactionSession({5: ride})
+
+    await assign_driver("5", 9, db)
+
+    (outbox_event,) = db.added_before_commit()
+    assert (outbox_event.event, json.loads(outbox_event.payload)) == (
+        "DriverAssigned", {"ride_id": "5", "driver_user_id": "9", "status": "driver_assigned"}
+    )
+    assert (ride.status, ride.driver_user_id, ride.version) == (RideStatusEnum.DRIVER_ASSIGNED.value, 9, 2)
+    assert outbox_signal.is_set()
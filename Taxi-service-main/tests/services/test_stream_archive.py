@@ -0,0 +1,165 @@
+"""Unit-тесты для архивации и обрезки стримов событий."""
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from src.models.stream_archive import StreamArchiveSegment
+from src.services.stream_archive import (
+    ArchiveSegmentStore,
+    StreamArchiver,
+    decode_segment,
+    encode_segment,
+    parse_stream_id,
+    read_archived_range,
+)
+
+# Помечаем все тесты в этом модуле как асинхронные
+pytestmark = pytest.mark.asyncio
+
+NOW = 1_000_000.0  # Текущее время тестов (сек.)
+OLD_MS = 999_800_000  # Записи старше окна хранения в 100 сек.
+RECENT_MS = 999_950_000  # Записи внутри окна хранения
+
+
+@pytest.fixture
+async def redis_client() -> FakeRedis:
+    """Фикстура для предоставления чистого in-memory Redis клиента для каждого теста."""
+    client = FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+
+
+class _MemorySegmentStore(ArchiveSegmentStore):
+    """Таблица stream_archive_segments в памяти: список (стрим, первый ID, последний ID, данные)."""
+
+    def __init__(self):
+        self.segments = []
+
+    async def last_archived_id(self, stream_key):
+        return max((last for stream, _, last, _ in self.segments if stream == stream_key), default=None)
+
+    async def save_segment(self, stream_key, entries):
+        first, last = parse_stream_id(entries[0][0]), parse_stream_id(entries[-1][0])
+        self.segments.append((stream_key, first, last, encode_segment(entries)))
+
+    async def load_segments(self, stream_key, start, end):
+        return [
+            data for stream, first, last, data in sorted(self.segments, key=lambda segment: segment[1])
+            if stream == stream_key and last >= start and (end is None or first <= end)
+        ]
+
+
+class _RecordingSession:
+    """Сессия, которая запоминает добавленные объекты и число фиксаций."""
+
+    def __init__(self):
+        self.added = []
+        self.commits = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def store() -> _MemorySegmentStore:
+    """Фикстура: общий архив, в который пишут все экземпляры архиватора теста."""
+    return _MemorySegmentStore()
+
+
+def _archiver(redis_client: FakeRedis, store: ArchiveSegmentStore, segment_size: int = 100) -> StreamArchiver:
+    archiver = StreamArchiver(
+        redis_client, ["order_events"], store=store, retention_seconds=100, segment_size=segment_size
+    )
+    archiver.approximate_trim = False  # fakeredis не обрезает по MINID ~
+    return archiver
+
+
+async def _add(redis_client: FakeRedis, ms: int, count: int) -> list[str]:
+    return [await redis_client.xadd("order_events", {"ride_id": str(ms + i)}, id=f"{ms}-{i}") for i in range(count)]
+
+
+async def test_archives_and_trims_only_old_processed_entries(redis_client: FakeRedis, store: _MemorySegmentStore):
+    """
+    Тест-кейс: 10 старых записей (8 подтверждены, 2 в pending группы) и 5 записей в окне хранения.
+
+    Ожидаемый результат:
+    1. В архив выгружены и из стрима удалены только 8 старых подтвержденных записей.
+    2. Записи в pending и в окне хранения остаются в стриме.
+    3. Выгруженные записи читаются по диапазону ID.
+    """
+    old_ids = await _add(redis_client, OLD_MS, 10)
+    recent_ids = await _add(redis_client, RECENT_MS, 5)
+    await redis_client.xgroup_create("order_events", "matching_group", id="0")
+    await redis_client.xreadgroup("matching_group", "c1", {"order_events": ">"}, count=10)
+    await redis_client.xack("order_events", "matching_group", *old_ids[:8])
+
+    archived = await _archiver(redis_client, store).archive_stream("order_events", now=NOW)
+
+    assert archived == 8
+    assert [entry_id for entry_id, _ in await redis_client.xrange("order_events")] == old_ids[8:] + recent_ids
+    assert await store.last_archived_id("order_events") == parse_stream_id(old_ids[7])
+
+    entries = await read_archived_range("order_events", old_ids[2], old_ids[4], store=store)
+    assert entries == [(old_ids[i], {"ride_id": str(OLD_MS + i)}) for i in range(2, 5)]
+
+
+async def test_repeated_passes_on_different_nodes_continue_from_watermark(
+    redis_client: FakeRedis, store: _MemorySegmentStore
+):
+    """
+    Тест-кейс: Один экземпляр архивирует сегментами по 4 записи; затем появляются новые
+    старые записи, и следующий проход делает другой экземпляр с тем же архивом.
+
+    Ожидаемый результат: Каждая запись выгружена ровно один раз; весь архив читается по порядку.
+    """
+    first_ids = await _add(redis_client, OLD_MS, 10)
+
+    assert await _archiver(redis_client, store, segment_size=4).archive_stream("order_events", now=NOW) == 10
+    assert len(store.segments) == 3
+
+    second_ids = await _add(redis_client, OLD_MS + 1, 3)
+    assert await _archiver(redis_client, store, segment_size=4).archive_stream("order_events", now=NOW) == 3
+    assert await redis_client.xlen("order_events") == 0
+
+    entries = await read_archived_range("order_events", store=store)
+    assert [entry_id for entry_id, _ in entries] == first_ids + second_ids
+
+
+async def test_missing_stream_is_skipped(redis_client: FakeRedis, store: _MemorySegmentStore):
+    """
+    Тест-кейс: Стрим еще не создан.
+
+    Ожидаемый результат: Ничего не выгружено, сегментов нет.
+    """
+    assert await _archiver(redis_client, store).archive_all(now=NOW) == 0
+    assert await read_archived_range("order_events", store=store) == []
+
+
+async def test_segment_store_writes_one_row_per_segment():
+    """
+    Тест-кейс: Хранилище сохраняет сегмент из трех записей.
+
+    Ожидаемый результат: В транзакцию добавлена одна строка с границами ID и числом записей;
+    сжатые данные разворачиваются в исходные записи.
+    """
+    db = _RecordingSession()
+    entries = [(f"{OLD_MS}-{i}", {"ride_id": str(i)}) for i in range(3)]
+
+    await ArchiveSegmentStore(session_factory=lambda: db).save_segment("order_events", entries)
+
+    (segment,) = db.added
+    assert isinstance(segment, StreamArchiveSegment) and db.commits == 1
+    assert (segment.stream, segment.first_ms, segment.first_seq, segment.last_ms, segment.last_seq) == (
+        "order_events", OLD_MS, 0, OLD_MS, 2
+    )
+    assert segment.entry_count == 3
+    assert decode_segment(segment.entries) == entries